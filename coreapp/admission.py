@@ -0,0 +1,253 @@
+"""
+Admission control: per-client token bucket rate limiting, a global concurrency cap and a
+per-request statement timeout.
+
+A misbehaving client should get a fast 429 instead of queueing behind the gunicorn workers,
+and when every slot is taken new requests are shed with a 503 before they touch the database.
+
+The limiter state lives in a backend chosen by ``ADMISSION_BACKEND``. The database backend keeps
+the buckets in an unlogged table and the concurrency slots in advisory locks, so the limits hold
+across workers and hosts. The local backend keeps them in process memory, per worker. Views can
+pick another backend per request with ``get_admission_backend()``, the locate endpoint keeps its
+snapshot hits, which never reach the database, in process.
+"""
+import hashlib
+import math
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import OperationalError, connections, transaction
+from django.utils.module_loading import import_string
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.throttling import BaseThrottle
+
+PRIMARY = 'default'
+QUERY_CANCELED = '57014'
+LOCAL_BACKEND = 'coreapp.admission.LocalAdmissionBackend'
+
+CONSUME_SQL = """
+    INSERT INTO rate_limit_buckets AS bucket (key, tokens, updated_at)
+    VALUES (%(key)s, %(capacity)s - 1, clock_timestamp())
+    ON CONFLICT (key) DO UPDATE SET
+        tokens = least(%(capacity)s, bucket.tokens + extract(epoch FROM clock_timestamp() - bucket.updated_at) * %(rate)s) - 1,
+        updated_at = clock_timestamp()
+    WHERE least(%(capacity)s, bucket.tokens + extract(epoch FROM clock_timestamp() - bucket.updated_at) * %(rate)s) >= 1
+    RETURNING tokens
+"""
+
+# Stops at the first free slot
+ACQUIRE_SQL = """
+    SELECT slot
+    FROM generate_series(0, %s - 1) AS slot
+    WHERE pg_try_advisory_lock(%s, slot)
+    LIMIT 1
+"""
+
+
+class Overloaded(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'The service is overloaded, try again later.'
+    default_code = 'overloaded'
+
+    def __init__(self, detail=None, code=None, wait=1):
+        super().__init__(detail, code)
+        # Sets Retry-After, like Throttled
+        self.wait = wait
+
+
+class DatabaseAdmissionBackend:
+    """
+    Buckets in the ``rate_limit_buckets`` table, refilled and consumed in a single upsert.
+    Concurrency slots are session advisory locks, released by PostgreSQL if the worker dies.
+    Idle buckets are pruned by the job workers, outside of the requests.
+    """
+    prune_interval = 3600
+
+    def __init__(self, using=PRIMARY):
+        self.using = using
+        self.pruned_at = 0
+
+    def consume(self, key, rate, capacity):
+        """
+        Take a token from the bucket. Returns None when allowed, or the seconds to wait.
+        """
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(CONSUME_SQL, {'key': key, 'rate': rate, 'capacity': capacity})
+            if cursor.fetchone() is not None:
+                return None
+        # A denied bucket holds less than a token
+        return 1 / rate
+
+    def acquire(self, scope, limit):
+        """
+        Take one of ``limit`` slots of the scope. Returns the slot, or None when all are taken.
+        """
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(ACQUIRE_SQL, [limit, _scope_key(scope)])
+            row = cursor.fetchone()
+        return row[0] if row is not None else None
+
+    def release(self, scope, slot):
+        with connections[self.using].cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_unlock(%s, %s)', [_scope_key(scope), slot])
+
+    def prune(self):
+        # Buckets idle for longer than it takes to refill them are full, dropping them changes nothing
+        if time.monotonic() - self.pruned_at < self.prune_interval:
+            return
+        self.pruned_at = time.monotonic()
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(
+                "DELETE FROM rate_limit_buckets WHERE updated_at < now() - %s * interval '1 second'",
+                [self.prune_interval],
+            )
+
+
+class LocalAdmissionBackend:
+    """
+    Buckets and slots in process memory. Limits hold per worker only.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buckets = {}
+        self.slots = {}
+
+    def consume(self, key, rate, capacity):
+        now = time.monotonic()
+        with self.lock:
+            tokens, updated_at = self.buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated_at) * rate)
+            if tokens < 1:
+                self.buckets[key] = (tokens, now)
+                return (1 - tokens) / rate
+            self.buckets[key] = (tokens - 1, now)
+            return None
+
+    def acquire(self, scope, limit):
+        with self.lock:
+            taken = self.slots.setdefault(scope, set())
+            for slot in range(limit):
+                if slot not in taken:
+                    taken.add(slot)
+                    return slot
+        return None
+
+    def release(self, scope, slot):
+        with self.lock:
+            self.slots.get(scope, set()).discard(slot)
+
+
+def _scope_key(scope):
+    return zlib.crc32(scope.encode()) & 0x7fffffff
+
+
+_backends = {}
+
+
+def get_backend(path=None):
+    path = path or settings.ADMISSION_BACKEND
+    backend = _backends.get(path)
+    if backend is None:
+        backend = _backends.setdefault(path, import_string(path)())
+    return backend
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Allows each client ``rate`` requests per second with bursts of up to ``burst`` requests,
+    read from the ``<SCOPE>_RATE_LIMIT`` and ``<SCOPE>_RATE_LIMIT_BURST`` settings.
+    A rate of 0, or a missing setting, disables the throttle.
+    """
+    scope = None
+
+    def get_rate(self):
+        prefix = f'{self.scope}_RATE_LIMIT'.upper()
+        return getattr(settings, prefix, 0), getattr(settings, f'{prefix}_BURST', 1)
+
+    def get_client(self, request):
+        if request.user and request.user.is_authenticated:
+            client = f'user:{request.user.pk}'
+        else:
+            client = f'ip:{self.get_ident(request)}'
+        # Hashed so any identity fits the bucket key column
+        return hashlib.sha256(client.encode()).hexdigest()
+
+    def allow_request(self, request, view):
+        rate, burst = self.get_rate()
+        if not rate:
+            return True
+
+        backend = getattr(view, 'get_admission_backend', get_backend)()
+        self.wait_time = backend.consume(f'{self.scope}:{self.get_client(request)}', rate, max(burst, 1))
+        return self.wait_time is None
+
+    def wait(self):
+        return math.ceil(self.wait_time)
+
+
+class LocateRateThrottle(TokenBucketThrottle):
+    scope = 'locate'
+
+
+class ConcurrencyLimitMixin:
+    """
+    Caps the requests of the view in flight across every worker, shedding the rest with a 503.
+
+    ``concurrency_scope`` names the slots, ``get_concurrency_limit()`` returns their number, or 0
+    for no cap. The slot is taken in ``initial()``, after the throttles and within the exception
+    handling that turns ``Overloaded`` into a 503, and released when ``dispatch()`` returns or raises.
+    """
+    concurrency_scope = None
+
+    def get_concurrency_limit(self):
+        return 0
+
+    def get_admission_backend(self):
+        return get_backend()
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        limit = self.get_concurrency_limit()
+        if not limit:
+            return
+
+        backend = self.get_admission_backend()
+        slot = backend.acquire(self.concurrency_scope, limit)
+        if slot is None:
+            raise Overloaded()
+        self._concurrency_slot = (backend, slot)
+
+    def dispatch(self, request, *args, **kwargs):
+        self._concurrency_slot = None
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            # Also when the handler raised, which skips finalize_response()
+            if self._concurrency_slot is not None:
+                backend, slot = self._concurrency_slot
+                self._concurrency_slot = None
+                backend.release(self.concurrency_scope, slot)
+
+
+@contextmanager
+def statement_timeout(using, milliseconds):
+    """
+    Cancel the queries of the block that run longer than ``milliseconds``, 0 for no timeout.
+    """
+    if not milliseconds:
+        yield
+        return
+
+    with transaction.atomic(using=using):
+        with connections[using].cursor() as cursor:
+            cursor.execute("SELECT set_config('statement_timeout', %s, true)", [f'{int(milliseconds)}ms'])
+        yield
+
+
+def is_query_canceled(exc):
+    return isinstance(exc, OperationalError) and getattr(exc.__cause__, 'pgcode', None) == QUERY_CANCELED
@@ -0,0 +1,345 @@
+"""
+OpenAPI documentation of the API views, read by drf_yasg.
+
+It is kept out of ``coreapp.views`` so API-only workers never import drf_yasg. The schemas are
+attached by ``document_views()``, called when the live documentation is first requested and by
+``manage.py generate_api_docs``, which builds the static documentation at image build time.
+"""
+from drf_yasg import openapi
+from drf_yasg.utils import swagger_auto_schema
+
+from . import views
+from .bulk import CREATED, FAILED, UNCHANGED, UPDATED
+from .doc_payloads import provider_create_payload_example, service_area_create_payload_example, service_area_update_payload_example
+from .jobs import registered_kinds
+from .models import Job
+from .serializers import JobSerializer, ProviderSerializer, ServiceAreaSerializer
+
+_documented = False
+
+
+def document_views():
+    global _documented
+    if _documented:
+        return
+    _documented = True
+
+    swagger_auto_schema(
+        operation_summary="List all providers",
+        operation_description="Endpoint to list all providers, optionally searched by name and filtered by currency and language.",
+        manual_parameters=[
+            openapi.Parameter(
+                'page', openapi.IN_QUERY, description="Page number", type=openapi.TYPE_INTEGER, required=False, default=1
+            ),
+            openapi.Parameter(
+                'page_size', openapi.IN_QUERY, description="Number of items per page", type=openapi.TYPE_INTEGER, required=False, default=10
+            ),
+            openapi.Parameter(
+                'search', openapi.IN_QUERY, description="Providers whose name contains or resembles the text, most similar first", type=openapi.TYPE_STRING, required=False
+            ),
+            openapi.Parameter(
+                'currency', openapi.IN_QUERY, description="Only providers using the currency", type=openapi.TYPE_STRING, required=False
+            ),
+            openapi.Parameter(
+                'language', openapi.IN_QUERY, description="Only providers speaking the language", type=openapi.TYPE_STRING, required=False
+            ),
+            openapi.Parameter(
+                'ordering', openapi.IN_QUERY, description="Sort order, by name by default", type=openapi.TYPE_STRING, enum=['name', '-name', 'currency', 'language'], required=False
+            ),
+        ],
+        responses={
+            200: ProviderSerializer,
+            400: 'Bad Request',
+        },
+    )(views.ProviderViewSet.list)
+
+    swagger_auto_schema(
+        operation_summary="Create a new provider",
+        operation_description="Endpoint to create a new provider. The input should include the provider's name, email, phone number, language, and currency.",
+        request_body=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            properties={
+                'currency': openapi.Schema(
+                    type=openapi.TYPE_STRING,
+                    description='The currency used by the provider, e.g., USD, EUR.',
+                ),
+                'name': openapi.Schema(
+                    type=openapi.TYPE_STRING,
+                    description='The full name of the provider.',
+                ),
+                'email': openapi.Schema(
+                    type=openapi.TYPE_STRING,
+                    format=openapi.FORMAT_EMAIL,
+                    description='The email address of the provider.',
+                ),
+                'phone_number': openapi.Schema(
+                    type=openapi.TYPE_STRING,
+                    description='The provider\'s phone number.',
+                ),
+                'language': openapi.Schema(
+                    type=openapi.TYPE_STRING,
+                    description='The provider\'s preferred language, e.g., en for English.',
+                ),
+            },
+            required=['currency', 'name', 'email', 'phone_number', 'language'],
+            example=provider_create_payload_example
+        ),
+        responses={
+            201: ProviderSerializer,
+            400: 'Bad Request',
+        },
+    )(views.ProviderViewSet.create)
+
+    swagger_auto_schema(
+        operation_summary="Delete a provider",
+        operation_description="Endpoint to delete a provider and its service areas. Providers with many service areas are hidden right away, together with their service areas, and deleted by a background job.",
+        responses={
+            202: openapi.Schema(
+                type=openapi.TYPE_OBJECT,
+                properties={
+                    'job': openapi.Schema(type=openapi.TYPE_STRING, description='UUID of the job deleting the service areas, see /jobs/'),
+                }
+            ),
+            204: 'Deleted',
+            404: 'Not Found',
+        },
+    )(views.ProviderViewSet.destroy)
+
+    swagger_auto_schema(
+        method='post',
+        operation_summary="Create or update providers in bulk",
+        operation_description="Endpoint to sync a batch of providers by name: unknown names are created, known ones updated. Each row is validated like a single provider, and the batch is written in one statement. The response has a status per row, in the request order.",
+        request_body=openapi.Schema(
+            type=openapi.TYPE_ARRAY,
+            items=openapi.Schema(
+                type=openapi.TYPE_OBJECT,
+                properties={
+                    'name': openapi.Schema(type=openapi.TYPE_STRING, description='Name of the provider, identifies the provider to update'),
+                    'email': openapi.Schema(type=openapi.TYPE_STRING, format=openapi.FORMAT_EMAIL),
+                    'phone_number': openapi.Schema(type=openapi.TYPE_STRING),
+                    'language': openapi.Schema(type=openapi.TYPE_STRING),
+                    'currency': openapi.Schema(type=openapi.TYPE_STRING),
+                },
+                required=['currency', 'name', 'email', 'phone_number', 'language'],
+            ),
+            example=[provider_create_payload_example],
+        ),
+        responses={
+            200: openapi.Schema(
+                type=openapi.TYPE_OBJECT,
+                properties={
+                    'created': openapi.Schema(type=openapi.TYPE_INTEGER),
+                    'updated': openapi.Schema(type=openapi.TYPE_INTEGER),
+                    'unchanged': openapi.Schema(type=openapi.TYPE_INTEGER),
+                    'failed': openapi.Schema(type=openapi.TYPE_INTEGER),
+                    'results': openapi.Schema(
+                        type=openapi.TYPE_ARRAY,
+                        items=openapi.Schema(
+                            type=openapi.TYPE_OBJECT,
+                            properties={
+                                'index': openapi.Schema(type=openapi.TYPE_INTEGER, description='Position of the row in the request'),
+                                'status': openapi.Schema(type=openapi.TYPE_STRING, enum=[CREATED, UPDATED, UNCHANGED, FAILED]),
+                                'id': openapi.Schema(type=openapi.TYPE_STRING, description='UUID of the provider, unless the row failed'),
+                                'name': openapi.Schema(type=openapi.TYPE_STRING),
+                                'errors': openapi.Schema(type=openapi.TYPE_OBJECT, description='Validation errors of a failed row'),
+                            }
+                        )
+                    ),
+                }
+            ),
+            400: 'Bad Request: the body is not a list, or has too many rows',
+        },
+    )(views.ProviderViewSet.bulk)
+
+    swagger_auto_schema(
+        operation_summary="List all service areas",
+        operation_description="Endpoint to list all service areas.",
+        manual_parameters=[
+            openapi.Parameter(
+                'page', openapi.IN_QUERY, description="Page number", type=openapi.TYPE_INTEGER, required=False, default=1
+            ),
+            openapi.Parameter(
+                'page_size', openapi.IN_QUERY, description="Number of items per page", type=openapi.TYPE_INTEGER, required=False, default=10
+            ),
+            openapi.Parameter(
+                'bbox', openapi.IN_QUERY, description="Only service areas intersecting the bounding box min_lng,min_lat,max_lng,max_lat", type=openapi.TYPE_STRING, required=False
+            ),
+        ],
+        responses={
+            200: ServiceAreaSerializer,
+            400: 'Bad Request',
+        },
+    )(views.ServiceAreaViewSet.list)
+
+    swagger_auto_schema(
+        request_body=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            properties={
+                'provider': openapi.Schema(type=openapi.TYPE_STRING, description='UUID of the provider'),
+                'name': openapi.Schema(type=openapi.TYPE_STRING, description='Name of the service area'),
+                'price': openapi.Schema(type=openapi.TYPE_INTEGER, description='Price in integer (divide by 10 to show to client)'),
+                'area': openapi.Schema(
+                    type=openapi.TYPE_ARRAY,
+                    items=openapi.Items(
+                        type=openapi.TYPE_ARRAY,
+                        items=openapi.Items(type=openapi.TYPE_NUMBER)
+                    ),
+                    description='Coordinates of the polygon defining the service area, the longitude and latitude of each point respectively'
+                ),
+            },
+            example=service_area_create_payload_example
+        )
+    )(views.ServiceAreaViewSet.create)
+
+    swagger_auto_schema(
+        request_body=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            properties={
+                'provider': openapi.Schema(type=openapi.TYPE_STRING, description='UUID of the provider'),
+                'name': openapi.Schema(type=openapi.TYPE_STRING, description='Name of the service area'),
+                'price': openapi.Schema(type=openapi.TYPE_INTEGER, description='Price in integer (divide by 10 to show to client)'),
+                'area': openapi.Schema(
+                    type=openapi.TYPE_ARRAY,
+                    items=openapi.Items(
+                        type=openapi.TYPE_ARRAY,
+                        items=openapi.Items(type=openapi.TYPE_NUMBER)
+                    ),
+                    description='Coordinates of the polygon defining the service area, the longitude and latitude of each point respectively'
+                ),
+            },
+            example=service_area_update_payload_example
+        )
+    )(views.ServiceAreaViewSet.update)
+
+    swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter(
+                'lat', openapi.IN_QUERY, description="Latitude of the point", type=openapi.TYPE_NUMBER, required=True, default="-25.439479625088097"
+            ),
+            openapi.Parameter(
+                'lng', openapi.IN_QUERY, description="Longitude of the point", type=openapi.TYPE_NUMBER, required=True, default="-49.258157079808775"
+            ),
+        ],
+        responses={
+            200: openapi.Schema(
+                type=openapi.TYPE_ARRAY,
+                items=openapi.Schema(
+                    type=openapi.TYPE_OBJECT,
+                    properties={
+                        'name': openapi.Schema(type=openapi.TYPE_STRING, description='Name of the service area'),
+                        'provider_name': openapi.Schema(type=openapi.TYPE_STRING, description='Name of the provider'),
+                        'price': openapi.Schema(type=openapi.TYPE_INTEGER, description='Price of the service area')
+                    }
+                ),
+                description='List of service areas that contain the given point'
+            ),
+            400: 'Bad Request: Invalid lat/lng format or missing parameters',
+            429: 'Too Many Requests: the client exceeded its rate limit, see Retry-After',
+            503: 'Service Unavailable: the server is overloaded or the query timed out, see Retry-After'
+        },
+        operation_summary="List Service Areas by Lat/Lng",
+        operation_description="Returns a list of service areas that contain the provided latitude and longitude point. The response includes the name of the service area, the provider name, and the price."
+    )(views.LocateAreaViewSet.get)
+
+    swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter(
+                'bbox', openapi.IN_QUERY, description="Bounding box as min_lng,min_lat,max_lng,max_lat", type=openapi.TYPE_STRING, required=True, default="-49.4,-25.6,-49.1,-25.3"
+            ),
+            openapi.Parameter(
+                'cell_size', openapi.IN_QUERY, description="Size of each grid cell in degrees", type=openapi.TYPE_NUMBER, required=True, default="0.05"
+            ),
+            openapi.Parameter(
+                'shape', openapi.IN_QUERY, description="Grid cell shape", type=openapi.TYPE_STRING, enum=['square', 'hex'], required=False, default='square'
+            ),
+        ],
+        responses={
+            200: openapi.Schema(
+                type=openapi.TYPE_OBJECT,
+                properties={
+                    'shape': openapi.Schema(type=openapi.TYPE_STRING, description='Grid cell shape'),
+                    'cell_size': openapi.Schema(type=openapi.TYPE_NUMBER, description='Size of each grid cell in degrees'),
+                    'bbox': openapi.Schema(type=openapi.TYPE_ARRAY, items=openapi.Items(type=openapi.TYPE_NUMBER), description='Bounding box snapped to the grid'),
+                    'cells': openapi.Schema(
+                        type=openapi.TYPE_ARRAY,
+                        items=openapi.Schema(
+                            type=openapi.TYPE_OBJECT,
+                            properties={
+                                'i': openapi.Schema(type=openapi.TYPE_INTEGER, description='Column index of the cell'),
+                                'j': openapi.Schema(type=openapi.TYPE_INTEGER, description='Row index of the cell'),
+                                'geometry': openapi.Schema(type=openapi.TYPE_OBJECT, description='GeoJSON polygon of the cell'),
+                                'area_count': openapi.Schema(type=openapi.TYPE_INTEGER, description='Number of service areas covering the cell'),
+                                'provider_count': openapi.Schema(type=openapi.TYPE_INTEGER, description='Number of distinct providers covering the cell'),
+                                'price': openapi.Schema(
+                                    type=openapi.TYPE_OBJECT,
+                                    properties={
+                                        'min': openapi.Schema(type=openapi.TYPE_INTEGER),
+                                        'median': openapi.Schema(type=openapi.TYPE_NUMBER),
+                                        'max': openapi.Schema(type=openapi.TYPE_INTEGER),
+                                    }
+                                ),
+                            }
+                        )
+                    ),
+                }
+            ),
+            400: 'Bad Request: Invalid bbox, cell size or shape'
+        },
+        operation_summary="Coverage heatmap over a grid",
+        operation_description="Aggregates the service areas intersecting each cell of a square or hexagonal grid over the bounding box. Each cell reports the number of covering service areas and providers and the min, median and max price. Cells without coverage are omitted."
+    )(views.CoverageHeatmapViewSet.get)
+
+    swagger_auto_schema(
+        operation_summary="List background jobs",
+        operation_description="Endpoint to list the background jobs, most recent first, optionally filtered by status and kind. Staff users only.",
+        manual_parameters=[
+            openapi.Parameter(
+                'page', openapi.IN_QUERY, description="Page number", type=openapi.TYPE_INTEGER, required=False, default=1
+            ),
+            openapi.Parameter(
+                'page_size', openapi.IN_QUERY, description="Number of items per page", type=openapi.TYPE_INTEGER, required=False, default=10
+            ),
+            openapi.Parameter(
+                'status', openapi.IN_QUERY, description="Job status", type=openapi.TYPE_STRING, enum=[choice for choice, _ in Job.STATUS_CHOICES], required=False
+            ),
+            openapi.Parameter(
+                'kind', openapi.IN_QUERY, description="Job kind", type=openapi.TYPE_STRING, required=False
+            ),
+        ],
+        responses={
+            200: JobSerializer,
+            403: 'Forbidden',
+        },
+    )(views.JobViewSet.list)
+
+    swagger_auto_schema(
+        operation_summary="Get a background job",
+        operation_description="Endpoint to follow a background job: its status, attempts, progress, and result or error. Staff users only.",
+        responses={
+            200: JobSerializer,
+            403: 'Forbidden',
+            404: 'Not Found',
+        },
+    )(views.JobViewSet.retrieve)
+
+    swagger_auto_schema(
+        operation_summary="Enqueue a background job",
+        operation_description=f"Endpoint to enqueue a job run by `manage.py run_job_worker`. The kind is one of {', '.join(registered_kinds())} and the payload holds its arguments. Files are named relative to `JOB_FILES_DIR`. Staff users only.",
+        request_body=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            properties={
+                'kind': openapi.Schema(type=openapi.TYPE_STRING, description='Job kind'),
+                'payload': openapi.Schema(type=openapi.TYPE_OBJECT, description='Arguments of the job'),
+                'priority': openapi.Schema(type=openapi.TYPE_INTEGER, description='Higher priorities run first'),
+                'max_attempts': openapi.Schema(type=openapi.TYPE_INTEGER, description='Attempts before the job is marked failed'),
+                'run_at': openapi.Schema(type=openapi.TYPE_STRING, format=openapi.FORMAT_DATETIME, description='Do not run the job before this time'),
+            },
+            required=['kind'],
+            example={'kind': 'build_service_area_snapshot', 'payload': {}},
+        ),
+        responses={
+            201: JobSerializer,
+            400: 'Bad Request',
+            403: 'Forbidden',
+        },
+    )(views.JobViewSet.create)
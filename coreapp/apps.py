@@ -4,3 +4,12 @@ from django.apps import AppConfig
 class CoreappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'coreapp'
+
+    def ready(self):
+        from . import heatmap, invalidation, snapshot
+        # Registers the background job handlers
+        from . import tasks
+
+        invalidation.register(heatmap.invalidate_heatmaps)
+        invalidation.register(snapshot.invalidate_snapshots)
+        invalidation.register(tasks.schedule_snapshot_build)
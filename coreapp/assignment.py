@@ -0,0 +1,336 @@
+"""
+Offline point to service area assignment.
+
+The service area polygons are exported once into flat NumPy arrays and indexed with a
+uniform grid over their bounding boxes. Points are then streamed in chunks and tested
+with a vectorized even-odd ray casting test, spread across a process pool.
+
+The test is planar on lng/lat, which is what ``ServiceArea.objects.filter(area__contains=point)``
+does as well: PostGIS has no geography ``ST_Contains``, so Django casts both sides to geometry.
+"""
+import csv
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .models import ServiceArea
+
+MAX_BROADCAST_SIZE = 4_000_000
+
+
+class PolygonSet:
+    """
+    Service area polygons packed into flat arrays.
+
+    ``coords`` holds the vertices of every ring, ``ring_offsets`` delimits the rings inside
+    ``coords`` and ``polygon_offsets`` delimits the rings that belong to each polygon, so the
+    exterior ring and the holes of polygon ``i`` are rings ``polygon_offsets[i]:polygon_offsets[i + 1]``.
+    """
+
+    def __init__(self, ids, coords, ring_offsets, polygon_offsets, bboxes):
+        self.ids = ids
+        self.coords = coords
+        self.ring_offsets = ring_offsets
+        self.polygon_offsets = polygon_offsets
+        self.bboxes = bboxes
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def from_polygons(cls, ids, polygons):
+        coords = []
+        ring_offsets = [0]
+        polygon_offsets = [0]
+        bboxes = []
+
+        for polygon in polygons:
+            for ring in polygon.coords:
+                coords.extend(ring)
+                ring_offsets.append(len(coords))
+            polygon_offsets.append(len(ring_offsets) - 1)
+            bboxes.append(polygon.extent)
+
+        return cls(
+            ids=list(ids),
+            coords=np.asarray(coords, dtype=np.float64).reshape(-1, 2),
+            ring_offsets=np.asarray(ring_offsets, dtype=np.int64),
+            polygon_offsets=np.asarray(polygon_offsets, dtype=np.int64),
+            bboxes=np.asarray(bboxes, dtype=np.float64).reshape(-1, 4),
+        )
+
+    def edges(self, index):
+        """
+        Return the ``(x1, y1, x2, y2)`` edge arrays of every ring of a polygon.
+        """
+        start_ring, end_ring = self.polygon_offsets[index], self.polygon_offsets[index + 1]
+        segments = []
+        for ring in range(start_ring, end_ring):
+            ring_coords = self.coords[self.ring_offsets[ring]:self.ring_offsets[ring + 1]]
+            segments.append(np.hstack([ring_coords[:-1], ring_coords[1:]]))
+        edges = np.vstack(segments)
+        return edges[:, 0], edges[:, 1], edges[:, 2], edges[:, 3]
+
+
+def export_polygons(queryset=None, chunk_size=2000):
+    """
+    Export the service area polygons from the database into a ``PolygonSet``.
+    """
+    if queryset is None:
+        queryset = ServiceArea.objects.all()
+
+    ids = []
+    polygons = []
+    for area_id, area in queryset.values_list('id', 'area').iterator(chunk_size=chunk_size):
+        ids.append(str(area_id))
+        polygons.append(area)
+
+    return PolygonSet.from_polygons(ids, polygons)
+
+
+class GridIndex:
+    """
+    Uniform grid over the polygons bounding boxes.
+
+    Each cell lists the polygons whose bounding box overlaps it, stored in CSR form:
+    the candidates of cell ``c`` are ``items[offsets[c]:offsets[c + 1]]``.
+    """
+
+    def __init__(self, origin, cell_size, shape, offsets, items):
+        self.origin = origin
+        self.cell_size = cell_size
+        self.shape = shape
+        self.offsets = offsets
+        self.items = items
+
+    @classmethod
+    def build(cls, bboxes, cell_size=None):
+        if len(bboxes) == 0:
+            return cls(np.zeros(2), 1.0, (1, 1), np.zeros(2, dtype=np.int64), np.zeros(0, dtype=np.int64))
+
+        origin = bboxes[:, :2].min(axis=0)
+        extent = bboxes[:, 2:].max(axis=0) - origin
+        if cell_size is None:
+            # Aim for roughly one polygon per cell, but never cells smaller than the typical polygon
+            typical = np.median(bboxes[:, 2:] - bboxes[:, :2])
+            cell_size = max(float(np.sqrt(extent[0] * extent[1] / len(bboxes))), float(typical), 1e-6)
+
+        shape = (int(extent[0] // cell_size) + 1, int(extent[1] // cell_size) + 1)
+
+        min_cells = ((bboxes[:, :2] - origin) // cell_size).astype(np.int64)
+        max_cells = ((bboxes[:, 2:] - origin) // cell_size).astype(np.int64)
+
+        cells = []
+        items = []
+        for polygon, (min_x, min_y), (max_x, max_y) in zip(range(len(bboxes)), min_cells, max_cells):
+            xs, ys = np.meshgrid(np.arange(min_x, max_x + 1), np.arange(min_y, max_y + 1))
+            covered = (xs * shape[1] + ys).ravel()
+            cells.append(covered)
+            items.append(np.full(len(covered), polygon, dtype=np.int64))
+
+        cells = np.concatenate(cells)
+        items = np.concatenate(items)
+        order = np.argsort(cells, kind='stable')
+        counts = np.bincount(cells, minlength=shape[0] * shape[1])
+        offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+        return cls(origin, cell_size, shape, offsets, items[order])
+
+    def cells_for(self, lng, lat):
+        """
+        Return the cell of each point, or -1 for points outside the grid.
+        """
+        x = np.floor((lng - self.origin[0]) / self.cell_size).astype(np.int64)
+        y = np.floor((lat - self.origin[1]) / self.cell_size).astype(np.int64)
+        inside = (x >= 0) & (x < self.shape[0]) & (y >= 0) & (y < self.shape[1])
+        return np.where(inside, x * self.shape[1] + y, -1)
+
+    def candidates(self, cell):
+        return self.items[self.offsets[cell]:self.offsets[cell + 1]]
+
+
+def points_in_polygon(lng, lat, edges):
+    """
+    Vectorized even-odd ray casting of many points against the edges of one polygon.
+    """
+    x1, y1, x2, y2 = edges
+    inside = np.zeros(len(lng), dtype=bool)
+
+    # Bound the points x edges intermediate arrays for polygons with many vertices
+    step = max(1, MAX_BROADCAST_SIZE // len(x1))
+    for start in range(0, len(lng), step):
+        px = lng[start:start + step, None]
+        py = lat[start:start + step, None]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            crosses = ((y1 > py) != (y2 > py)) & (px < (x2 - x1) * (py - y1) / (y2 - y1) + x1)
+        inside[start:start + step] = np.count_nonzero(crosses, axis=1) % 2 == 1
+
+    return inside
+
+
+def assign_points(lng, lat, polygons, index):
+    """
+    Assign each point to the polygons that contain it.
+
+    Returns two aligned arrays: the position of the point in the input and the position of
+    the containing polygon in ``polygons``. Points covered by several polygons appear once
+    per polygon and points outside every polygon do not appear.
+    """
+    lng = np.asarray(lng, dtype=np.float64)
+    lat = np.asarray(lat, dtype=np.float64)
+
+    cells = index.cells_for(lng, lat)
+    order = np.argsort(cells, kind='stable')
+    sorted_cells = cells[order]
+    unique_cells, starts = np.unique(sorted_cells, return_index=True)
+    ends = np.append(starts[1:], len(sorted_cells))
+
+    point_matches = []
+    polygon_matches = []
+    edges_cache = {}
+    for cell, start, end in zip(unique_cells, starts, ends):
+        if cell < 0:
+            continue
+
+        point_ids = order[start:end]
+        cell_lng = lng[point_ids]
+        cell_lat = lat[point_ids]
+        for polygon in index.candidates(cell):
+            min_x, min_y, max_x, max_y = polygons.bboxes[polygon]
+            in_bbox = (cell_lng >= min_x) & (cell_lng <= max_x) & (cell_lat >= min_y) & (cell_lat <= max_y)
+            if not in_bbox.any():
+                continue
+
+            if polygon not in edges_cache:
+                edges_cache[polygon] = polygons.edges(polygon)
+
+            candidates = np.flatnonzero(in_bbox)
+            inside = points_in_polygon(cell_lng[candidates], cell_lat[candidates], edges_cache[polygon])
+            matched = point_ids[candidates[inside]]
+            point_matches.append(matched)
+            polygon_matches.append(np.full(len(matched), polygon, dtype=np.int64))
+
+    if not point_matches:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    point_matches = np.concatenate(point_matches)
+    polygon_matches = np.concatenate(polygon_matches)
+    order = np.lexsort((polygon_matches, point_matches))
+    return point_matches[order], polygon_matches[order]
+
+
+# Process pool workers receive the polygons and the index once, through the initializer
+_worker_state = {}
+
+
+def _init_worker(polygons, index):
+    _worker_state['polygons'] = polygons
+    _worker_state['index'] = index
+
+
+def _assign_chunk(chunk):
+    keys, lng, lat = chunk
+    polygons = _worker_state['polygons']
+    point_matches, polygon_matches = assign_points(lng, lat, polygons, _worker_state['index'])
+    return [keys[point] for point in point_matches], [polygons.ids[polygon] for polygon in polygon_matches]
+
+
+def _bounded_map(executor, func, iterable, max_pending):
+    """
+    Like ``executor.map`` but keeps at most ``max_pending`` chunks in flight, so the input
+    is not read into memory ahead of the workers.
+    """
+    pending = deque()
+    for item in iterable:
+        pending.append(executor.submit(func, item))
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def run_assignment(chunks, polygons, index, workers=1):
+    """
+    Assign a stream of ``(keys, lng, lat)`` chunks, yielding ``(keys, service_area_ids)`` per chunk
+    in input order.
+    """
+    if workers <= 1:
+        _init_worker(polygons, index)
+        for chunk in chunks:
+            yield _assign_chunk(chunk)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(polygons, index)) as executor:
+        yield from _bounded_map(executor, _assign_chunk, chunks, max_pending=workers * 2)
+
+
+def read_csv_chunks(path, key_column, lng_column, lat_column, chunk_size):
+    with open(path, newline='') as file:
+        reader = csv.DictReader(file)
+        keys, lngs, lats = [], [], []
+        for row in reader:
+            keys.append(row[key_column])
+            lngs.append(float(row[lng_column]))
+            lats.append(float(row[lat_column]))
+            if len(keys) >= chunk_size:
+                yield keys, np.asarray(lngs), np.asarray(lats)
+                keys, lngs, lats = [], [], []
+        if keys:
+            yield keys, np.asarray(lngs), np.asarray(lats)
+
+
+def read_parquet_chunks(path, key_column, lng_column, lat_column, chunk_size):
+    # Imported and opened here rather than in the generator, so a missing pyarrow or file fails on the call
+    import pyarrow.parquet as pq
+
+    parquet_file = pq.ParquetFile(path)
+    return _parquet_chunks(parquet_file, key_column, lng_column, lat_column, chunk_size)
+
+
+def _parquet_chunks(parquet_file, key_column, lng_column, lat_column, chunk_size):
+    for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=[key_column, lng_column, lat_column]):
+        yield (
+            batch.column(key_column).to_pylist(),
+            batch.column(lng_column).to_numpy(zero_copy_only=False).astype(np.float64),
+            batch.column(lat_column).to_numpy(zero_copy_only=False).astype(np.float64),
+        )
+
+
+class CsvAssignmentWriter:
+
+    def __init__(self, path, key_column):
+        self.file = open(path, 'w', newline='')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow([key_column, 'service_area_id'])
+
+    def write(self, keys, service_area_ids):
+        self.writer.writerows(zip(keys, service_area_ids))
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetAssignmentWriter:
+
+    def __init__(self, path, key_column):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self.pa = pa
+        self.key_column = key_column
+        self.schema = pa.schema([(key_column, pa.string()), ('service_area_id', pa.string())])
+        self.writer = pq.ParquetWriter(path, self.schema)
+
+    def write(self, keys, service_area_ids):
+        if not keys:
+            return
+        table = self.pa.table({self.key_column: [str(key) for key in keys], 'service_area_id': service_area_ids}, schema=self.schema)
+        self.writer.write_table(table)
+
+    def close(self):
+        self.writer.close()
+
+
+def is_parquet(path):
+    return str(path).endswith(('.parquet', '.pq'))
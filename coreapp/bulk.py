@@ -0,0 +1,109 @@
+"""
+Bulk upsert of providers.
+
+A batch is validated row by row with the ``ProviderSerializer`` rules, reusing a single
+serializer, and written with one ``INSERT ... ON CONFLICT (name) DO UPDATE`` whose rows are
+passed as column arrays, so a sync of tens of thousands of providers is a single statement.
+"""
+import uuid
+
+from django.db import connections, router, transaction
+from rest_framework import serializers
+
+from .invalidation import publish
+from .models import Provider
+from .serializers import ProviderUpsertSerializer
+
+CREATED = 'created'
+UPDATED = 'updated'
+UNCHANGED = 'unchanged'
+FAILED = 'failed'
+
+UPSERT_COLUMNS = ['email', 'phone_number', 'language', 'currency']
+
+# Unchanged rows are not rewritten, so their version and the list ETag stay as they are
+UPSERT_SQL = """
+    INSERT INTO providers AS p (id, name, email, phone_number, language, currency, version, updated_at)
+    SELECT batch.*, 1, clock_timestamp()
+    FROM unnest(%s::uuid[], %s::varchar[], %s::varchar[], %s::varchar[], %s::varchar[], %s::varchar[]) AS batch
+    ON CONFLICT (name) DO UPDATE SET
+        email = EXCLUDED.email,
+        phone_number = EXCLUDED.phone_number,
+        language = EXCLUDED.language,
+        currency = EXCLUDED.currency,
+        version = p.version + 1,
+        updated_at = EXCLUDED.updated_at
+    WHERE p.deleted_at IS NULL AND (p.email, p.phone_number, p.language, p.currency)
+        IS DISTINCT FROM (EXCLUDED.email, EXCLUDED.phone_number, EXCLUDED.language, EXCLUDED.currency)
+    RETURNING p.id, p.name, p.xmax = 0
+"""
+
+
+def validate_rows(rows):
+    """
+    Validate the rows of a batch. Returns the valid rows by name, the last occurrence of a name
+    winning, and the results of the rows that failed.
+    """
+    serializer = ProviderUpsertSerializer()
+    valid = {}
+    results = [None] * len(rows)
+    for index, row in enumerate(rows):
+        try:
+            if not isinstance(row, dict):
+                raise serializers.ValidationError({'non_field_errors': ['Expected an object.']})
+            data = serializer.run_validation(row)
+        except serializers.ValidationError as e:
+            results[index] = {'index': index, 'status': FAILED, 'errors': e.detail}
+            continue
+
+        previous = valid.get(data['name'])
+        if previous is not None:
+            results[previous[0]] = {
+                'index': previous[0],
+                'status': FAILED,
+                'errors': {'name': [f'Duplicate name, row {index} of the batch is used instead.']},
+            }
+        valid[data['name']] = (index, data)
+    return valid, results
+
+
+def upsert_providers(rows):
+    """
+    Create or update the providers of the batch by name and return one result per row, in order.
+    """
+    valid, results = validate_rows(rows)
+    if not valid:
+        return results
+
+    # Rows are inserted, and their conflicting providers locked, in name order, so concurrent batches
+    # sharing names wait on each other instead of deadlocking
+    names = sorted(valid)
+    columns = [[str(uuid.uuid4()) for _ in names], names]
+    columns += [[valid[name][1][column] for name in names] for column in UPSERT_COLUMNS]
+
+    using = router.db_for_write(Provider)
+    with transaction.atomic(using=using):
+        with connections[using].cursor() as cursor:
+            cursor.execute(UPSERT_SQL, columns)
+            written = {name: (str(id), created) for id, name, created in cursor.fetchall()}
+        if written:
+            publish(Provider._meta.model_name, 'update', using=using)
+
+        # The conflicting rows were locked by the upsert, they cannot be gone yet. Hidden ones are left out.
+        unchanged = [name for name in valid if name not in written]
+        existing = dict(Provider.objects.using(using).filter(name__in=unchanged).values_list('name', 'id')) if unchanged else {}
+
+    for name, (index, _) in valid.items():
+        if name in written:
+            id, created = written[name]
+            results[index] = {'index': index, 'status': CREATED if created else UPDATED, 'id': id, 'name': name}
+        elif name in existing:
+            results[index] = {'index': index, 'status': UNCHANGED, 'id': str(existing[name]), 'name': name}
+        else:
+            # Conflicts with a provider being deleted in the background
+            results[index] = {
+                'index': index,
+                'status': FAILED,
+                'errors': {'name': ['A provider with this name is being deleted, try again later.']},
+            }
+    return results
@@ -0,0 +1,93 @@
+"""
+Conditional GET for the provider and service area resources.
+
+Detail responses are validated by the row ``version`` and ``updated_at``, list responses by the
+change counters of the listed models. Both are read without fetching or serializing the rows, so a
+client polling an unchanged resource gets a 304 for the price of an index lookup.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import connections
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+
+# One primary key lookup per model. The counters move with every published change in commit
+# order, so a list only keeps its ETag while none of its models changed.
+COLLECTION_VALIDATORS_SQL = """
+    SELECT coalesce(sum(changes), 0), max(changed_at)
+    FROM change_counters
+    WHERE model = ANY(%s)
+"""
+
+
+def collection_validators(queryset, models, request):
+    """
+    ETag and Last-Modified of a list response: the change counters of the models, combined with
+    the query string since each page is a different representation.
+    """
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(COLLECTION_VALIDATORS_SQL, [list(models)])
+        changes, last_modified = cursor.fetchone()
+
+    state = f'{changes}:{last_modified.timestamp() if last_modified else 0}'
+    state = hashlib.md5(state.encode(), usedforsecurity=False).hexdigest()[:16]
+    query = hashlib.md5(request.META.get('QUERY_STRING', '').encode(), usedforsecurity=False).hexdigest()[:16]
+    return f'"{state}-{query}"', last_modified
+
+
+def detail_validators(queryset, pk):
+    """
+    ETag and Last-Modified of a detail response, or None when the row does not exist.
+    """
+    try:
+        row = queryset.filter(pk=pk).values_list('version', 'updated_at').first()
+    except (TypeError, ValueError, ValidationError):
+        return None
+    if row is None:
+        return None
+
+    version, updated_at = row
+    return f'"{version}-{updated_at.timestamp():.6f}"', updated_at
+
+
+class ConditionalGetMixin:
+    """
+    Answers ``If-None-Match`` and ``If-Modified-Since`` on ``list`` and ``retrieve`` with a 304
+    before the rows are queried, and sets the validators and ``Cache-Control`` on the responses.
+
+    ``collection_models`` are the change event models that can alter the list, writes that bypass
+    ``coreapp.invalidation.publish`` leave its validators unchanged.
+    """
+    collection_models = ()
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        etag, last_modified = collection_validators(queryset, self.collection_models, request)
+        return self.conditional_response(request, etag, last_modified, lambda: super(ConditionalGetMixin, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        validators = detail_validators(self.get_queryset(), kwargs[self.lookup_url_kwarg or self.lookup_field])
+        if validators is None:
+            return super().retrieve(request, *args, **kwargs)
+
+        etag, last_modified = validators
+        return self.conditional_response(request, etag, last_modified, lambda: super(ConditionalGetMixin, self).retrieve(request, *args, **kwargs))
+
+    def conditional_response(self, request, etag, last_modified, respond):
+        if last_modified is not None:
+            # HTTP dates have a one second resolution, If-Modified-Since never matches a fraction
+            last_modified = int(last_modified.timestamp())
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = respond()
+
+        if response.status_code in (200, 304):
+            response.headers['ETag'] = etag
+            if last_modified is not None:
+                response.headers['Last-Modified'] = http_date(last_modified)
+            patch_cache_control(response, public=True, max_age=settings.API_CACHE_MAX_AGE, must_revalidate=True)
+            patch_vary_headers(response, ['Accept'])
+        return response
@@ -0,0 +1,143 @@
+"""
+Read replica routing.
+
+Writes always go to the primary (``default``). Reads go to a replica only inside
+``replica_reads()``, which the read-only API actions enter, and only while the client is not
+inside its read-your-writes window and the replica is not lagging more than ``REPLICA_MAX_LAG``.
+"""
+import logging
+import math
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+PRIMARY = 'default'
+READ_YOUR_WRITES_COOKIE = 'primary_until'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# A replica cut off from the primary has replayed all it received, however old: unless it is
+# streaming, its lag is the age of the last replayed transaction
+REPLICA_LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN EXISTS (SELECT 1 FROM pg_stat_wal_receiver WHERE status = 'streaming')
+            AND pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE coalesce(extract(epoch FROM now() - pg_last_xact_replay_timestamp())::float8, 'Infinity')
+    END
+"""
+
+_replica_reads = ContextVar('replica_reads', default=False)
+_pinned_to_primary = ContextVar('pinned_to_primary', default=False)
+
+_lag_lock = threading.Lock()
+_lag_checks = {}
+
+
+@contextmanager
+def replica_reads():
+    """
+    Allow the reads made inside the block to be served by a replica.
+    """
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+@contextmanager
+def pinned_to_primary(pinned=True):
+    """
+    Force the reads made inside the block to the primary, even inside ``replica_reads()``.
+    """
+    token = _pinned_to_primary.set(pinned)
+    try:
+        yield
+    finally:
+        _pinned_to_primary.reset(token)
+
+
+def replica_lag(alias):
+    """
+    Replication lag of a replica in seconds, checked at most every ``REPLICA_LAG_CHECK_INTERVAL``
+    seconds per worker. An unreachable replica has an infinite lag.
+    """
+    now = time.monotonic()
+    checked_at, lag = _lag_checks.get(alias, (None, None))
+    if checked_at is not None and now - checked_at < settings.REPLICA_LAG_CHECK_INTERVAL:
+        return lag
+
+    with _lag_lock:
+        try:
+            with connections[alias].cursor() as cursor:
+                cursor.execute(REPLICA_LAG_SQL)
+                lag = float(cursor.fetchone()[0])
+        except DatabaseError:
+            logger.warning('Replica %s is unreachable, reading from the primary', alias, exc_info=True)
+            lag = math.inf
+        _lag_checks[alias] = (now, lag)
+
+    if lag > settings.REPLICA_MAX_LAG:
+        logger.warning('Replica %s is %.1fs behind the primary, reading from the primary', alias, lag)
+    return lag
+
+
+def choose_replica():
+    healthy = [alias for alias in settings.DATABASE_REPLICAS if replica_lag(alias) <= settings.REPLICA_MAX_LAG]
+    if not healthy:
+        return None
+    return random.choice(healthy)
+
+
+class PrimaryReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        if not settings.DATABASE_REPLICAS or not _replica_reads.get() or _pinned_to_primary.get():
+            return PRIMARY
+        return choose_replica() or PRIMARY
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == PRIMARY
+
+
+class ReadYourWritesMiddleware:
+    """
+    After a successful write, pin the client's reads to the primary for ``READ_YOUR_WRITES_WINDOW``
+    seconds. The window travels in a cookie, so it holds whichever worker serves the next request.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            pinned = float(request.COOKIES.get(READ_YOUR_WRITES_COOKIE, 0)) > time.time()
+        except ValueError:
+            pinned = False
+
+        with pinned_to_primary(pinned):
+            response = self.get_response(request)
+
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            window = settings.READ_YOUR_WRITES_WINDOW
+            response.set_cookie(
+                READ_YOUR_WRITES_COOKIE,
+                f'{time.time() + window:.3f}',
+                max_age=math.ceil(window),
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
@@ -0,0 +1,125 @@
+"""
+Normalization of the service area geometries on ingest.
+
+Clients send rings that are left open, repeat points, cross themselves or carry far more vertices
+than the shape needs. PostGIS answers containment tests on invalid polygons unpredictably and
+every test pays for each vertex, so the areas are cleaned once when written: rings are closed and
+deduplicated, invalid shapes repaired, optionally simplified within
+``SERVICE_AREA_SIMPLIFY_TOLERANCE`` degrees, and oriented exterior counterclockwise, holes clockwise.
+"""
+import math
+
+from django.conf import settings
+from django.contrib.gis.geos import GEOSGeometry, Polygon
+
+SRID = 4326
+# Mean radius of the sphere ST_Area(geography, false) measures on, in metres
+EARTH_RADIUS = 6371008.8
+
+
+def _clean_ring(coords):
+    ring = []
+    for coord in coords:
+        try:
+            lng, lat = float(coord[0]), float(coord[1])
+        except (TypeError, ValueError, IndexError, KeyError):
+            raise ValueError(f'Invalid coordinate {coord!r}, expected a longitude and a latitude.')
+        if not (math.isfinite(lng) and math.isfinite(lat) and -180 <= lng <= 180 and -90 <= lat <= 90):
+            raise ValueError(f'Coordinate {coord!r} is out of range, longitudes go from -180 to 180 and latitudes from -90 to 90.')
+        if not ring or ring[-1] != (lng, lat):
+            ring.append((lng, lat))
+
+    if len(ring) > 1 and ring[0] == ring[-1]:
+        ring.pop()
+    if len(set(ring)) < 3:
+        raise ValueError('A polygon needs at least three distinct points.')
+    ring.append(ring[0])
+    return ring
+
+
+def _single_polygon(geometry):
+    # make_valid() splits a ring crossing itself into several polygons, and drops collapsed parts as lines or points
+    parts = []
+    for part in (geometry if geometry.geom_type in ('MultiPolygon', 'GeometryCollection') else [geometry]):
+        if part.geom_type == 'MultiPolygon':
+            parts.extend(part)
+        elif part.geom_type == 'Polygon' and not part.empty:
+            parts.append(part)
+
+    if not parts:
+        raise ValueError('The area has no surface.')
+    if len(parts) > 1:
+        raise ValueError(f'The area crosses itself into {len(parts)} polygons, send each of them as its own service area.')
+    return parts[0]
+
+
+def _oriented(polygon):
+    rings = []
+    for i, ring in enumerate(polygon):
+        coords = ring.coords
+        # Counterclockwise for the exterior ring only
+        if ring.is_counterclockwise != (i == 0):
+            coords = coords[::-1]
+        rings.append(coords)
+    return Polygon(*rings, srid=SRID)
+
+
+def normalize_area(area, tolerance=None):
+    """
+    Return ``area``, a polygon or the coordinates of its exterior ring, as a valid and clean polygon.
+
+    ``tolerance`` defaults to ``SERVICE_AREA_SIMPLIFY_TOLERANCE``, 0 keeps every vertex. Raises
+    ValueError when the area cannot be made a single polygon.
+    """
+    if isinstance(area, GEOSGeometry):
+        if area.geom_type != 'Polygon':
+            raise ValueError(f'Expected a polygon, not a {area.geom_type}.')
+        rings = [_clean_ring(ring.coords) for ring in area]
+    else:
+        rings = [_clean_ring(area)]
+
+    polygon = Polygon(*rings, srid=SRID)
+    if not polygon.valid:
+        polygon = _single_polygon(polygon.make_valid())
+
+    if tolerance is None:
+        tolerance = settings.SERVICE_AREA_SIMPLIFY_TOLERANCE
+    if tolerance:
+        simplified = polygon.simplify(tolerance, preserve_topology=True)
+        # A polygon thinner than the tolerance would vanish, keep it as is
+        if simplified.geom_type == 'Polygon' and not simplified.empty:
+            polygon = simplified
+
+    return _oriented(polygon)
+
+
+def vertex_count(polygon):
+    return polygon.num_coords
+
+
+def _unit_vector(lng, lat):
+    lng, lat = math.radians(lng), math.radians(lat)
+    return math.cos(lat) * math.cos(lng), math.cos(lat) * math.sin(lng), math.sin(lat)
+
+
+def _dot(a, b):
+    return a[0] * b[0] + a[1] * b[1] + a[2] * b[2]
+
+
+def _ring_area(coords):
+    # Signed solid angles of the triangles fanning out of the first vertex (Van Oosterom and Strackee),
+    # the edges being great circle arcs as for a PostGIS geography
+    first, *others = [_unit_vector(lng, lat) for lng, lat in coords[:-1]]
+    angle = 0.0
+    for b, c in zip(others, others[1:]):
+        cross = (b[1] * c[2] - b[2] * c[1], b[2] * c[0] - b[0] * c[2], b[0] * c[1] - b[1] * c[0])
+        angle += 2 * math.atan2(_dot(first, cross), 1 + _dot(first, b) + _dot(b, c) + _dot(c, first))
+    return abs(angle) * EARTH_RADIUS ** 2
+
+
+def geodesic_area(polygon):
+    """
+    Area of the polygon in square metres, on the sphere like ``ST_Area(geography, false)``.
+    """
+    exterior, *holes = [_ring_area(ring.coords) for ring in polygon]
+    return exterior - sum(holes)
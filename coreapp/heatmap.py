@@ -0,0 +1,167 @@
+import json
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, router
+
+from .db_routing import PRIMARY
+from .models import ServiceArea
+from .regions import candidate_regions
+
+GRID_FUNCTIONS = {
+    'square': 'ST_SquareGrid',
+    'hex': 'ST_HexagonGrid',
+}
+
+HEATMAP_SQL = """
+    WITH bounds AS (
+        SELECT ST_MakeEnvelope(%(min_lng)s, %(min_lat)s, %(max_lng)s, %(max_lat)s, 4326) AS geom
+    ),
+    candidates AS (
+        SELECT sa.provider_id, sa.price, sa.area::geometry AS geom
+        FROM bounds b, service_areas sa
+        JOIN providers p ON p.id = sa.provider_id
+        -- The lng/lat envelope like the grid cells and regions, the expression of service_areas_area_geom_idx
+        WHERE (sa.area)::geometry(POLYGON,4326) && b.geom AND p.deleted_at IS NULL {region_filter}
+    ),
+    grid AS (
+        SELECT cell.i, cell.j, cell.geom
+        FROM bounds b, {grid_function}(%(cell_size)s, b.geom) AS cell
+    )
+    SELECT
+        g.i,
+        g.j,
+        ST_AsGeoJSON(g.geom),
+        count(*),
+        count(DISTINCT c.provider_id),
+        min(c.price),
+        percentile_cont(0.5) WITHIN GROUP (ORDER BY c.price),
+        max(c.price)
+    FROM grid g
+    JOIN candidates c ON ST_Intersects(c.geom, g.geom)
+    GROUP BY g.i, g.j, g.geom
+    ORDER BY g.j, g.i
+"""
+
+
+class HeatmapError(ValueError):
+    pass
+
+
+def snap_bbox(min_lng, min_lat, max_lng, max_lat, cell_size):
+    """
+    Expand the bounding box outwards to multiples of the cell size.
+
+    PostGIS anchors its grids at the origin, so snapping does not change the cells
+    that are generated, but it lets nearby viewports share the same cache entry.
+    """
+    return (
+        math.floor(min_lng / cell_size) * cell_size,
+        math.floor(min_lat / cell_size) * cell_size,
+        math.ceil(max_lng / cell_size) * cell_size,
+        math.ceil(max_lat / cell_size) * cell_size,
+    )
+
+
+def grid_cell_count(width, height, cell_size, shape):
+    """
+    Cells of the grid over a width by height box, at most.
+    """
+    if shape == 'hex':
+        # ST_HexagonGrid sizes hexagons by their edge: columns are 1.5 edges apart and rows sqrt(3) edges
+        # apart, and the cells straddling the box edges count too
+        return (math.ceil(width / (1.5 * cell_size)) + 1) * (math.ceil(height / (math.sqrt(3) * cell_size)) + 1)
+    return math.ceil(width / cell_size) * math.ceil(height / cell_size)
+
+
+def validate_heatmap_params(min_lng, min_lat, max_lng, max_lat, cell_size, shape):
+    if shape not in GRID_FUNCTIONS:
+        raise HeatmapError(f"Shape must be one of {list(GRID_FUNCTIONS)}.")
+    if cell_size <= 0:
+        raise HeatmapError("Cell size must be greater than zero.")
+    if not (-180 <= min_lng < max_lng <= 180 and -90 <= min_lat < max_lat <= 90):
+        raise HeatmapError("Bounding box must be a valid min_lng,min_lat,max_lng,max_lat extent.")
+
+    cells = grid_cell_count(max_lng - min_lng, max_lat - min_lat, cell_size, shape)
+    if cells > settings.HEATMAP_MAX_CELLS:
+        raise HeatmapError(
+            f"Requested grid has {cells} cells, the maximum is {settings.HEATMAP_MAX_CELLS}. "
+            "Use a bigger cell size or a smaller bounding box."
+        )
+
+
+GENERATION_KEY = 'heatmap:generation'
+
+
+def heatmap_generation():
+    return cache.get_or_set(GENERATION_KEY, time.time_ns, None)
+
+
+def heatmap_cache_key(bbox, cell_size, shape, generation=None):
+    if generation is None:
+        generation = heatmap_generation()
+    return 'heatmap:{}:{}:{}:{}'.format(generation, shape, cell_size, ':'.join(repr(value) for value in bbox))
+
+
+def invalidate_heatmaps(event):
+    """
+    Drop every cached heatmap, as any provider or service area change can affect any region.
+    """
+    cache.set(GENERATION_KEY, time.time_ns(), None)
+
+
+def build_heatmap(min_lng, min_lat, max_lng, max_lat, cell_size, shape='square'):
+    """
+    Aggregate service area coverage over a square or hexagonal grid.
+
+    Cells that no service area touches are omitted from the result.
+    """
+    validate_heatmap_params(min_lng, min_lat, max_lng, max_lat, cell_size, shape)
+    bbox = snap_bbox(min_lng, min_lat, max_lng, max_lat, cell_size)
+
+    generation = heatmap_generation()
+    key = heatmap_cache_key(bbox, cell_size, shape, generation)
+    result = cache.get(key)
+    if result is not None:
+        return result
+
+    params = {
+        'min_lng': bbox[0],
+        'min_lat': bbox[1],
+        'max_lng': bbox[2],
+        'max_lat': bbox[3],
+        'cell_size': cell_size,
+        'regions': candidate_regions(*bbox),
+    }
+    region_filter = 'AND sa.region = ANY(%(regions)s)' if params['regions'] is not None else ''
+    alias = router.db_for_read(ServiceArea)
+    # A replica may not have replayed the change behind a recent generation bump yet, and its stale
+    # result would be cached under the new generation
+    settle = (settings.REPLICA_MAX_LAG + settings.REPLICA_LAG_CHECK_INTERVAL) * 1e9
+    if alias != PRIMARY and time.time_ns() - generation < settle:
+        alias = PRIMARY
+    with connections[alias].cursor() as cursor:
+        cursor.execute(HEATMAP_SQL.format(grid_function=GRID_FUNCTIONS[shape], region_filter=region_filter), params)
+        rows = cursor.fetchall()
+
+    result = {
+        'shape': shape,
+        'cell_size': cell_size,
+        'bbox': list(bbox),
+        'cells': [{
+            'i': i,
+            'j': j,
+            'geometry': json.loads(geometry),
+            'area_count': area_count,
+            'provider_count': provider_count,
+            'price': {
+                'min': min_price,
+                'median': median_price,
+                'max': max_price,
+            },
+        } for i, j, geometry, area_count, provider_count, min_price, median_price, max_price in rows],
+    }
+    cache.set(key, result, settings.HEATMAP_CACHE_TIMEOUT)
+    return result
@@ -0,0 +1,281 @@
+"""
+Cross-worker cache invalidation.
+
+Every write to providers and service areas appends a row to the ``change_events`` sequence
+table, bumps the model's row of ``change_counters`` and publishes the event with ``pg_notify`` in the same transaction, so other workers hear
+about it only once it is committed. The writing worker applies the event to its own caches
+right after the commit.
+
+Each gunicorn worker runs an ``InvalidationListener`` thread that ``LISTEN``s on the channel,
+or polls the sequence table when ``CACHE_INVALIDATION_MODE`` is ``poll``. Gaps in the sequence,
+reconnects and idle timeouts trigger a catch-up from the table, so events missed by NOTIFY are
+recovered instead of leaving caches stale.
+"""
+import json
+import logging
+import select
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.db import close_old_connections, connections, transaction
+
+logger = logging.getLogger(__name__)
+
+# Also bumps the counter of the model, which validates the cached lists. Its row stays locked
+# until the transaction commits, so the counter moves in commit order, unlike the sequence.
+PUBLISH_SQL = """
+    WITH event AS (
+        INSERT INTO change_events (model, action, object_id, created_at)
+        VALUES (%s, %s, %s, clock_timestamp())
+        RETURNING id, model, action, object_id, created_at AS changed_at, extract(epoch FROM created_at) AS created_at
+    ), counter AS (
+        INSERT INTO change_counters (model, changes, changed_at)
+        SELECT model, 1, changed_at FROM event
+        ON CONFLICT (model) DO UPDATE
+        SET changes = change_counters.changes + 1, changed_at = excluded.changed_at
+    )
+    SELECT pg_notify(%s, json_build_object(
+        'seq', id, 'model', model, 'action', action, 'object_id', object_id, 'created_at', created_at
+    )::text), id, created_at
+    FROM event
+"""
+
+CATCH_UP_SQL = """
+    SELECT id, model, action, object_id, extract(epoch FROM created_at)
+    FROM change_events
+    WHERE id > %s
+    ORDER BY id
+    LIMIT %s
+"""
+
+_handlers = []
+
+
+def register(handler):
+    """
+    Register a callable applied to every change event, local or coming from another worker.
+
+    Events are dicts with ``seq``, ``model`` (``provider``, ``servicearea``, or None when every
+    cache must be dropped), ``action``, ``object_id`` (None for bulk changes) and ``created_at``.
+    Handlers must be idempotent: an event can be applied more than once.
+    """
+    if handler not in _handlers:
+        _handlers.append(handler)
+    return handler
+
+
+def dispatch(event):
+    for handler in _handlers:
+        try:
+            handler(event)
+        except Exception:
+            logger.exception('Cache invalidation handler %r failed for event %s', handler, event.get('seq'))
+
+
+def publish(model, action, object_id=None, using='default'):
+    """
+    Record a change and notify the other workers once the current transaction commits.
+    """
+    with connections[using].cursor() as cursor:
+        cursor.execute(PUBLISH_SQL, [model, action, object_id, settings.CACHE_INVALIDATION_CHANNEL])
+        _, seq, created_at = cursor.fetchone()
+
+    event = {
+        'seq': seq,
+        'model': model,
+        'action': action,
+        'object_id': str(object_id) if object_id is not None else None,
+        'created_at': float(created_at),
+    }
+    transaction.on_commit(lambda: dispatch(event), using=using)
+    return event
+
+
+class InvalidationListener(threading.Thread):
+    """
+    Per-worker thread applying the change events published by the other workers.
+    """
+
+    def __init__(self, mode, channel, poll_interval, using='default'):
+        super().__init__(name='cache-invalidation-listener', daemon=True)
+        self.mode = mode
+        self.channel = channel
+        self.poll_interval = poll_interval
+        self.using = using
+        self.last_seq = None
+        self.seen = deque(maxlen=settings.CACHE_INVALIDATION_OVERLAP * 10)
+        self.seen_set = set()
+        self.pruned_at = 0
+        self.stopped = threading.Event()
+        self.stats = {
+            'delivered': 0,
+            'recovered': 0,
+            'resets': 0,
+            'reconnects': 0,
+            'last_seq': None,
+            'last_lag': None,
+            'max_lag': 0.0,
+        }
+
+    def connect(self):
+        wrapper = connections[self.using]
+        conn = wrapper.Database.connect(**wrapper.get_connection_params())
+        conn.autocommit = True
+        return conn
+
+    def stop(self):
+        self.stopped.set()
+
+    def run(self):
+        backoff = 1
+        while not self.stopped.is_set():
+            conn = None
+            try:
+                conn = self.connect()
+                self.catch_up(conn)
+                backoff = 1
+                if self.mode == 'notify':
+                    self.listen(conn)
+                else:
+                    self.poll(conn)
+            except Exception:
+                self.stats['reconnects'] += 1
+                logger.exception('Cache invalidation listener lost its connection, reconnecting in %ss', backoff)
+                self.stopped.wait(backoff)
+                backoff = min(backoff * 2, 30)
+            finally:
+                if conn is not None:
+                    conn.close()
+
+    def listen(self, conn):
+        with conn.cursor() as cursor:
+            cursor.execute('LISTEN %s' % connections[self.using].ops.quote_name(self.channel))
+
+        while not self.stopped.is_set():
+            if select.select([conn], [], [], self.poll_interval) == ([], [], []):
+                # Idle: make sure nothing was missed while we were not looking
+                self.catch_up(conn)
+                self.prune(conn)
+                continue
+
+            conn.poll()
+            while conn.notifies:
+                event = json.loads(conn.notifies.pop(0).payload)
+                if event['seq'] > self.last_seq + 1:
+                    # Something between the last applied event and this one was not delivered
+                    self.catch_up(conn)
+                self.apply(event, recovered=False)
+
+    def poll(self, conn):
+        while not self.stopped.is_set():
+            self.catch_up(conn, recovered=False)
+            self.prune(conn)
+            self.stopped.wait(self.poll_interval)
+
+    def catch_up(self, conn, recovered=True):
+        with conn.cursor() as cursor:
+            if self.last_seq is None:
+                # Caches start empty, there is nothing to invalidate from before boot
+                cursor.execute('SELECT coalesce(max(id), 0) FROM change_events')
+                self.last_seq = self.stats['last_seq'] = cursor.fetchone()[0]
+                return
+
+            cursor.execute('SELECT min(id) FROM change_events')
+            oldest = cursor.fetchone()[0]
+            if oldest is not None and oldest > self.last_seq + 1 and self.last_seq > 0:
+                # The events we missed were already pruned, drop everything
+                self.stats['resets'] += 1
+                logger.warning('Cache invalidation events %s to %s were pruned, resetting caches', self.last_seq + 1, oldest - 1)
+                self.apply({'seq': oldest - 1, 'model': None, 'action': 'reset', 'object_id': None, 'created_at': time.time()}, recovered=True)
+
+            while True:
+                # Re-read a small overlap: sequence values are not committed in order
+                cursor.execute(CATCH_UP_SQL, [self.last_seq - settings.CACHE_INVALIDATION_OVERLAP, settings.CACHE_INVALIDATION_BATCH_SIZE])
+                rows = cursor.fetchall()
+                applied = 0
+                for seq, model, action, object_id, created_at in rows:
+                    event = {
+                        'seq': seq,
+                        'model': model,
+                        'action': action,
+                        'object_id': str(object_id) if object_id is not None else None,
+                        'created_at': float(created_at),
+                    }
+                    applied += self.apply(event, recovered=recovered)
+                if len(rows) < settings.CACHE_INVALIDATION_BATCH_SIZE or not applied:
+                    break
+
+        if recovered and applied:
+            logger.warning('Recovered %s cache invalidation events missed by NOTIFY', applied)
+
+    def apply(self, event, recovered):
+        seq = event['seq']
+        if seq in self.seen_set:
+            return 0
+
+        if len(self.seen) == self.seen.maxlen:
+            self.seen_set.discard(self.seen[0])
+        self.seen.append(seq)
+        self.seen_set.add(seq)
+        self.last_seq = max(self.last_seq or 0, seq)
+
+        lag = max(time.time() - event['created_at'], 0.0)
+        self.stats['delivered'] += 1
+        self.stats['recovered'] += int(recovered)
+        self.stats['last_seq'] = self.last_seq
+        self.stats['last_lag'] = lag
+        self.stats['max_lag'] = max(self.stats['max_lag'], lag)
+        if lag > settings.CACHE_INVALIDATION_LAG_WARNING:
+            logger.warning('Cache invalidation event %s applied %.2fs after it was published', seq, lag)
+
+        # Handlers query through this thread's own Django connections, which no request cycle
+        # closes. Drop broken or expired ones around each event so a restarted database or a
+        # failed handler does not break every later event.
+        close_old_connections()
+        try:
+            dispatch(event)
+        finally:
+            close_old_connections()
+        return 1
+
+    def prune(self, conn):
+        if time.monotonic() - self.pruned_at < 3600:
+            return
+        self.pruned_at = time.monotonic()
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "DELETE FROM change_events WHERE created_at < now() - %s * interval '1 second'",
+                [settings.CHANGE_EVENTS_RETENTION],
+            )
+
+
+_listener = None
+
+
+def start_listener():
+    """
+    Start this worker's listener thread, unless ``CACHE_INVALIDATION_MODE`` is ``off``.
+    """
+    global _listener
+    if settings.CACHE_INVALIDATION_MODE == 'off' or _listener is not None:
+        return _listener
+
+    _listener = InvalidationListener(
+        mode=settings.CACHE_INVALIDATION_MODE,
+        channel=settings.CACHE_INVALIDATION_CHANNEL,
+        poll_interval=settings.CACHE_INVALIDATION_POLL_INTERVAL,
+    )
+    _listener.start()
+    return _listener
+
+
+def stats():
+    """
+    Delivery statistics of this worker's listener: events applied, events recovered by
+    catch-up instead of NOTIFY, resets, reconnects and the delivery lag in seconds.
+    """
+    if _listener is None:
+        return None
+    return dict(_listener.stats)
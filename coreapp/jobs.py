@@ -0,0 +1,263 @@
+"""
+Background jobs stored in PostgreSQL.
+
+Jobs are rows of the ``jobs`` table. ``manage.py run_job_worker`` processes, running next to
+gunicorn, claim them with ``SELECT ... FOR UPDATE SKIP LOCKED``, so concurrent workers never
+pick the same job and no outside broker is needed. Failed jobs are retried with exponential
+backoff up to ``max_attempts``, and running jobs whose worker stopped heartbeating are put back
+in the queue.
+
+Handlers are registered with ``@job``. They receive the ``Job`` and its payload as keyword
+arguments, may report progress with ``Job.report_progress`` and return a JSON serializable result.
+Payloads come from the API, a ``validate`` callable rejects the ones a handler must not run with.
+"""
+import inspect
+import logging
+import os
+import random
+import socket
+import threading
+import traceback
+from collections import namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, connection, connections
+from django.utils import timezone
+
+from .admission import DatabaseAdmissionBackend
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+JobKind = namedtuple('JobKind', ['name', 'handler', 'concurrency', 'max_attempts', 'validate'], defaults=[None])
+
+CLAIM_SQL = """
+    UPDATE jobs
+    SET status = 'running', attempts = attempts + 1, worker = %(worker)s, started_at = clock_timestamp(),
+        heartbeat_at = clock_timestamp(), progress = NULL, progress_message = ''
+    WHERE id = (
+        SELECT id
+        FROM jobs
+        WHERE status = 'queued' AND run_at <= clock_timestamp() AND kind = ANY(%(kinds)s)
+        ORDER BY priority DESC, run_at
+        LIMIT 1
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING id, kind
+"""
+
+RECOVER_SQL = """
+    UPDATE jobs
+    SET status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'queued' END,
+        finished_at = CASE WHEN attempts >= max_attempts THEN clock_timestamp() END,
+        error = 'Worker ' || worker || ' stopped heartbeating',
+        run_at = clock_timestamp()
+    WHERE status = 'running' AND heartbeat_at < clock_timestamp() - %s * interval '1 second'
+    RETURNING id
+"""
+
+_registry = {}
+
+
+def job(name, concurrency=None, max_attempts=None, validate=None):
+    """
+    Register a job handler under ``name``.
+
+    ``concurrency`` caps the jobs of this kind running at once across every worker,
+    ``max_attempts`` defaults to ``JOB_MAX_ATTEMPTS`` and ``validate`` is called with the payload
+    before the job is enqueued, raising ValueError to reject it.
+    """
+    def decorator(handler):
+        _registry[name] = JobKind(name, handler, concurrency, max_attempts, validate)
+        return handler
+    return decorator
+
+
+def registered_kinds():
+    return sorted(_registry)
+
+
+def validate_payload(kind, payload):
+    """
+    Raise ValueError unless ``kind`` is registered and its handler accepts ``payload``.
+    """
+    if kind not in _registry:
+        raise ValueError(f'Unknown job kind {kind!r}, must be one of {registered_kinds()}.')
+    if not isinstance(payload, dict):
+        raise ValueError('The payload must be an object.')
+    try:
+        inspect.signature(_registry[kind].handler).bind(None, **payload)
+    except TypeError as e:
+        raise ValueError(f'Invalid payload for {kind}: {e}')
+    if _registry[kind].validate is not None:
+        _registry[kind].validate(payload)
+
+
+def enqueue(kind, payload=None, priority=0, run_at=None, max_attempts=None):
+    payload = payload or {}
+    validate_payload(kind, payload)
+    return Job.objects.create(
+        kind=kind,
+        payload=payload,
+        priority=priority,
+        run_at=run_at or timezone.now(),
+        max_attempts=max_attempts or _registry[kind].max_attempts or settings.JOB_MAX_ATTEMPTS,
+    )
+
+
+def retry_delay(attempts):
+    """
+    Seconds before retrying a job that failed ``attempts`` times: exponential with jitter,
+    so jobs failing together do not retry together.
+    """
+    delay = min(settings.JOB_RETRY_BACKOFF * 2 ** (attempts - 1), settings.JOB_RETRY_BACKOFF_MAX)
+    return delay * random.uniform(0.5, 1)
+
+
+class Heartbeat(threading.Thread):
+    """
+    Keeps ``heartbeat_at`` of a running job fresh, so it is not taken for abandoned.
+    """
+
+    def __init__(self, job, interval):
+        super().__init__(name=f'job-heartbeat-{job.pk}', daemon=True)
+        self.job = job
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        try:
+            while not self.stopped.wait(self.interval):
+                try:
+                    Job.objects.filter(pk=self.job.pk, status=Job.RUNNING, attempts=self.job.attempts).update(heartbeat_at=timezone.now())
+                except DatabaseError:
+                    logger.warning('Could not record the heartbeat of job %s', self.job.pk, exc_info=True)
+        finally:
+            connections.close_all()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+class Worker:
+    """
+    Claims and runs jobs one at a time. Run more worker processes to run more jobs at once.
+    """
+
+    def __init__(self, kinds=None, name=None):
+        self.kinds = kinds or registered_kinds()
+        self.name = name or f'{socket.gethostname()}:{os.getpid()}'
+        self.slots = DatabaseAdmissionBackend()
+        self.stopped = threading.Event()
+
+    def stop(self):
+        self.stopped.set()
+
+    def run(self, max_jobs=None):
+        processed = 0
+        while not self.stopped.is_set() and (max_jobs is None or processed < max_jobs):
+            close_old_connections()
+            try:
+                self.recover_stale()
+                # Kept out of the rate limited requests
+                self.slots.prune()
+                ran = self.run_once() is not None
+            except DatabaseError:
+                logger.exception('Job worker %s lost its database connection', self.name)
+                connection.close()
+                ran = False
+
+            if ran:
+                processed += 1
+            else:
+                self.stopped.wait(settings.JOB_POLL_INTERVAL)
+        return processed
+
+    def run_once(self):
+        """
+        Claim and run the next due job. Returns it, or None when there was nothing to run.
+        """
+        claimed = self.claim()
+        if claimed is None:
+            return None
+
+        job, slot = claimed
+        try:
+            self.execute(job)
+        finally:
+            if slot is not None:
+                self.slots.release(f'job:{job.kind}', slot)
+        return job
+
+    def claim(self):
+        # Hold a free concurrency slot of every limited kind while claiming, keep the one of the claimed job
+        slots = {}
+        kinds = []
+        for kind in self.kinds:
+            limit = _registry[kind].concurrency if kind in _registry else None
+            if limit:
+                slot = self.slots.acquire(f'job:{kind}', limit)
+                if slot is None:
+                    continue
+                slots[kind] = slot
+            kinds.append(kind)
+
+        row = None
+        try:
+            if kinds:
+                with connection.cursor() as cursor:
+                    cursor.execute(CLAIM_SQL, {'worker': self.name, 'kinds': kinds})
+                    row = cursor.fetchone()
+        finally:
+            for kind, slot in slots.items():
+                if row is None or kind != row[1]:
+                    self.slots.release(f'job:{kind}', slot)
+
+        if row is None:
+            return None
+        return Job.objects.get(pk=row[0]), slots.get(row[1])
+
+    def execute(self, job):
+        logger.info('Running job %s (%s), attempt %s of %s', job.pk, job.kind, job.attempts, job.max_attempts)
+        heartbeat = Heartbeat(job, settings.JOB_HEARTBEAT_INTERVAL)
+        heartbeat.start()
+        try:
+            result = _registry[job.kind].handler(job, **job.payload)
+        except Exception:
+            heartbeat.stop()
+            self.fail(job, traceback.format_exc())
+        else:
+            heartbeat.stop()
+            self.succeed(job, result)
+
+    def succeed(self, job, result):
+        logger.info('Job %s (%s) succeeded', job.pk, job.kind)
+        self._finish(job, status=Job.SUCCEEDED, result=result, progress=1.0, error='', finished_at=timezone.now())
+
+    def fail(self, job, error):
+        if job.attempts < job.max_attempts:
+            delay = retry_delay(job.attempts)
+            logger.warning('Job %s (%s) failed, retrying in %.0fs:\n%s', job.pk, job.kind, delay, error)
+            self._finish(job, status=Job.QUEUED, error=error, run_at=timezone.now() + timedelta(seconds=delay))
+        else:
+            logger.error('Job %s (%s) failed after %s attempts:\n%s', job.pk, job.kind, job.attempts, error)
+            self._finish(job, status=Job.FAILED, error=error, finished_at=timezone.now())
+
+    def _finish(self, job, **fields):
+        # A job recovered from this worker in the meantime belongs to another attempt now
+        updated = Job.objects.filter(pk=job.pk, status=Job.RUNNING, attempts=job.attempts).update(**fields)
+        if updated:
+            for name, value in fields.items():
+                setattr(job, name, value)
+        else:
+            logger.warning('Job %s was recovered by another worker before it finished', job.pk)
+
+    def recover_stale(self):
+        with connection.cursor() as cursor:
+            cursor.execute(RECOVER_SQL, [settings.JOB_STALE_TIMEOUT])
+            recovered = [row[0] for row in cursor.fetchall()]
+        if recovered:
+            logger.warning('Recovered %s jobs abandoned by their worker: %s', len(recovered), recovered)
+        return recovered
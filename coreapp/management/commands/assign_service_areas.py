@@ -0,0 +1,67 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from coreapp.assignment import (
+    CsvAssignmentWriter,
+    GridIndex,
+    ParquetAssignmentWriter,
+    export_polygons,
+    is_parquet,
+    read_csv_chunks,
+    read_parquet_chunks,
+    run_assignment,
+)
+
+
+class Command(BaseCommand):
+    help = 'Assign the points of a CSV or Parquet file to the service areas that contain them.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', help='CSV or Parquet file with one point per row')
+        parser.add_argument('output', help='CSV or Parquet file to write the (key, service_area_id) pairs to')
+        parser.add_argument('--key-column', default='id', help='Column identifying each point')
+        parser.add_argument('--lng-column', default='lng', help='Longitude column')
+        parser.add_argument('--lat-column', default='lat', help='Latitude column')
+        parser.add_argument('--chunk-size', type=int, default=100000, help='Points read and assigned at a time')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Number of worker processes')
+        parser.add_argument('--cell-size', type=float, default=None, help='Grid index cell size in degrees, picked from the data by default')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+
+        polygons = export_polygons()
+        index = GridIndex.build(polygons.bboxes, options['cell_size'])
+        # The workers are forked and must not inherit the database connection
+        connections.close_all()
+        self.stdout.write(f'Exported {len(polygons)} service areas, grid of {index.shape[0]}x{index.shape[1]} cells')
+
+        columns = (options['key_column'], options['lng_column'], options['lat_column'], options['chunk_size'])
+        try:
+            if is_parquet(options['input']):
+                chunks = read_parquet_chunks(options['input'], *columns)
+            else:
+                chunks = read_csv_chunks(options['input'], *columns)
+
+            if is_parquet(options['output']):
+                writer = ParquetAssignmentWriter(options['output'], options['key_column'])
+            else:
+                writer = CsvAssignmentWriter(options['output'], options['key_column'])
+        except ImportError:
+            raise CommandError('Parquet files require pyarrow, install it with `pip install pyarrow`.')
+
+        assigned = 0
+        try:
+            for keys, service_area_ids in run_assignment(chunks, polygons, index, options['workers']):
+                writer.write(keys, service_area_ids)
+                assigned += len(keys)
+        except KeyError as e:
+            raise CommandError(f'Missing column in input file: {str(e)}')
+        finally:
+            writer.close()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {assigned} assignments to {options["output"]} in {time.monotonic() - started:.1f}s'
+        ))
@@ -0,0 +1,93 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from coreapp.geometry import normalize_area, vertex_count
+from coreapp.models import ServiceArea
+
+# Same values as the model fields derive, ST_Area on the sphere like coreapp.geometry.geodesic_area.
+# Walks the table by primary key from the last id of the previous batch, so each batch reads its own
+# rows instead of scanning past the ones already filled.
+BACKFILL_BATCH_SQL = """
+    WITH batch AS (
+        SELECT id
+        FROM service_areas
+        WHERE (%(last_id)s::uuid IS NULL OR id > %(last_id)s::uuid)
+        ORDER BY id
+        LIMIT %(batch_size)s
+    ),
+    filled AS (
+        UPDATE service_areas sa
+        SET min_lng = ST_XMin(sa.area::geometry),
+            min_lat = ST_YMin(sa.area::geometry),
+            max_lng = ST_XMax(sa.area::geometry),
+            max_lat = ST_YMax(sa.area::geometry),
+            vertex_count = ST_NPoints(sa.area::geometry),
+            area_m2 = ST_Area(sa.area, false)
+        FROM batch
+        WHERE sa.id = batch.id AND sa.vertex_count IS NULL
+        RETURNING sa.id
+    )
+    SELECT (SELECT id FROM batch ORDER BY id DESC LIMIT 1), (SELECT count(*) FROM filled)
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        'Fill the bounding box, vertex count and area columns of the service areas written before they existed, '
+        'in short batches. With --normalize, also close, repair and clean the stored geometries like new ones are.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows updated per transaction')
+        parser.add_argument('--normalize', action='store_true', help='Normalize the stored geometries as well')
+        parser.add_argument('--tolerance', type=float, default=None, help='Simplification tolerance in degrees, SERVICE_AREA_SIMPLIFY_TOLERANCE by default')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        filled = 0
+        last_id = None
+        while True:
+            # Derived columns only, the API representation is unchanged so no change is published
+            with connection.cursor() as cursor:
+                cursor.execute(BACKFILL_BATCH_SQL, {'last_id': last_id, 'batch_size': batch_size})
+                last_id, rows = cursor.fetchone()
+            filled += rows
+            if last_id is None:
+                break
+        self.stdout.write(f'Filled the geometry columns of {filled} service areas')
+
+        if options['normalize']:
+            self.normalize(batch_size, options['tolerance'])
+
+    def normalize(self, batch_size, tolerance):
+        normalized = removed = failed = 0
+        last_pk = None
+        while True:
+            queryset = ServiceArea.all_objects.order_by('pk')
+            if last_pk is not None:
+                queryset = queryset.filter(pk__gt=last_pk)
+            batch = list(queryset[:batch_size])
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+
+            with transaction.atomic():
+                for service_area in batch:
+                    try:
+                        area = normalize_area(service_area.area, tolerance)
+                    except ValueError as e:
+                        failed += 1
+                        self.stderr.write(f'Service area {service_area.pk} was left as is: {e}')
+                        continue
+
+                    if area.equals_exact(service_area.area):
+                        continue
+                    normalized += 1
+                    removed += vertex_count(service_area.area) - vertex_count(area)
+                    service_area.area = area
+                    service_area.save()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Normalized {normalized} service areas, {removed} vertices removed, {failed} could not be repaired'
+        ))
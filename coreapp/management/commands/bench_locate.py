@@ -0,0 +1,92 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from coreapp.models import Provider, ServiceArea
+
+BENCH_PROVIDER = 'Locate benchmark'
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure locate latency while the service_areas table grows. Seeds synthetic service areas '
+        'under a dedicated provider, so run it against a disposable database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--totals', default='10000,100000,1000000', help='Comma separated table sizes to measure at')
+        parser.add_argument('--queries', type=int, default=500, help='Locate queries per table size')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows inserted per batch')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--max-growth', type=float, default=None, help='Fail when the p50 at the largest size exceeds this factor of the p50 at the smallest')
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded rows')
+
+    def handle(self, *args, **options):
+        totals = sorted(int(total) for total in options['totals'].split(','))
+        rng = random.Random(options['seed'])
+        provider, _ = Provider.objects.get_or_create(
+            name=BENCH_PROVIDER,
+            defaults={'email': 'bench@example.com', 'phone_number': '0', 'language': 'en', 'currency': 'USD'},
+        )
+        centers = []
+        results = []
+
+        try:
+            seeded = 0
+            for total in totals:
+                while seeded < total:
+                    batch = min(options['batch_size'], total - seeded)
+                    ServiceArea.objects.bulk_create([self.random_area(rng, provider, centers) for _ in range(batch)])
+                    seeded += batch
+                with connection.cursor() as cursor:
+                    cursor.execute('ANALYZE service_areas')
+
+                latencies = self.measure(rng, centers, options['queries'])
+                results.append((total, latencies))
+                self.stdout.write(
+                    f'{total:>10} rows  p50 {self.percentile(latencies, 50):7.2f}ms  '
+                    f'p95 {self.percentile(latencies, 95):7.2f}ms  p99 {self.percentile(latencies, 99):7.2f}ms'
+                )
+        finally:
+            if not options['keep']:
+                ServiceArea.objects.filter(provider=provider).delete()
+                provider.delete()
+
+        if options['max_growth'] is not None and len(results) > 1:
+            growth = statistics.median(results[-1][1]) / statistics.median(results[0][1])
+            if growth > options['max_growth']:
+                raise CommandError(f'Locate p50 grew {growth:.2f}x from {results[0][0]} to {results[-1][0]} rows')
+            self.stdout.write(self.style.SUCCESS(f'Locate p50 grew {growth:.2f}x from {results[0][0]} to {results[-1][0]} rows'))
+
+    def random_area(self, rng, provider, centers):
+        lng = rng.uniform(-170, 170)
+        lat = rng.uniform(-55, 65)
+        half = rng.uniform(0.01, 0.25)
+        if len(centers) < 10000:
+            centers.append((lng, lat))
+        return ServiceArea(
+            provider=provider,
+            name='Benchmark area',
+            price=rng.randint(1000, 100000),
+            area=f'POLYGON(({lng - half} {lat - half}, {lng - half} {lat + half}, {lng + half} {lat + half}, {lng + half} {lat - half}, {lng - half} {lat - half}))',
+        )
+
+    def measure(self, rng, centers, queries):
+        latencies = []
+        for _ in range(queries):
+            # Half of the points hit a seeded area, the other half are anywhere
+            if rng.random() < 0.5:
+                lng, lat = rng.choice(centers)
+            else:
+                lng, lat = rng.uniform(-170, 170), rng.uniform(-55, 65)
+
+            started = time.perf_counter()
+            list(ServiceArea.objects.containing(lng, lat).select_related('provider'))
+            latencies.append((time.perf_counter() - started) * 1000)
+        return latencies
+
+    def percentile(self, values, percent):
+        return statistics.quantiles(values, n=100)[percent - 1]
@@ -0,0 +1,100 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# What a gunicorn worker does before serving its first request: wsgi.py sets Django up and the first
+# request loads the URLconf, which imports the views. wsgi.py itself also starts the cache invalidation
+# listener, which needs the database, so it is not imported.
+STARTUP_SCRIPT = """
+import json, resource, sys, time
+start = time.perf_counter()
+import django
+django.setup()
+from django.urls import get_resolver
+get_resolver().url_patterns
+print(json.dumps({
+    'seconds': time.perf_counter() - start,
+    'rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    'modules': len(sys.modules),
+    'drf_yasg': 'drf_yasg' in sys.modules,
+}))
+"""
+
+
+def measure_startup(api_docs, importtime=False):
+    """
+    Boot a worker in a fresh interpreter with the API_DOCS mode. Returns its startup time in seconds,
+    peak RSS in MB, number of loaded modules and whether drf_yasg was imported, and with ``importtime``
+    the ``-X importtime`` report.
+    """
+    env = dict(os.environ, API_DOCS=api_docs, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'mozio_project_django.settings'))
+    command = [sys.executable] + (['-X', 'importtime'] if importtime else []) + ['-c', STARTUP_SCRIPT]
+    process = subprocess.run(command, cwd=settings.BASE_DIR, env=env, capture_output=True, text=True)
+    if process.returncode:
+        raise CommandError(f'Startup with API_DOCS={api_docs} failed:\n{process.stderr}')
+
+    result = json.loads(process.stdout.strip().splitlines()[-1])
+    if importtime:
+        result['importtime'] = process.stderr
+    return result
+
+
+def slowest_imports(report, count):
+    # Lines look like "import time:       self [us] |  cumulative | imported package"
+    imports = []
+    for line in report.splitlines():
+        fields = line.removeprefix('import time:').split('|')
+        if len(fields) == 3 and fields[1].strip().isdigit():
+            imports.append((int(fields[1]), fields[2].rstrip()))
+    return sorted(imports, reverse=True)[:count]
+
+
+class Command(BaseCommand):
+    help = 'Measure the time and memory a worker takes to start under each API_DOCS mode, in fresh interpreters.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--modes', default='live,static', help='Comma separated API_DOCS modes to compare')
+        parser.add_argument('--runs', type=int, default=5, help='Startups measured per mode, the medians are reported')
+        parser.add_argument('--slowest-imports', type=int, default=0, help='List the imports with the largest cumulative time for each mode')
+        parser.add_argument('--max-seconds', type=float, default=None, help='Fail when a mode takes longer than this to start')
+        parser.add_argument('--max-rss', type=float, default=None, help='Fail when a mode peaks above this many MB')
+        parser.add_argument('--output', default=None, help='Append the results to this JSON lines file, to track them over time')
+
+    def handle(self, *args, **options):
+        failures = []
+        for mode in options['modes'].split(','):
+            runs = [measure_startup(mode) for _ in range(options['runs'])]
+            result = {
+                'mode': mode,
+                'seconds': statistics.median(run['seconds'] for run in runs),
+                'rss': statistics.median(run['rss'] for run in runs),
+                'modules': runs[-1]['modules'],
+                'drf_yasg': runs[-1]['drf_yasg'],
+            }
+            self.stdout.write(
+                f"API_DOCS={mode:<7} startup {result['seconds'] * 1000:7.1f}ms  RSS {result['rss']:6.1f}MB  "
+                f"{result['modules']:>5} modules  drf_yasg {'imported' if result['drf_yasg'] else 'not imported'}"
+            )
+
+            if options['slowest_imports']:
+                report = measure_startup(mode, importtime=True)['importtime']
+                for cumulative, module in slowest_imports(report, options['slowest_imports']):
+                    self.stdout.write(f'    {cumulative / 1000:8.1f}ms {module}')
+
+            if options['max_seconds'] is not None and result['seconds'] > options['max_seconds']:
+                failures.append(f"API_DOCS={mode} took {result['seconds']:.3f}s to start")
+            if options['max_rss'] is not None and result['rss'] > options['max_rss']:
+                failures.append(f"API_DOCS={mode} peaked at {result['rss']:.1f}MB")
+
+            if options['output']:
+                with open(options['output'], 'a') as f:
+                    f.write(json.dumps(dict(result, timestamp=time.time())) + '\n')
+
+        if failures:
+            raise CommandError('; '.join(failures))
@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from coreapp.snapshot import build_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Compile the service areas into the memory-mapped snapshot served by the locate endpoint.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default=settings.SERVICE_AREA_SNAPSHOT_PATH, help='Snapshot file, SERVICE_AREA_SNAPSHOT_PATH by default')
+        parser.add_argument('--cell-size', type=float, default=None, help='Grid index cell size in degrees, picked from the data by default')
+
+    def handle(self, *args, **options):
+        if not options['path']:
+            raise CommandError('Set SERVICE_AREA_SNAPSHOT_PATH or pass --path.')
+
+        version = build_snapshot(options['path'], cell_size=options['cell_size'])
+        self.stdout.write(self.style.SUCCESS(f'Wrote snapshot version {version} to {options["path"]}'))
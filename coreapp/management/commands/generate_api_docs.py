@@ -0,0 +1,87 @@
+import os
+from string import Template
+
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.templatetags.static import static
+from django.urls import reverse
+from drf_yasg.codecs import OpenAPICodecJson, OpenAPICodecYaml
+from drf_yasg.generators import OpenAPISchemaGenerator
+
+from mozio_project_django.schema import api_info
+
+# The UI assets are the ones of drf_yasg gathered by collectstatic
+SWAGGER_UI_PAGE = Template("""<!DOCTYPE html>
+<html>
+<head>
+  <meta charset="utf-8">
+  <title>$title</title>
+  <link rel="stylesheet" href="$stylesheet">
+</head>
+<body>
+  <div id="swagger-ui"></div>
+  <script src="$bundle"></script>
+  <script src="$preset"></script>
+  <script>
+    SwaggerUIBundle({
+      url: "$schema_url",
+      dom_id: "#swagger-ui",
+      presets: [SwaggerUIBundle.presets.apis, SwaggerUIStandalonePreset],
+      layout: "StandaloneLayout",
+    });
+  </script>
+</body>
+</html>
+""")
+
+REDOC_PAGE = Template("""<!DOCTYPE html>
+<html>
+<head>
+  <meta charset="utf-8">
+  <title>$title</title>
+</head>
+<body>
+  <redoc spec-url="$schema_url"></redoc>
+  <script src="$bundle"></script>
+</body>
+</html>
+""")
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate the OpenAPI schema and the Swagger UI and ReDoc pages served with API_DOCS=static. '
+        'Run it at image build time, after collectstatic.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=None, help='Directory to write the documentation to, API_DOCS_DIR by default')
+        parser.add_argument('--url', default=None, help='Base URL of the API written in the schema, the host serving it by default')
+
+    def handle(self, *args, **options):
+        output = options['output'] or settings.API_DOCS_DIR
+        os.makedirs(output, exist_ok=True)
+
+        schema = OpenAPISchemaGenerator(api_info, url=options['url']).get_schema(request=None, public=True)
+        self.write(output, 'swagger.json', OpenAPICodecJson(validators=[]).encode(schema))
+        self.write(output, 'swagger.yaml', OpenAPICodecYaml(validators=[]).encode(schema))
+
+        schema_url = reverse('schema-json', kwargs={'format': '.json'})
+        self.write(output, 'swagger.html', SWAGGER_UI_PAGE.substitute(
+            title=api_info.title,
+            stylesheet=static('drf-yasg/swagger-ui-dist/swagger-ui.css'),
+            bundle=static('drf-yasg/swagger-ui-dist/swagger-ui-bundle.js'),
+            preset=static('drf-yasg/swagger-ui-dist/swagger-ui-standalone-preset.js'),
+            schema_url=schema_url,
+        ).encode())
+        self.write(output, 'redoc.html', REDOC_PAGE.substitute(
+            title=api_info.title,
+            bundle=static('drf-yasg/redoc/redoc.min.js'),
+            schema_url=schema_url,
+        ).encode())
+
+        self.stdout.write(self.style.SUCCESS(f'API documentation with {len(schema.paths)} paths written to {output}'))
+
+    def write(self, output, filename, content):
+        with open(os.path.join(output, filename), 'wb') as f:
+            f.write(content)
@@ -0,0 +1,78 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+IS_PARTITIONED_SQL = """
+    SELECT EXISTS (
+        SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid
+        WHERE c.relname = 'service_areas' AND c.relnamespace = 'public'::regnamespace
+    )
+"""
+
+INDEXES_SQL = """
+    SELECT i.indexdef
+    FROM pg_indexes i
+    WHERE i.schemaname = 'public' AND i.tablename = 'service_areas'
+      AND i.indexname NOT IN (SELECT conname FROM pg_constraint WHERE conrelid = 'service_areas'::regclass AND contype = 'p')
+"""
+
+FOREIGN_KEYS_SQL = """
+    SELECT conname, pg_get_constraintdef(oid)
+    FROM pg_constraint
+    WHERE conrelid = 'service_areas'::regclass AND contype = 'f'
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        'Convert the service_areas table into a table hash partitioned on its region key. '
+        'Rows are copied under an exclusive lock, so run it during a maintenance window.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--partitions', type=int, default=settings.SERVICE_AREA_PARTITIONS, help='Number of hash partitions')
+
+    def handle(self, *args, **options):
+        partitions = options['partitions']
+        if partitions < 2:
+            raise CommandError('Use at least two partitions.')
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(IS_PARTITIONED_SQL)
+            if cursor.fetchone()[0]:
+                self.stdout.write('service_areas is already partitioned, nothing to do.')
+                return
+
+            cursor.execute('LOCK TABLE service_areas IN ACCESS EXCLUSIVE MODE')
+            cursor.execute(INDEXES_SQL)
+            indexes = [row[0] for row in cursor.fetchall()]
+            cursor.execute(FOREIGN_KEYS_SQL)
+            foreign_keys = cursor.fetchall()
+
+            cursor.execute(
+                'CREATE TABLE service_areas_partitioned '
+                '(LIKE service_areas INCLUDING DEFAULTS INCLUDING CONSTRAINTS) PARTITION BY HASH (region)'
+            )
+            for remainder in range(partitions):
+                cursor.execute(
+                    f'CREATE TABLE service_areas_p{remainder} PARTITION OF service_areas_partitioned '
+                    f'FOR VALUES WITH (MODULUS {partitions}, REMAINDER {remainder})'
+                )
+
+            cursor.execute('INSERT INTO service_areas_partitioned SELECT * FROM service_areas')
+            copied = cursor.rowcount
+
+            cursor.execute('DROP TABLE service_areas')
+            cursor.execute('ALTER TABLE service_areas_partitioned RENAME TO service_areas')
+            # Partitioned tables need the partition key in their primary key
+            cursor.execute('ALTER TABLE service_areas ADD CONSTRAINT service_areas_pkey PRIMARY KEY (id, region)')
+            for name, definition in foreign_keys:
+                cursor.execute(f'ALTER TABLE service_areas ADD CONSTRAINT {connection.ops.quote_name(name)} {definition}')
+            # Same names as before, so later migrations keep finding them
+            for definition in indexes:
+                cursor.execute(definition)
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE service_areas')
+
+        self.stdout.write(self.style.SUCCESS(f'Partitioned service_areas into {partitions} partitions, {copied} rows copied.'))
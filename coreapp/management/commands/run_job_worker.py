@@ -0,0 +1,32 @@
+import signal
+
+from django.core.management.base import BaseCommand, CommandError
+
+from coreapp.jobs import Worker, registered_kinds
+
+
+class Command(BaseCommand):
+    help = 'Claim and run background jobs from the jobs table until stopped.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--kinds', default=None, help='Comma separated job kinds to run, all registered kinds by default')
+        parser.add_argument('--max-jobs', type=int, default=None, help='Exit after running this many jobs')
+
+    def handle(self, *args, **options):
+        kinds = options['kinds'].split(',') if options['kinds'] else registered_kinds()
+        unknown = set(kinds) - set(registered_kinds())
+        if unknown:
+            raise CommandError(f'Unknown job kinds {sorted(unknown)}, must be among {registered_kinds()}.')
+
+        worker = Worker(kinds)
+
+        # Finish the running job before exiting
+        def stop(signum, frame):
+            self.stdout.write('Stopping after the current job')
+            worker.stop()
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        self.stdout.write(f'Worker {worker.name} running {", ".join(kinds)}')
+        processed = worker.run(max_jobs=options['max_jobs'])
+        self.stdout.write(self.style.SUCCESS(f'Worker {worker.name} ran {processed} jobs'))
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.2 on 2026-10-19 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('coreapp', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeEvent',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('model', models.CharField(max_length=50)),
+                ('action', models.CharField(max_length=20)),
+                ('object_id', models.UUIDField(null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'change_events',
+                'indexes': [models.Index(fields=['created_at'], name='change_even_created_e3dd18_idx')],
+            },
+        ),
+    ]
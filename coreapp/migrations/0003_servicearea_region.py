@@ -0,0 +1,27 @@
+# Generated by Django 5.1.2 on 2026-10-19 11:03
+
+import coreapp.models
+from django.db import migrations
+
+
+def populate_regions(apps, schema_editor):
+    from coreapp.regions import region_sql
+
+    schema_editor.execute(f"UPDATE service_areas SET region = {region_sql('area::geometry')}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('coreapp', '0002_changeevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='servicearea',
+            name='region',
+            field=coreapp.models.RegionField(default=-1),
+            preserve_default=False,
+        ),
+        migrations.RunPython(populate_regions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.2 on 2026-10-19 13:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('coreapp', '0004_versions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RateLimitBucket',
+            fields=[
+                ('key', models.CharField(max_length=255, primary_key=True, serialize=False)),
+                ('tokens', models.FloatField()),
+                ('updated_at', models.DateTimeField()),
+            ],
+            options={
+                'db_table': 'rate_limit_buckets',
+            },
+        ),
+        # Buckets are rewritten on every request and worthless after a crash, skip the WAL
+        migrations.RunSQL(
+            'ALTER TABLE rate_limit_buckets SET UNLOGGED',
+            'ALTER TABLE rate_limit_buckets SET LOGGED',
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.2 on 2026-10-19 15:02
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('coreapp', '0006_job'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddIndex(
+            model_name='provider',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='providers_name_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='provider',
+            index=models.Index(fields=['currency', 'language', 'name'], name='providers_currenc_94b521_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='provider',
+            index=models.Index(fields=['language', 'name'], name='providers_languag_9433ee_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.2 on 2026-10-19 15:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('coreapp', '0007_provider_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='provider',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.1.2 on 2026-10-19 18:12
+
+import coreapp.models
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('coreapp', '0008_provider_deleted_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='servicearea',
+            name='area_m2',
+            field=coreapp.models.GeodesicAreaField(null=True),
+        ),
+        migrations.AddField(
+            model_name='servicearea',
+            name='max_lat',
+            field=coreapp.models.BoundField(bound='max_lat', null=True),
+        ),
+        migrations.AddField(
+            model_name='servicearea',
+            name='max_lng',
+            field=coreapp.models.BoundField(bound='max_lng', null=True),
+        ),
+        migrations.AddField(
+            model_name='servicearea',
+            name='min_lat',
+            field=coreapp.models.BoundField(bound='min_lat', null=True),
+        ),
+        migrations.AddField(
+            model_name='servicearea',
+            name='min_lng',
+            field=coreapp.models.BoundField(bound='min_lng', null=True),
+        ),
+        migrations.AddField(
+            model_name='servicearea',
+            name='vertex_count',
+            field=coreapp.models.VertexCountField(null=True),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.1.2 on 2026-10-19 20:05
+
+import django.contrib.gis.db.models.fields
+import django.contrib.postgres.indexes
+import django.db.models.functions.comparison
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('coreapp', '0009_servicearea_geometry_metrics'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='servicearea',
+            index=django.contrib.postgres.indexes.GistIndex(django.db.models.functions.comparison.Cast('area', django.contrib.gis.db.models.fields.PolygonField(srid=4326)), name='service_areas_area_geom_idx'),
+        ),
+    ]
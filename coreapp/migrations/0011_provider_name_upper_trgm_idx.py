@@ -0,0 +1,23 @@
+# Generated by Django 5.1.2 on 2026-10-19 21:10
+
+import django.contrib.postgres.indexes
+import django.db.models.functions.text
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('coreapp', '0010_servicearea_area_geom_idx'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='provider',
+            name='providers_name_trgm_idx',
+        ),
+        migrations.AddIndex(
+            model_name='provider',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('name'), name='gin_trgm_ops'), name='providers_name_upper_trgm_idx'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.1.2 on 2026-10-19 23:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('coreapp', '0011_provider_name_upper_trgm_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeCounter',
+            fields=[
+                ('model', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('changes', models.BigIntegerField()),
+                ('changed_at', models.DateTimeField()),
+            ],
+            options={
+                'db_table': 'change_counters',
+            },
+        ),
+        # Start from the events still in the sequence table so the last change keeps dating the lists
+        migrations.RunSQL(
+            """
+            INSERT INTO change_counters (model, changes, changed_at)
+            SELECT model, count(*), max(created_at)
+            FROM change_events
+            GROUP BY model
+            """,
+            migrations.RunSQL.noop,
+        ),
+    ]
@@ -1,19 +1,142 @@
 from django.contrib.gis.db import models
-from django.contrib.postgres.indexes import GistIndex
+from django.contrib.postgres.indexes import GinIndex, GistIndex, OpClass
+from django.contrib.gis.geos import GEOSGeometry, Point, Polygon
+from django.db import router, transaction
+from django.db.models import F, Q, Value
+from django.db.models.functions import Cast, Upper
+from django.utils import timezone
+from .geometry import geodesic_area, vertex_count
+from .invalidation import publish
+from .regions import candidate_regions, region_for_extent
 import uuid
 
-class Provider(models.Model):
+
+class ChangePublishingQuerySet(models.QuerySet):
+    """
+    Publishes a change event for the bulk write paths, which bypass ``Model.save()`` and ``Model.delete()``.
+    """
+
+    def _publish(self, action):
+        publish(self.model._meta.model_name, action, using=self.db)
+
+    def update(self, **kwargs):
+        with transaction.atomic(using=self.db, savepoint=False):
+            rows = super().update(**kwargs)
+            if rows:
+                self._publish('update')
+        return rows
+
+    def delete(self):
+        with transaction.atomic(using=self.db, savepoint=False):
+            deleted, rows = super().delete()
+            if deleted:
+                self._publish('delete')
+        return deleted, rows
+
+    def bulk_create(self, objs, *args, **kwargs):
+        with transaction.atomic(using=self.db, savepoint=False):
+            objs = super().bulk_create(objs, *args, **kwargs)
+            if objs:
+                self._publish('create')
+        return objs
+
+
+class ChangePublishingModel(models.Model):
+    """
+    Publishes a change event for every save and delete, see ``coreapp.invalidation``.
+    """
+
+    objects = ChangePublishingQuerySet.as_manager()
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using, savepoint=False):
+            super().save(*args, **kwargs)
+            publish(self._meta.model_name, 'save', self.pk, using=using)
+
+    def delete(self, using=None, keep_parents=False):
+        using = using or router.db_for_write(type(self), instance=self)
+        pk = self.pk
+        with transaction.atomic(using=using, savepoint=False):
+            result = super().delete(using=using, keep_parents=keep_parents)
+            publish(self._meta.model_name, 'delete', pk, using=using)
+        return result
+
+
+class VersionedQuerySet(ChangePublishingQuerySet):
+
+    def update(self, **kwargs):
+        kwargs.setdefault('version', F('version') + 1)
+        kwargs.setdefault('updated_at', timezone.now())
+        return super().update(**kwargs)
+
+
+class VersionedModel(ChangePublishingModel):
+    """
+    Row version and modification time, used as validators for conditional requests.
+    """
+    version = models.PositiveIntegerField(default=1, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = VersionedQuerySet.as_manager()
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            self.version += 1
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'version', 'updated_at'}
+        super().save(*args, **kwargs)
+
+
+class ProviderQuerySet(VersionedQuerySet):
+
+    def search(self, term):
+        """
+        Providers whose name contains ``term``, or is similar to it, both served by the trigram index.
+        """
+        # name__icontains compares UPPER(name), which only an index on that expression serves. Trigram
+        # similarity ignores case, so the same index answers it.
+        return self.alias(name_upper=Upper('name')).filter(
+            models.Q(name_upper__contains=Upper(Value(term))) | models.Q(name_upper__trigram_similar=term)
+        )
+
+
+class ProviderManager(models.Manager.from_queryset(ProviderQuerySet)):
+    """
+    Hides the providers being deleted in the background.
+    """
+
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+
+class Provider(VersionedModel):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     name = models.CharField(max_length=255)
     email = models.EmailField()
     phone_number = models.CharField(max_length=20)
     language = models.CharField(max_length=50)
     currency = models.CharField(max_length=3)
+    # Set when the provider is deleted, until its service areas are purged, see coreapp.tasks.delete_provider
+    deleted_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    objects = ProviderManager()
+    all_objects = ProviderQuerySet.as_manager()
 
     class Meta:
         db_table = 'providers'
         indexes = [
             models.Index(fields=['name']),
+            GinIndex(OpClass(Upper('name'), name='gin_trgm_ops'), name='providers_name_upper_trgm_idx'),
+            # Equality filters followed by the name ordering of the list
+            models.Index(fields=['currency', 'language', 'name']),
+            models.Index(fields=['language', 'name']),
         ]
         constraints = [
             models.UniqueConstraint(fields=['name'], name='unique_provider_name')
@@ -22,20 +145,264 @@ class Provider(models.Model):
     def __str__(self):
         return self.name
 
-class ServiceArea(models.Model):
+class GeometryDerivedField:
+    """
+    Column derived from the geometry of the row on every insert and save. Mixed into a model field
+    by subclasses, which define ``derive(geometry)`` returning the column value.
+
+    ``ServiceAreaQuerySet.update()`` derives the columns of a new ``area`` as well, since queryset
+    updates bypass ``pre_save()``.
+    """
+
+    def __init__(self, *args, geometry_field='area', **kwargs):
+        self.geometry_field = geometry_field
+        kwargs['editable'] = False
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        del kwargs['editable']
+        if self.geometry_field != 'area':
+            kwargs['geometry_field'] = self.geometry_field
+        return name, path, args, kwargs
+
+    def pre_save(self, model_instance, add):
+        value = self.derive(getattr(model_instance, self.geometry_field))
+        setattr(model_instance, self.attname, value)
+        return value
+
+
+class RegionField(GeometryDerivedField, models.IntegerField):
+    """
+    Partition key of a service area, derived from its geometry on every insert and save.
+    """
+
+    def derive(self, geometry):
+        return region_for_extent(geometry.extent)
+
+
+class BoundField(GeometryDerivedField, models.FloatField):
+    """
+    One bound of the bounding box of the geometry: min_lng, min_lat, max_lng or max_lat.
+    """
+    bounds = ('min_lng', 'min_lat', 'max_lng', 'max_lat')
+
+    def __init__(self, *args, bound=None, **kwargs):
+        self.bound = bound
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        kwargs['bound'] = self.bound
+        return name, path, args, kwargs
+
+    def derive(self, geometry):
+        return geometry.extent[self.bounds.index(self.bound)]
+
+
+class VertexCountField(GeometryDerivedField, models.PositiveIntegerField):
+
+    def derive(self, geometry):
+        return vertex_count(geometry)
+
+
+class GeodesicAreaField(GeometryDerivedField, models.FloatField):
+    """
+    Area of the geometry in square metres.
+    """
+
+    def derive(self, geometry):
+        return geodesic_area(geometry)
+
+
+def area_geometry():
+    """
+    The area as a planar lng/lat geometry, served by ``service_areas_area_geom_idx``.
+
+    Bounding box filters go through it: the bounding box of a geography has great circle edges
+    bulging away from the lng/lat envelope the regions, the grid cells and the snapshot work with.
+    """
+    return Cast('area', models.PolygonField(srid=4326))
+
+
+class ServiceAreaQuerySet(VersionedQuerySet):
+
+    def update(self, **kwargs):
+        # update() skips pre_save(), derive the columns of the area here so the row stays in its region
+        if 'area' in kwargs:
+            area = kwargs['area']
+            if not isinstance(area, GEOSGeometry):
+                raise TypeError('update(area=...) takes a geometry, the columns derived from an expression would go stale.')
+            for field in self.model._meta.concrete_fields:
+                if isinstance(field, GeometryDerivedField) and field.geometry_field == 'area':
+                    kwargs.setdefault(field.attname, field.derive(area))
+        return super().update(**kwargs)
+
+    def containing(self, lng, lat):
+        """
+        Service areas containing the point.
+
+        The region filter prunes the partitions that cannot hold a match, and the bounding box
+        overlap uses the geometry GiST index. ``area__contains`` alone cannot, PostGIS casts
+        geography to geometry for ``ST_Contains``.
+        """
+        point = Point(lng, lat, srid=4326)
+        return self.alias(area_geometry=area_geometry()).filter(
+            region__in=candidate_regions(lng, lat), area_geometry__bboverlaps=point, area__contains=point,
+        )
+
+    def intersecting_bbox(self, min_lng, min_lat, max_lng, max_lat):
+        """
+        Service areas whose bounding box overlaps the bounding box.
+        """
+        bbox = Polygon.from_bbox((min_lng, min_lat, max_lng, max_lat))
+        bbox.srid = 4326
+        queryset = self.alias(area_geometry=area_geometry()).filter(area_geometry__bboverlaps=bbox)
+        regions = candidate_regions(min_lng, min_lat, max_lng, max_lat)
+        if regions is not None:
+            queryset = queryset.filter(region__in=regions)
+        return queryset
+
+
+class ServiceAreaManager(models.Manager.from_queryset(ServiceAreaQuerySet)):
+    """
+    Hides the service areas of the providers being deleted in the background.
+    """
+
+    def get_queryset(self):
+        return super().get_queryset().filter(provider__deleted_at__isnull=True)
+
+
+class ServiceArea(VersionedModel):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     provider = models.ForeignKey(Provider, on_delete=models.CASCADE, related_name='service_areas')
     name = models.CharField(max_length=255)
     price = models.BigIntegerField() # big integer to avoid operation with decimal values (Just divide by 10 when showing to the client)
     area = models.PolygonField(geography=True)
+    region = RegionField()
+    # Precomputed from the area for the planner statistics and the capacity reports. Empty on the rows
+    # written before they existed, until `manage.py backfill_service_area_geometry` runs.
+    min_lng = BoundField(bound='min_lng', null=True)
+    min_lat = BoundField(bound='min_lat', null=True)
+    max_lng = BoundField(bound='max_lng', null=True)
+    max_lat = BoundField(bound='max_lat', null=True)
+    vertex_count = VertexCountField(null=True)
+    area_m2 = GeodesicAreaField(null=True)
+
+    objects = ServiceAreaManager()
+    all_objects = ServiceAreaQuerySet.as_manager()
 
     class Meta:
         db_table = 'service_areas'
         indexes = [
             models.Index(fields=['name']),
-            GistIndex(fields=['area'])
+            GistIndex(fields=['area']),
+            GistIndex(area_geometry(), name='service_areas_area_geom_idx'),
         ]
 
 
     def __str__(self):
         return self.name
+
+
+class ChangeEvent(models.Model):
+    """
+    Change sequence of providers and service areas, written by ``coreapp.invalidation.publish``.
+    """
+    id = models.BigAutoField(primary_key=True)
+    model = models.CharField(max_length=50)
+    action = models.CharField(max_length=20)
+    object_id = models.UUIDField(null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'change_events'
+        indexes = [
+            models.Index(fields=['created_at']),
+            models.Index(fields=['model', 'id']),
+        ]
+
+
+class ChangeCounter(models.Model):
+    """
+    Number and time of the changes of each model, bumped by ``coreapp.invalidation.publish``.
+    """
+    model = models.CharField(max_length=50, primary_key=True)
+    changes = models.BigIntegerField()
+    changed_at = models.DateTimeField()
+
+    class Meta:
+        db_table = 'change_counters'
+
+
+class RateLimitBucket(models.Model):
+    """
+    Token bucket of a client, written by ``coreapp.admission.DatabaseAdmissionBackend``.
+    """
+    key = models.CharField(max_length=255, primary_key=True)
+    tokens = models.FloatField()
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        db_table = 'rate_limit_buckets'
+
+
+class Job(models.Model):
+    """
+    Background job, claimed and run by ``manage.py run_job_worker``, see ``coreapp.jobs``.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    kind = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=QUEUED)
+    priority = models.SmallIntegerField(default=0)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    run_at = models.DateTimeField(default=timezone.now)
+    progress = models.FloatField(null=True, blank=True)
+    progress_message = models.CharField(max_length=255, blank=True, default='')
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True, default='')
+    worker = models.CharField(max_length=255, blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'jobs'
+        indexes = [
+            # Claim order of the queued jobs
+            models.Index(fields=['-priority', 'run_at'], condition=Q(status='queued'), name='jobs_queued_idx'),
+            # Running jobs whose worker stopped heartbeating
+            models.Index(fields=['heartbeat_at'], condition=Q(status='running'), name='jobs_running_idx'),
+            models.Index(fields=['kind', 'status']),
+            models.Index(fields=['-created_at']),
+        ]
+
+    def __str__(self):
+        return f'{self.kind} {self.id}'
+
+    def report_progress(self, progress=None, message=''):
+        """
+        Record how far the job got, ``progress`` being a fraction between 0 and 1 or None when unknown.
+        Also counts as a heartbeat.
+        """
+        self.progress = progress
+        self.progress_message = message[:255]
+        Job.objects.filter(pk=self.pk, status=Job.RUNNING, attempts=self.attempts).update(
+            progress=self.progress,
+            progress_message=self.progress_message,
+            heartbeat_at=timezone.now(),
+        )
@@ -0,0 +1,64 @@
+"""
+Region keys used to partition the service_areas table.
+
+The world is cut into square cells of ``SERVICE_AREA_REGION_SIZE`` degrees and a service area
+belongs to the cell holding the lower-left corner of its bounding box. Areas whose bounding box
+is as wide or as tall as a cell get ``OVERSIZED_REGION``.
+
+Because an area is smaller than a cell, an area containing a point has its lower-left corner in
+the point's cell or in one of the cells to its left and below. So a point, or a bounding box,
+maps to a short list of candidate regions that lets PostgreSQL prune every other partition.
+"""
+import math
+
+from django.conf import settings
+
+OVERSIZED_REGION = -1
+
+# Region of the geometry in SQL, kept in line with region_for_extent()
+REGION_SQL = """
+    CASE
+        WHEN ST_XMax({geom}) - ST_XMin({geom}) >= {size} OR ST_YMax({geom}) - ST_YMin({geom}) >= {size} THEN -1
+        ELSE floor((ST_XMin({geom}) + 180) / {size})::integer * 1000 + floor((ST_YMin({geom}) + 90) / {size})::integer
+    END
+"""
+
+
+def _cell(lng, lat, size):
+    return math.floor((lng + 180) / size), math.floor((lat + 90) / size)
+
+
+def region_for_extent(extent):
+    min_lng, min_lat, max_lng, max_lat = extent
+    size = settings.SERVICE_AREA_REGION_SIZE
+    if max_lng - min_lng >= size or max_lat - min_lat >= size:
+        return OVERSIZED_REGION
+
+    x, y = _cell(min_lng, min_lat, size)
+    return x * 1000 + y
+
+
+def candidate_regions(min_lng, min_lat, max_lng=None, max_lat=None):
+    """
+    Regions that can hold a service area containing the point, or intersecting the bounding box.
+
+    Returns None when the box spans so many regions that filtering on them would not prune anything.
+    """
+    if max_lng is None:
+        max_lng, max_lat = min_lng, min_lat
+
+    size = settings.SERVICE_AREA_REGION_SIZE
+    min_x, min_y = _cell(min_lng, min_lat, size)
+    max_x, max_y = _cell(max_lng, max_lat, size)
+    if (max_x - min_x + 2) * (max_y - min_y + 2) > settings.SERVICE_AREA_MAX_CANDIDATE_REGIONS:
+        return None
+
+    return [OVERSIZED_REGION] + [
+        x * 1000 + y
+        for x in range(min_x - 1, max_x + 1)
+        for y in range(min_y - 1, max_y + 1)
+    ]
+
+
+def region_sql(geom):
+    return REGION_SQL.format(geom=geom, size=float(settings.SERVICE_AREA_REGION_SIZE))
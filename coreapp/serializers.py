@@ -1,5 +1,6 @@
 from rest_framework import serializers
-from .models import Provider, ServiceArea
+from .models import Job, Provider, ServiceArea
+from .jobs import enqueue, registered_kinds, validate_payload
 
 def validate_currency(value):
     valid_currencies = ['USD', 'EUR']
@@ -12,7 +13,13 @@ class ProviderSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = Provider
-        fields = '__all__'
+        exclude = ['deleted_at']
+
+    def validate_name(self, value):
+        # The name is still taken until the background deletion of its provider completes
+        if Provider.all_objects.filter(name=value, deleted_at__isnull=False).exists():
+            raise serializers.ValidationError("A provider with this name is being deleted, try again later.")
+        return value
 
     def validate_phone_number(self, value):
         if not value.isdigit():
@@ -21,6 +28,25 @@ class ProviderSerializer(serializers.ModelSerializer):
         return value
 
 
+class ProviderUpsertSerializer(ProviderSerializer):
+    """
+    ``ProviderSerializer`` rules for one row of a bulk upsert. An existing name is not an error,
+    it selects the provider to update.
+    """
+    name = serializers.CharField(max_length=255)
+
+    class Meta(ProviderSerializer.Meta):
+        fields = ['name', 'email', 'phone_number', 'language', 'currency']
+        exclude = None
+
+    def get_validators(self):
+        return []
+
+    def validate_name(self, value):
+        # Checked for the whole batch by the upsert
+        return value
+
+
 class ServiceAreaSerializer(serializers.ModelSerializer):
     def validate_area(self, value):
         """
@@ -33,4 +59,30 @@ class ServiceAreaSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = ServiceArea
+        exclude = ['region', 'min_lng', 'min_lat', 'max_lng', 'max_lat', 'vertex_count', 'area_m2']
+
+
+class JobSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = Job
         fields = '__all__'
+        read_only_fields = [
+            'status', 'attempts', 'progress', 'progress_message', 'result', 'error', 'worker',
+            'started_at', 'heartbeat_at', 'finished_at',
+        ]
+
+    def validate_kind(self, value):
+        if value not in registered_kinds():
+            raise serializers.ValidationError(f"Kind must be one of {registered_kinds()}.")
+        return value
+
+    def validate(self, attrs):
+        try:
+            validate_payload(attrs['kind'], attrs.get('payload', {}))
+        except ValueError as e:
+            raise serializers.ValidationError({'payload': str(e)})
+        return attrs
+
+    def create(self, validated_data):
+        return enqueue(**validated_data)
@@ -0,0 +1,302 @@
+"""
+Compiled, memory-mapped snapshot of the service areas.
+
+``build_snapshot`` packs the service area polygons, their bounding boxes and a grid index
+into a single versioned binary file. Every gunicorn worker maps the same file read-only, so
+the arrays are shared through the page cache instead of being parsed and held once per worker.
+
+Snapshots are replaced atomically. ``SnapshotStore`` notices a new file and swaps to it on
+the next request, without restarting the worker. A snapshot older than the last change event
+when it is loaded, or than one received later through ``coreapp.invalidation``, is not served
+until a newer one is built, and a debounced rebuild is queued.
+"""
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+import uuid
+
+import numpy as np
+from django.conf import settings
+from django.db import connection
+
+from .assignment import GridIndex, PolygonSet, assign_points
+from .models import ServiceArea
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'SASNAP\x00\x00'
+FORMAT_VERSION = 2
+
+# magic, format version, snapshot version, last change event seq, polygons, rings, coords,
+# grid width, grid height, grid items, names size, provider names size, cell size, grid origin x, grid origin y
+HEADER = struct.Struct('<8sIQqqqqqqqqqddd')
+DATA_OFFSET = 128
+ALIGNMENT = 8
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def _layout(polygons, rings, coords, grid_width, grid_height, items, names_size, provider_names_size):
+    return [
+        ('ids', np.uint8, (polygons, 16)),
+        ('provider_ids', np.uint8, (polygons, 16)),
+        ('prices', np.int64, (polygons,)),
+        ('bboxes', np.float64, (polygons, 4)),
+        ('polygon_offsets', np.int64, (polygons + 1,)),
+        ('ring_offsets', np.int64, (rings + 1,)),
+        ('coords', np.float64, (coords, 2)),
+        ('grid_offsets', np.int64, (grid_width * grid_height + 1,)),
+        ('grid_items', np.int64, (items,)),
+        ('name_offsets', np.int64, (polygons + 1,)),
+        ('names', np.uint8, (names_size,)),
+        ('provider_name_offsets', np.int64, (polygons + 1,)),
+        ('provider_names', np.uint8, (provider_names_size,)),
+    ]
+
+
+def _pack_strings(values):
+    encoded = [value.encode('utf-8') for value in values]
+    offsets = np.concatenate([[0], np.cumsum([len(value) for value in encoded], dtype=np.int64)]).astype(np.int64)
+    return offsets, np.frombuffer(b''.join(encoded), dtype=np.uint8)
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def build_snapshot(path, queryset=None, cell_size=None):
+    """
+    Compile the service areas into a snapshot file at ``path`` and return its version.
+    """
+    if queryset is None:
+        queryset = ServiceArea.objects.all()
+
+    # Read before the rows, so the snapshot is at least as new as this change
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT coalesce(max(id), 0) FROM change_events')
+        change_seq = cursor.fetchone()[0]
+
+    rows = list(queryset.order_by('id').values_list('id', 'provider_id', 'price', 'name', 'provider__name', 'area'))
+    polygons = PolygonSet.from_polygons([str(row[0]) for row in rows], [row[5] for row in rows])
+    index = GridIndex.build(polygons.bboxes, cell_size)
+    name_offsets, names = _pack_strings([row[3] for row in rows])
+    provider_name_offsets, provider_names = _pack_strings([row[4] for row in rows])
+
+    arrays = {
+        'ids': np.frombuffer(b''.join(row[0].bytes for row in rows), dtype=np.uint8),
+        'provider_ids': np.frombuffer(b''.join(row[1].bytes for row in rows), dtype=np.uint8),
+        'prices': np.asarray([row[2] for row in rows], dtype=np.int64),
+        'bboxes': polygons.bboxes,
+        'polygon_offsets': polygons.polygon_offsets,
+        'ring_offsets': polygons.ring_offsets,
+        'coords': polygons.coords,
+        'grid_offsets': index.offsets,
+        'grid_items': index.items,
+        'name_offsets': name_offsets,
+        'names': names,
+        'provider_name_offsets': provider_name_offsets,
+        'provider_names': provider_names,
+    }
+
+    version = time.time_ns()
+    counts = (
+        len(rows), len(polygons.ring_offsets) - 1, len(polygons.coords),
+        index.shape[0], index.shape[1], len(index.items), len(names), len(provider_names),
+    )
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, version, change_seq, *counts, float(index.cell_size), *map(float, index.origin))
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.snapshot-')
+    try:
+        # mkstemp creates the file 0600, the workers may run as another user than the build
+        os.fchmod(fd, 0o644)
+        with os.fdopen(fd, 'wb') as file:
+            file.write(header.ljust(DATA_OFFSET, b'\x00'))
+            offset = DATA_OFFSET
+            for name, dtype, shape in _layout(*counts):
+                data = np.ascontiguousarray(arrays[name], dtype=dtype).reshape(shape).tobytes()
+                file.write(data)
+                offset += len(data)
+                file.write(b'\x00' * (_align(offset) - offset))
+                offset = _align(offset)
+            file.flush()
+            os.fsync(file.fileno())
+        # Readers only ever see a complete file
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+    return version
+
+
+class _UUIDColumn:
+
+    def __init__(self, data):
+        self.data = data
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, index):
+        return str(uuid.UUID(bytes=self.data[index].tobytes()))
+
+
+class Snapshot:
+    """
+    Read-only view over a snapshot file. The arrays point straight into the shared mapping.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as file:
+            stat = os.fstat(file.fileno())
+            if stat.st_size < DATA_OFFSET:
+                raise SnapshotError(f'{path} is too short to be a service area snapshot')
+            self.mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.identity = (stat.st_ino, stat.st_mtime_ns)
+
+        fields = HEADER.unpack_from(self.mapping, 0)
+        magic, format_version, self.version, self.change_seq = fields[:4]
+        if magic != MAGIC or format_version != FORMAT_VERSION:
+            raise SnapshotError(f'{path} is not a version {FORMAT_VERSION} service area snapshot')
+        counts = fields[4:12]
+        cell_size, origin_x, origin_y = fields[12:]
+
+        self.arrays = {}
+        offset = DATA_OFFSET
+        for name, dtype, shape in _layout(*counts):
+            count = int(np.prod(shape))
+            try:
+                self.arrays[name] = np.frombuffer(self.mapping, dtype=dtype, count=count, offset=offset).reshape(shape)
+            except ValueError:
+                raise SnapshotError(f'{path} is truncated, {name} does not fit in the file')
+            offset = _align(offset + count * np.dtype(dtype).itemsize)
+
+        self.polygons = PolygonSet(
+            ids=_UUIDColumn(self.arrays['ids']),
+            coords=self.arrays['coords'],
+            ring_offsets=self.arrays['ring_offsets'],
+            polygon_offsets=self.arrays['polygon_offsets'],
+            bboxes=self.arrays['bboxes'],
+        )
+        self.index = GridIndex(
+            origin=np.array([origin_x, origin_y]),
+            cell_size=cell_size,
+            shape=(counts[3], counts[4]),
+            offsets=self.arrays['grid_offsets'],
+            items=self.arrays['grid_items'],
+        )
+
+    def __len__(self):
+        return len(self.polygons)
+
+    def _string(self, name, index):
+        offsets = self.arrays[f'{name}_offsets']
+        return self.arrays[f'{name}s'][offsets[index]:offsets[index + 1]].tobytes().decode('utf-8')
+
+    def locate(self, lng, lat):
+        """
+        Return the service areas containing the point, in the locate endpoint format.
+        """
+        _, polygon_matches = assign_points([lng], [lat], self.polygons, self.index)
+        return [{
+            'name': self._string('name', polygon),
+            'provider_name': self._string('provider_name', polygon),
+            'price': int(self.arrays['prices'][polygon]),
+        } for polygon in polygon_matches]
+
+
+class SnapshotStore:
+    """
+    Holds the snapshot mapped by this worker and swaps to a newer file when one appears.
+
+    The file is stat-ed at most once every ``check_interval`` seconds, so serving from the
+    snapshot costs no syscalls on the hot path.
+    """
+
+    def __init__(self, path, check_interval):
+        self.path = path
+        self.check_interval = check_interval
+        self.snapshot = None
+        self.checked_at = None
+        self.stale_seq = 0
+        self.lock = threading.Lock()
+
+    def invalidate(self, seq):
+        self.stale_seq = max(self.stale_seq, seq)
+
+    def get(self):
+        now = time.monotonic()
+        if self.checked_at is None or now - self.checked_at >= self.check_interval:
+            self.refresh(now)
+
+        snapshot = self.snapshot
+        if snapshot is None or snapshot.change_seq < self.stale_seq:
+            return None
+        return snapshot
+
+    def refresh(self, now):
+        with self.lock:
+            self.checked_at = now
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError:
+                self.snapshot = None
+                return
+
+            if self.snapshot is None or self.snapshot.identity != (stat.st_ino, stat.st_mtime_ns):
+                # The previous mapping is released once no request references it anymore
+                try:
+                    self.snapshot = Snapshot(self.path)
+                except (OSError, SnapshotError):
+                    # Served from the database until a readable snapshot replaces this one
+                    logger.exception('Service area snapshot %s cannot be read, locating from the database', self.path)
+                    self.snapshot = None
+                    return
+                self.check_change_seq()
+
+    def check_change_seq(self):
+        # The listener only hears about changes made after the worker booted, the file may be older
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT coalesce(max(id), 0) FROM change_events')
+            change_seq = cursor.fetchone()[0]
+        if self.snapshot.change_seq < change_seq:
+            logger.warning(
+                'Service area snapshot %s is older than change event %s, locating from the database until it is rebuilt',
+                self.path, change_seq,
+            )
+            self.invalidate(change_seq)
+            from .tasks import schedule_snapshot_build
+            schedule_snapshot_build()
+
+
+_stores = {}
+
+
+def get_snapshot():
+    """
+    Return the current service area snapshot, or None when snapshots are disabled or not built.
+    """
+    path = settings.SERVICE_AREA_SNAPSHOT_PATH
+    if not path:
+        return None
+
+    store = _stores.get(path)
+    if store is None:
+        store = _stores.setdefault(path, SnapshotStore(path, settings.SERVICE_AREA_SNAPSHOT_CHECK_INTERVAL))
+    return store.get()
+
+
+def invalidate_snapshots(event):
+    """
+    Stop serving snapshots built before a provider or service area change.
+    """
+    for store in list(_stores.values()):
+        store.invalidate(event['seq'])
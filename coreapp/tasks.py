@@ -0,0 +1,169 @@
+"""
+Heavy geometry work run by the background job queue, see ``coreapp.jobs``.
+"""
+import os
+import time
+import zlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .assignment import (
+    CsvAssignmentWriter,
+    GridIndex,
+    ParquetAssignmentWriter,
+    export_polygons,
+    is_parquet,
+    read_csv_chunks,
+    read_parquet_chunks,
+    run_assignment,
+)
+from .jobs import enqueue, job
+from .models import Job, Provider, ServiceArea
+from .snapshot import build_snapshot
+
+PURGE_BATCH_SQL = """
+    DELETE FROM service_areas
+    WHERE id IN (
+        SELECT id
+        FROM service_areas
+        WHERE provider_id = %s
+        LIMIT %s
+    )
+"""
+
+
+def job_file(name):
+    """
+    Path of ``name`` inside ``JOB_FILES_DIR``, the only place jobs read and write files.
+    """
+    if not settings.JOB_FILES_DIR:
+        raise ValueError('Set JOB_FILES_DIR to run jobs on files.')
+    if not isinstance(name, str) or not name:
+        raise ValueError(f'Expected a file name, not {name!r}.')
+    directory = os.path.realpath(settings.JOB_FILES_DIR)
+    path = os.path.realpath(os.path.join(directory, name))
+    if os.path.commonpath([directory, path]) != directory or path == directory:
+        raise ValueError(f'{name!r} is outside of the job files directory.')
+    return path
+
+
+@job('build_service_area_snapshot', concurrency=1)
+def build_service_area_snapshot(job, cell_size=None):
+    # Always the file the workers map, never one picked by the client
+    path = settings.SERVICE_AREA_SNAPSHOT_PATH
+    if not path:
+        raise ValueError('Set SERVICE_AREA_SNAPSHOT_PATH to build snapshots.')
+
+    return {'path': path, 'version': build_snapshot(path, cell_size=cell_size)}
+
+
+SNAPSHOT_BUILD_LOCK = zlib.crc32(b'build_service_area_snapshot') & 0x7fffffff
+
+
+def schedule_snapshot_build(event=None):
+    """
+    Queue a snapshot rebuild ``SERVICE_AREA_SNAPSHOT_REBUILD_DELAY`` seconds from now, unless one is
+    already waiting. Registered as a change event handler, so the changes of a burst share a build.
+    """
+    if not settings.SERVICE_AREA_SNAPSHOT_PATH:
+        return None
+
+    # Every worker hears every event, the lock lets a single one of them queue the build
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(%s)', [SNAPSHOT_BUILD_LOCK])
+        if Job.objects.filter(kind='build_service_area_snapshot', status=Job.QUEUED).exists():
+            return None
+        run_at = timezone.now() + timedelta(seconds=settings.SERVICE_AREA_SNAPSHOT_REBUILD_DELAY)
+        return enqueue('build_service_area_snapshot', run_at=run_at)
+
+
+@job('reindex_service_areas', concurrency=1)
+def reindex_service_areas(job):
+    # Runs in autocommit, which CONCURRENTLY requires, without blocking reads or writes
+    with connection.cursor() as cursor:
+        job.report_progress(0.0, 'Rebuilding the service area indexes')
+        cursor.execute('REINDEX TABLE CONCURRENTLY service_areas')
+        job.report_progress(0.9, 'Analyzing service_areas')
+        cursor.execute('ANALYZE service_areas')
+
+
+def validate_assignment_files(payload):
+    job_file(payload['input'])
+    job_file(payload['output'])
+
+
+@job('assign_service_areas', concurrency=2, validate=validate_assignment_files)
+def assign_service_areas(job, input, output, key_column='id', lng_column='lng', lat_column='lat', chunk_size=100000, cell_size=None):
+    """
+    ``manage.py assign_service_areas`` as a job, in the worker process. ``input`` and ``output``
+    are file names inside ``JOB_FILES_DIR``.
+    """
+    input, output = job_file(input), job_file(output)
+    polygons = export_polygons()
+    index = GridIndex.build(polygons.bboxes, cell_size)
+
+    columns = (key_column, lng_column, lat_column, chunk_size)
+    chunks = read_parquet_chunks(input, *columns) if is_parquet(input) else read_csv_chunks(input, *columns)
+    writer = ParquetAssignmentWriter(output, key_column) if is_parquet(output) else CsvAssignmentWriter(output, key_column)
+
+    assigned = 0
+    try:
+        for keys, service_area_ids in run_assignment(chunks, polygons, index):
+            writer.write(keys, service_area_ids)
+            assigned += len(keys)
+            job.report_progress(None, f'{assigned} assignments written')
+    finally:
+        writer.close()
+
+    return {'output': output, 'service_areas': len(polygons), 'assignments': assigned}
+
+
+def delete_provider(provider):
+    """
+    Delete a provider, returning the job purging its service areas, or None when it was deleted
+    right away.
+
+    A provider with more service areas than a purge batch is hidden instead, together with its
+    service areas, and deleted in the background so no long cascading delete competes with the
+    locate traffic.
+    """
+    batch_size = settings.PROVIDER_PURGE_BATCH_SIZE
+    if ServiceArea.all_objects.filter(provider=provider)[:batch_size + 1].count() <= batch_size:
+        provider.delete()
+        return None
+
+    with transaction.atomic():
+        provider.deleted_at = timezone.now()
+        # Publishes the change that drops the cached service areas of the provider
+        provider.save(update_fields=['deleted_at'])
+        return enqueue('purge_provider', {'provider_id': str(provider.pk)}, max_attempts=10)
+
+
+@job('purge_provider', concurrency=1)
+def purge_provider(job, provider_id):
+    """
+    Delete the service areas of a hidden provider in small batches, then the provider.
+    """
+    provider = Provider.all_objects.filter(pk=provider_id, deleted_at__isnull=False).first()
+    if provider is None:
+        return {'deleted': 0}
+
+    total = ServiceArea.all_objects.filter(provider_id=provider_id).count()
+    deleted = 0
+    while True:
+        # One short transaction per batch, the areas are already hidden so no change is published
+        with connection.cursor() as cursor:
+            cursor.execute(PURGE_BATCH_SQL, [provider_id, settings.PROVIDER_PURGE_BATCH_SIZE])
+            rows = cursor.rowcount
+        deleted += rows
+        job.report_progress(min(deleted / total, 1.0) if total else None, f'{deleted} of {total} service areas deleted')
+        if rows < settings.PROVIDER_PURGE_BATCH_SIZE:
+            break
+        time.sleep(settings.PROVIDER_PURGE_BATCH_DELAY)
+
+    provider.delete()
+    return {'deleted': deleted}
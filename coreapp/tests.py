@@ -1,11 +1,44 @@
+import csv
+import io
+import json
+import os
+import random
+import tempfile
+import time
+import zlib
+from contextlib import contextmanager
+from datetime import timedelta
+from unittest import mock
+
+from django.http import Http404
+from django.test import RequestFactory, SimpleTestCase, override_settings, tag
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework import status
-from rest_framework.test import APITestCase
-from .models import Provider, ServiceArea
+from rest_framework.test import APITestCase, APITransactionTestCase
+from . import invalidation
+from mozio_project_django import docs
+from .models import ChangeEvent, Provider, ServiceArea
 from .serializers import ProviderSerializer
 from .doc_payloads import service_area_update_payload_example, provider_create_payload_example, service_area_create_payload_example
 from .serializers import ServiceAreaSerializer
-from django.contrib.gis.geos import Polygon
+from django.contrib.auth.models import User
+from django.contrib.gis.geos import Point, Polygon
+from django.core.management import CommandError, call_command
+from django.core.cache import cache
+from django.utils import timezone
+from django.db.models import F
+from django.db import OperationalError, connection
+from .assignment import GridIndex, assign_points, export_polygons
+from .snapshot import build_snapshot, get_snapshot
+from .heatmap import grid_cell_count, invalidate_heatmaps
+from .regions import OVERSIZED_REGION, candidate_regions, region_for_extent
+from . import jobs
+from .admission import LocalAdmissionBackend, TokenBucketThrottle, is_query_canceled, statement_timeout
+from .models import Job, ServiceAreaQuerySet
+from .db_routing import PrimaryReplicaRouter, READ_YOUR_WRITES_COOKIE, pinned_to_primary, replica_reads
+from .management.commands.bench_startup import measure_startup
+from .geometry import normalize_area
 
 
 class ProviderAPITests(APITestCase):
@@ -290,4 +323,1565 @@ class LocateAreaTests(APITestCase):
         
         # Check that the response data matches the expected service area
         self.assertEqual(response.data[0]['name'], service_area_create_payload_example.get('name')) # Curitiba
-        self.assertEqual(response.data[0]['price'], service_area_create_payload_example.get('price')) # 10000
\ No newline at end of file
+        self.assertEqual(response.data[0]['price'], service_area_create_payload_example.get('price')) # 10000
+
+class CoverageHeatmapTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+
+        # Two providers covering the same unit square with different prices
+        for i in range(2):
+            provider = Provider.objects.create(
+                name=f'Provider {i}',
+                email=f'provider{i}@example.com',
+                phone_number=f'99983441{i}',
+                language='en',
+                currency='USD'
+            )
+            ServiceArea.objects.create(
+                provider=provider,
+                name=f'Service {i}',
+                price=(i + 1) * 100,
+                area='POLYGON((0.1 0.1, 0.1 0.9, 0.9 0.9, 0.9 0.1, 0.1 0.1))'
+            )
+
+    def test_heatmap_aggregates_cells(self):
+        """
+        Ensure each covered cell reports area and provider counts and price statistics.
+        """
+        url = reverse('service_area_heatmap')
+        response = self.client.get(url, {'bbox': '0,0,2,2', 'cell_size': 1}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['bbox'], [0, 0, 2, 2])
+
+        # Only the cell at the origin is covered
+        self.assertEqual(len(response.data['cells']), 1)
+        cell = response.data['cells'][0]
+        self.assertEqual((cell['i'], cell['j']), (0, 0))
+        self.assertEqual(cell['area_count'], 2)
+        self.assertEqual(cell['provider_count'], 2)
+        self.assertEqual(cell['price'], {'min': 100, 'median': 150, 'max': 200})
+
+    def test_heatmap_is_cached(self):
+        """
+        Ensure the same region and resolution is served from the cache.
+        """
+        url = reverse('service_area_heatmap')
+        first = self.client.get(url, {'bbox': '0,0,2,2', 'cell_size': 1, 'shape': 'hex'}, format='json')
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+
+        with self.assertNumQueries(0):
+            second = self.client.get(url, {'bbox': '0.5,0.5,1.5,1.5', 'cell_size': 1, 'shape': 'hex'}, format='json')
+
+        self.assertEqual(second.data, first.data)
+
+    def test_heatmap_reads_primary_after_change(self):
+        """
+        Ensure the heatmaps computed right after a change are read from the primary, not a replica that may lag.
+        """
+        invalidate_heatmaps({'seq': 1, 'model': 'servicearea', 'action': 'update'})
+
+        url = reverse('service_area_heatmap')
+        with mock.patch('coreapp.heatmap.router.db_for_read', return_value='replica_1'):
+            response = self.client.get(url, {'bbox': '0,0,2,2', 'cell_size': 1}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['cells']), 1)
+
+    def test_heatmap_bad_request(self):
+        """
+        Ensure invalid grid parameters are rejected.
+        """
+        url = reverse('service_area_heatmap')
+
+        response = self.client.get(url, {'bbox': '0,0,2', 'cell_size': 1}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.get(url, {'bbox': '0,0,2,2', 'cell_size': 1, 'shape': 'triangle'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.get(url, {'bbox': '-180,-90,180,90', 'cell_size': 0.001}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(HEATMAP_MAX_CELLS=80)
+    def test_hex_cell_count(self):
+        """
+        Ensure the cell limit counts hexagons as PostGIS lays them out, not as squares.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT count(*) FROM ST_HexagonGrid(1, ST_MakeEnvelope(0, 0, 10, 10, 4326))')
+            hexagons = cursor.fetchone()[0]
+        self.assertLessEqual(hexagons, grid_cell_count(10, 10, 1, 'hex'))
+
+        url = reverse('service_area_heatmap')
+        response = self.client.get(url, {'bbox': '0,0,10,10', 'cell_size': 1, 'shape': 'hex'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.get(url, {'bbox': '0,0,10,10', 'cell_size': 1}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class PointAssignmentTests(APITestCase):
+
+    def setUp(self):
+        provider = Provider.objects.create(
+            name='Provider',
+            email='provider@example.com',
+            phone_number='999834410',
+            language='en',
+            currency='USD'
+        )
+
+        areas = [
+            # Overlapping squares, a concave shape and a square with a hole
+            'POLYGON((0 0, 0 1, 1 1, 1 0, 0 0))',
+            'POLYGON((0.5 0.5, 0.5 2, 2 2, 2 0.5, 0.5 0.5))',
+            'POLYGON((3 0, 3 2, 5 2, 5 0, 4.5 0, 4.5 1.5, 3.5 1.5, 3.5 0, 3 0))',
+            'POLYGON((0 3, 0 5, 2 5, 2 3, 0 3), (0.5 3.5, 1.5 3.5, 1.5 4.5, 0.5 4.5, 0.5 3.5))',
+            Polygon(service_area_create_payload_example.get('area')),
+        ]
+        for i, area in enumerate(areas):
+            ServiceArea.objects.create(provider=provider, name=f'Service {i}', price=i * 10, area=area)
+
+    def random_points(self, count):
+        rng = random.Random(42)
+        points = [(rng.uniform(-0.5, 5.5), rng.uniform(-0.5, 5.5)) for _ in range(count)]
+        points += [(rng.uniform(-49.35, -49.15), rng.uniform(-25.5, -25.35)) for _ in range(count // 4)]
+        return points
+
+    def test_assignment_matches_postgis(self):
+        """
+        Ensure the vectorized engine assigns every point exactly like `area__contains`.
+        """
+        points = self.random_points(400)
+        polygons = export_polygons()
+        index = GridIndex.build(polygons.bboxes)
+
+        point_matches, polygon_matches = assign_points([lng for lng, _ in points], [lat for _, lat in points], polygons, index)
+        engine = {(int(point), polygons.ids[polygon]) for point, polygon in zip(point_matches, polygon_matches)}
+
+        postgis = set()
+        for i, (lng, lat) in enumerate(points):
+            for area_id in ServiceArea.objects.filter(area__contains=Point(lng, lat)).values_list('id', flat=True):
+                postgis.add((i, str(area_id)))
+
+        self.assertTrue(postgis)
+        self.assertEqual(engine, postgis)
+
+    def test_assign_command_streams_csv(self):
+        """
+        Ensure the management command writes one row per point and containing service area.
+        """
+        points = self.random_points(100)
+
+        with tempfile.TemporaryDirectory() as directory:
+            input_path = os.path.join(directory, 'points.csv')
+            output_path = os.path.join(directory, 'assignments.csv')
+            with open(input_path, 'w', newline='') as file:
+                writer = csv.writer(file)
+                writer.writerow(['trip', 'lng', 'lat'])
+                writer.writerows((f'trip-{i}', lng, lat) for i, (lng, lat) in enumerate(points))
+
+            call_command('assign_service_areas', input_path, output_path, key_column='trip', chunk_size=16, workers=1, stdout=io.StringIO())
+
+            with open(output_path, newline='') as file:
+                rows = list(csv.DictReader(file))
+
+        expected = []
+        for i, (lng, lat) in enumerate(points):
+            for area_id in ServiceArea.objects.filter(area__contains=Point(lng, lat)).values_list('id', flat=True):
+                expected.append((f'trip-{i}', str(area_id)))
+
+        self.assertEqual(sorted((row['trip'], row['service_area_id']) for row in rows), sorted(expected))
+
+    def test_assign_command_without_pyarrow(self):
+        """
+        Ensure a Parquet file without pyarrow installed is reported as a command error.
+        """
+        with tempfile.TemporaryDirectory() as directory, mock.patch.dict('sys.modules', {'pyarrow': None, 'pyarrow.parquet': None}):
+            with self.assertRaisesMessage(CommandError, 'pyarrow'):
+                call_command('assign_service_areas', os.path.join(directory, 'points.parquet'), os.path.join(directory, 'assignments.csv'), workers=1, stdout=io.StringIO())
+
+
+class ServiceAreaSnapshotTests(APITestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'service_areas.snapshot')
+
+        self.provider = Provider.objects.create(
+            name=provider_create_payload_example.get('name'),
+            email=provider_create_payload_example.get('email'),
+            phone_number=provider_create_payload_example.get('phone_number'),
+            language=provider_create_payload_example.get('language'),
+            currency=provider_create_payload_example.get('currency')
+        )
+        ServiceArea.objects.create(
+            provider=self.provider,
+            name=service_area_create_payload_example.get('name'),
+            price=service_area_create_payload_example.get('price'),
+            area=Polygon(service_area_create_payload_example.get('area'))
+        )
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def locate(self):
+        url = reverse('locate_service_areas')
+        return self.client.get(url, query_params={'lat': '-25.439479625088097', 'lng': '-49.258157079808775'}, format='json')
+
+    def test_locate_from_snapshot(self):
+        """
+        Ensure the locate endpoint answers from the snapshot without querying the database.
+        """
+        expected = self.locate().data
+        call_command('build_service_area_snapshot', path=self.path, stdout=io.StringIO())
+
+        with self.settings(SERVICE_AREA_SNAPSHOT_PATH=self.path, SERVICE_AREA_SNAPSHOT_CHECK_INTERVAL=60):
+            # Loading the file checks it against the change events once
+            self.assertIsNotNone(get_snapshot())
+            with self.assertNumQueries(0):
+                response = self.locate()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, expected)
+
+    def test_snapshot_hot_swap(self):
+        """
+        Ensure a rebuilt snapshot is picked up without restarting the worker.
+        """
+        with self.settings(SERVICE_AREA_SNAPSHOT_PATH=self.path, SERVICE_AREA_SNAPSHOT_CHECK_INTERVAL=0):
+            first_version = build_snapshot(self.path)
+            self.assertEqual(len(self.locate().data), 1)
+
+            ServiceArea.objects.create(
+                provider=self.provider,
+                name='Curitiba - Downtown',
+                price=20000,
+                area=Polygon(service_area_create_payload_example.get('area'))
+            )
+            second_version = build_snapshot(self.path)
+
+            self.assertNotEqual(first_version, second_version)
+            self.assertEqual(get_snapshot().version, second_version)
+            self.assertEqual(len(self.locate().data), 2)
+
+    def test_snapshot_older_than_changes_is_rebuilt(self):
+        """
+        Ensure a snapshot built before the last change is not served when loaded, and a single rebuild is queued.
+        """
+        build_snapshot(self.path)
+        invalidation.publish('servicearea', 'update')
+
+        with self.settings(SERVICE_AREA_SNAPSHOT_PATH=self.path, SERVICE_AREA_SNAPSHOT_CHECK_INTERVAL=0):
+            with self.assertLogs('coreapp.snapshot', level='WARNING'):
+                self.assertIsNone(get_snapshot())
+            self.assertEqual(len(self.locate().data), 1)
+            # Another change before the build runs joins the queued build
+            with self.captureOnCommitCallbacks(execute=True):
+                invalidation.publish('servicearea', 'update')
+
+            builds = Job.objects.filter(kind='build_service_area_snapshot', status=Job.QUEUED)
+            self.assertEqual(builds.count(), 1)
+            self.assertGreater(builds.get().run_at, timezone.now())
+
+            build_snapshot(self.path)
+            self.assertIsNotNone(get_snapshot())
+
+    def test_snapshot_is_world_readable(self):
+        """
+        Ensure workers running as another user than the build can map the snapshot.
+        """
+        build_snapshot(self.path)
+        self.assertEqual(os.stat(self.path).st_mode & 0o777, 0o644)
+
+    def test_corrupt_snapshot_falls_back_to_database(self):
+        """
+        Ensure an unreadable snapshot is logged and locating falls back to the database.
+        """
+        with open(self.path, 'wb') as file:
+            file.write(b'not a snapshot'.ljust(256, b'\x00'))
+
+        with self.settings(SERVICE_AREA_SNAPSHOT_PATH=self.path, SERVICE_AREA_SNAPSHOT_CHECK_INTERVAL=0):
+            with self.assertLogs('coreapp.snapshot', level='ERROR'):
+                self.assertIsNone(get_snapshot())
+            response = self.locate()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 1)
+
+
+class CacheInvalidationTests(APITestCase):
+
+    def setUp(self):
+        self.events = []
+        invalidation.register(self.events.append)
+
+    def tearDown(self):
+        invalidation._handlers.remove(self.events.append)
+
+    def test_writes_publish_change_events(self):
+        """
+        Ensure saves, deletes and bulk writes are recorded and applied once committed.
+        """
+        with self.captureOnCommitCallbacks(execute=True):
+            provider = Provider.objects.create(
+                name='Provider',
+                email='provider@example.com',
+                phone_number='999834410',
+                language='en',
+                currency='USD'
+            )
+            ServiceArea.objects.bulk_create([
+                ServiceArea(provider=provider, name=f'Service {i}', price=i, area='POLYGON((0 0, 0 1, 1 1, 1 0, 0 0))')
+                for i in range(3)
+            ])
+            ServiceArea.objects.filter(price__gt=0).update(price=10)
+            ServiceArea.objects.filter(price=10).delete()
+            provider.delete()
+
+        expected = [
+            ('provider', 'save', str(provider.id)),
+            ('servicearea', 'create', None),
+            ('servicearea', 'update', None),
+            ('servicearea', 'delete', None),
+            ('provider', 'delete', str(provider.id)),
+        ]
+        self.assertEqual([(event['model'], event['action'], event['object_id']) for event in self.events], expected)
+        self.assertEqual(list(ChangeEvent.objects.order_by('id').values_list('id', flat=True)), [event['seq'] for event in self.events])
+
+    def test_changes_invalidate_heatmap_cache(self):
+        """
+        Ensure a service area change drops the cached heatmaps.
+        """
+        provider = Provider.objects.create(name='Provider', email='provider@example.com', phone_number='999834410', language='en', currency='USD')
+        url = reverse('service_area_heatmap')
+        params = {'bbox': '0,0,2,2', 'cell_size': 1}
+        self.assertEqual(self.client.get(url, params, format='json').data['cells'], [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ServiceArea.objects.create(provider=provider, name='Service', price=100, area='POLYGON((0.1 0.1, 0.1 0.9, 0.9 0.9, 0.9 0.1, 0.1 0.1))')
+
+        self.assertEqual(len(self.client.get(url, params, format='json').data['cells']), 1)
+
+
+class InvalidationListenerTests(APITransactionTestCase):
+
+    def start_listener(self, mode):
+        listener = invalidation.InvalidationListener(mode=mode, channel='coreapp_changes', poll_interval=0.1)
+        listener.start()
+        self.addCleanup(listener.join)
+        self.addCleanup(listener.stop)
+        self.wait_for(lambda: listener.last_seq is not None)
+        return listener
+
+    def wait_for(self, condition, timeout=10):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            if time.monotonic() > deadline:
+                self.fail('Timed out waiting for the invalidation listener')
+            time.sleep(0.05)
+
+    def create_provider(self):
+        return Provider.objects.create(name='Provider', email='provider@example.com', phone_number='999834410', language='en', currency='USD')
+
+    def test_listener_receives_notifications(self):
+        """
+        Ensure committed changes reach the other workers through NOTIFY.
+        """
+        listener = self.start_listener('notify')
+        provider = self.create_provider()
+
+        self.wait_for(lambda: listener.stats['delivered'] >= 1)
+        event = ChangeEvent.objects.get(object_id=provider.id)
+        self.assertEqual(listener.stats['last_seq'], event.id)
+        self.assertIsNotNone(listener.stats['last_lag'])
+
+    def test_listener_recovers_missed_events(self):
+        """
+        Ensure events that were never notified are recovered from the change sequence table.
+        """
+        listener = self.start_listener('notify')
+        ChangeEvent.objects.create(model='servicearea', action='update')
+
+        self.wait_for(lambda: listener.stats['recovered'] >= 1)
+        self.assertEqual(listener.stats['last_seq'], ChangeEvent.objects.latest('id').id)
+
+    def test_listener_polling_mode(self):
+        """
+        Ensure the polling fallback applies changes without LISTEN/NOTIFY.
+        """
+        listener = self.start_listener('poll')
+        self.create_provider()
+
+        self.wait_for(lambda: listener.stats['delivered'] >= 1)
+        self.assertEqual(listener.stats['recovered'], 0)
+
+    def test_listener_checks_connections_around_handlers(self):
+        """
+        Ensure the listener drops its unusable database connections before and after each event.
+        """
+        listener = invalidation.InvalidationListener(mode='poll', channel='coreapp_changes', poll_interval=0.1)
+        calls = []
+        with mock.patch('coreapp.invalidation.close_old_connections', side_effect=lambda: calls.append('close')):
+            with mock.patch('coreapp.invalidation.dispatch', side_effect=lambda event: calls.append('dispatch')):
+                listener.apply({'seq': 1, 'model': 'provider', 'action': 'save', 'object_id': None, 'created_at': time.time()}, recovered=False)
+        self.assertEqual(calls, ['close', 'dispatch', 'close'])
+
+
+@override_settings(DATABASE_REPLICAS=['replica_1', 'replica_2'], REPLICA_MAX_LAG=2)
+class ReplicaRoutingTests(SimpleTestCase):
+
+    def setUp(self):
+        self.router = PrimaryReplicaRouter()
+        self.lags = {'replica_1': 0.1, 'replica_2': 0.5}
+        patcher = mock.patch('coreapp.db_routing.replica_lag', side_effect=lambda alias: self.lags[alias])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_reads_use_primary_by_default(self):
+        """
+        Ensure reads outside the read-only API actions and all writes stay on the primary.
+        """
+        self.assertEqual(self.router.db_for_read(Provider), 'default')
+        with replica_reads():
+            self.assertEqual(self.router.db_for_write(Provider), 'default')
+
+    def test_replica_reads(self):
+        """
+        Ensure eligible reads go to a replica within the lag threshold.
+        """
+        with replica_reads():
+            self.assertIn(self.router.db_for_read(ServiceArea), ['replica_1', 'replica_2'])
+
+            self.lags['replica_2'] = 10
+            self.assertEqual(self.router.db_for_read(ServiceArea), 'replica_1')
+
+            # Every replica is lagging, fall back to the primary
+            self.lags['replica_1'] = float('inf')
+            self.assertEqual(self.router.db_for_read(ServiceArea), 'default')
+
+    def test_read_your_writes_pins_primary(self):
+        """
+        Ensure a client inside its read-your-writes window reads from the primary.
+        """
+        with replica_reads(), pinned_to_primary():
+            self.assertEqual(self.router.db_for_read(ServiceArea), 'default')
+
+
+class ReadYourWritesTests(APITestCase):
+
+    def test_write_starts_read_your_writes_window(self):
+        """
+        Ensure a successful write pins the client's next reads to the primary.
+        """
+        url = reverse('provider-list')
+        response = self.client.post(url, provider_create_payload_example, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertGreater(float(response.cookies[READ_YOUR_WRITES_COOKIE].value), time.time())
+
+        response = self.client.get(url, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn(READ_YOUR_WRITES_COOKIE, response.cookies)
+
+    def test_failed_write_does_not_pin(self):
+        """
+        Ensure rejected writes do not start a read-your-writes window.
+        """
+        url = reverse('provider-list')
+        response = self.client.post(url, {'currency': 'BRL'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertNotIn(READ_YOUR_WRITES_COOKIE, response.cookies)
+
+    @override_settings(DATABASE_REPLICAS=['replica_1'])
+    def test_failed_read_leaves_replica_reads(self):
+        """
+        Ensure a read-only request that raises does not leave the following reads on the replica.
+        """
+        # The test database has no replica, the request reads from the primary as if it were lagging
+        lags = {'replica_1': float('inf')}
+        with mock.patch('coreapp.db_routing.replica_lag', side_effect=lambda alias: lags[alias]):
+            with mock.patch.object(ServiceAreaQuerySet, 'containing', side_effect=RuntimeError('Replica gone')):
+                with self.assertRaises(RuntimeError):
+                    self.client.get(reverse('locate_service_areas'), {'lat': '0.5', 'lng': '0.5'}, format='json')
+
+            lags['replica_1'] = 0
+            self.assertEqual(PrimaryReplicaRouter().db_for_read(ServiceArea), 'default')
+
+
+class ServiceAreaRegionTests(APITestCase):
+
+    def setUp(self):
+        self.provider = Provider.objects.create(
+            name='Provider',
+            email='provider@example.com',
+            phone_number='999834410',
+            language='en',
+            currency='USD'
+        )
+
+    def create_areas(self):
+        # Crosses the boundary between two 10 degree regions
+        ServiceArea.objects.create(provider=self.provider, name='Boundary', price=10, area='POLYGON((9.9 0.5, 9.9 0.7, 10.1 0.7, 10.1 0.5, 9.9 0.5))')
+        # Bigger than a region
+        ServiceArea.objects.create(provider=self.provider, name='Oversized', price=20, area='POLYGON((0 0, 0 15, 15 15, 15 0, 0 0))')
+        ServiceArea.objects.bulk_create([
+            ServiceArea(provider=self.provider, name='Far away', price=30, area='POLYGON((100 50, 100 51, 101 51, 101 50, 100 50))'),
+        ])
+
+    def locate(self, lat, lng):
+        url = reverse('locate_service_areas')
+        response = self.client.get(url, query_params={'lat': lat, 'lng': lng}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return sorted(area['name'] for area in response.data)
+
+    def test_region_is_derived_from_geometry(self):
+        """
+        Ensure every write path stores the region of the area's bounding box.
+        """
+        self.create_areas()
+        regions = dict(ServiceArea.objects.values_list('name', 'region'))
+
+        self.assertEqual(regions['Boundary'], region_for_extent((9.9, 0.5, 10.1, 0.7)))
+        self.assertEqual(regions['Oversized'], OVERSIZED_REGION)
+        self.assertEqual(regions['Far away'], region_for_extent((100, 50, 101, 51)))
+        self.assertIn(regions['Boundary'], candidate_regions(10.05, 0.6))
+
+    def test_locate_across_region_boundaries(self):
+        """
+        Ensure pruning by region never drops an area containing the point.
+        """
+        self.create_areas()
+
+        self.assertEqual(self.locate('0.6', '10.05'), ['Boundary', 'Oversized'])
+        self.assertEqual(self.locate('0.6', '9.95'), ['Boundary', 'Oversized'])
+        self.assertEqual(self.locate('50.5', '100.5'), ['Far away'])
+        self.assertEqual(self.locate('-30', '-30'), [])
+
+    def test_list_filtered_by_bbox(self):
+        """
+        Ensure the service areas list can be restricted to a bounding box.
+        """
+        self.create_areas()
+        url = reverse('service_area-list')
+
+        response = self.client.get(url, {'bbox': '10,0,11,1'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(sorted(area['name'] for area in response.data['results']), ['Boundary', 'Oversized'])
+
+        response = self.client.get(url, {'bbox': 'everywhere'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bbox_follows_the_lng_lat_envelope(self):
+        """
+        Ensure the bbox filter uses the lng/lat envelope of the areas, like the regions, and not the
+        geodetic one bulging past it.
+        """
+        # The great circle between the top corners reaches 62.5 degrees north
+        ServiceArea.objects.create(provider=self.provider, name='Wide', price=10, area='POLYGON((0 60, 40 60, 40 61, 0 61, 0 60))')
+        url = reverse('service_area-list')
+
+        response = self.client.get(url, {'bbox': '15,61.2,25,61.5'}, format='json')
+        self.assertEqual(response.data['results'], [])
+        response = self.client.get(url, {'bbox': '15,60.8,25,61.5'}, format='json')
+        self.assertEqual([area['name'] for area in response.data['results']], ['Wide'])
+
+    def test_update_derives_region(self):
+        """
+        Ensure a queryset update of the area moves the row to its new region, and refuses expressions.
+        """
+        self.create_areas()
+        ServiceArea.objects.filter(name='Far away').update(area=Polygon.from_bbox((-60.5, -30.5, -59.5, -29.5)))
+
+        self.assertEqual(ServiceArea.objects.get(name='Far away').region, region_for_extent((-60.5, -30.5, -59.5, -29.5)))
+        self.assertEqual(self.locate('-30', '-60'), ['Far away'])
+        with self.assertRaises(TypeError):
+            ServiceArea.objects.update(area=F('area'))
+
+    def test_partitioned_table(self):
+        """
+        Ensure the partitioning migration keeps the data and the queries working.
+        """
+        self.create_areas()
+        call_command('partition_service_areas', partitions=4, stdout=io.StringIO())
+
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT count(*) FROM pg_inherits WHERE inhparent = 'service_areas'::regclass")
+            self.assertEqual(cursor.fetchone()[0], 4)
+
+        self.assertEqual(ServiceArea.objects.count(), 3)
+        self.assertEqual(self.locate('0.6', '10.05'), ['Boundary', 'Oversized'])
+
+        ServiceArea.objects.create(provider=self.provider, name='After partitioning', price=40, area='POLYGON((100.2 50.2, 100.2 50.8, 100.8 50.8, 100.8 50.2, 100.2 50.2))')
+        self.assertEqual(self.locate('50.5', '100.5'), ['After partitioning', 'Far away'])
+
+        # Running it again is a no-op
+        call_command('partition_service_areas', partitions=4, stdout=io.StringIO())
+
+
+class ConditionalGetTests(APITestCase):
+
+    def setUp(self):
+        self.provider = Provider.objects.create(
+            name='Provider',
+            email='provider@example.com',
+            phone_number='999834410',
+            language='en',
+            currency='USD'
+        )
+        self.service = ServiceArea.objects.create(
+            provider=self.provider,
+            name='Service',
+            price=10,
+            area='POLYGON((0 0, 0 1, 1 1, 1 0, 0 0))'
+        )
+
+    def test_detail_not_modified(self):
+        """
+        Ensure an unchanged provider is answered with a 304 without loading the row.
+        """
+        url = reverse('provider-detail', args=[self.provider.id])
+        response = self.client.get(url, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('public', response['Cache-Control'])
+        self.assertIn('must-revalidate', response['Cache-Control'])
+        etag = response['ETag']
+
+        with self.assertNumQueries(1):
+            response = self.client.get(url, format='json', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+
+        response = self.client.get(url, format='json', headers={'If-Modified-Since': response['Last-Modified']})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.provider.language = 'pt'
+        self.provider.save()
+
+        response = self.client.get(url, format='json', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.data['version'], 2)
+
+    def test_list_not_modified(self):
+        """
+        Ensure an unchanged page of service areas is answered with a 304 without querying the rows.
+        """
+        url = reverse('service_area-list')
+        response = self.client.get(url, {'page': 1}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response['ETag']
+
+        with self.assertNumQueries(1):
+            response = self.client.get(url, {'page': 1}, format='json', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # Another page is another representation
+        response = self.client.get(url, {'page': 1, 'page_size': 5}, format='json', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        # The provider's deletion cascades to its service areas
+        self.provider.delete()
+        response = self.client.get(url, {'page': 1}, format='json', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 0)
+
+    def test_list_follows_change_counters(self):
+        """
+        Ensure a list keeps its ETag until a change to one of its models is published.
+        """
+        url = reverse('provider-list')
+        response = self.client.get(url, format='json')
+        etag = response['ETag']
+
+        response = self.client.get(url, format='json', headers={'If-Modified-Since': response['Last-Modified']})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # Service areas are not part of the provider list
+        self.service.price = 20
+        self.service.save()
+        response = self.client.get(url, format='json', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # Raw writes count once their change is published
+        with connection.cursor() as cursor:
+            cursor.execute("UPDATE providers SET language = 'pt', version = version + 1 WHERE id = %s", [self.provider.pk])
+        response = self.client.get(url, format='json', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        invalidation.publish('provider', 'update', self.provider.pk)
+        response = self.client.get(url, format='json', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'][0]['language'], 'pt')
+
+    def test_bulk_update_bumps_version(self):
+        """
+        Ensure queryset updates change the validators of the updated rows.
+        """
+        ServiceArea.objects.filter(pk=self.service.pk).update(price=20)
+        self.service.refresh_from_db()
+        self.assertEqual(self.service.version, 2)
+
+
+class AdmissionControlTests(APITestCase):
+
+    def setUp(self):
+        self.url = reverse('locate_service_areas')
+        self.params = {'lat': '-25.439479625088097', 'lng': '-49.258157079808775'}
+
+    def locate(self, address='10.0.0.1'):
+        return self.client.get(self.url, self.params, format='json', REMOTE_ADDR=address)
+
+    @override_settings(LOCATE_RATE_LIMIT=0.01, LOCATE_RATE_LIMIT_BURST=2)
+    def test_rate_limit_per_client(self):
+        """
+        Ensure a client over its burst gets a 429 without affecting other clients.
+        """
+        self.assertEqual(self.locate().status_code, status.HTTP_200_OK)
+        self.assertEqual(self.locate().status_code, status.HTTP_200_OK)
+
+        response = self.locate()
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(response.headers['Retry-After'], '100')
+
+        self.assertEqual(self.locate('10.0.0.2').status_code, status.HTTP_200_OK)
+
+    @override_settings(LOCATE_RATE_LIMIT=0.01, LOCATE_RATE_LIMIT_BURST=2)
+    def test_rate_limit_ignores_forwarded_for(self):
+        """
+        Ensure a client cannot reset its bucket with forged X-Forwarded-For headers, however long.
+        """
+        for forwarded in ('1.1.1.1', '2.2.2.2', '3' * 1000):
+            response = self.client.get(self.url, self.params, format='json', REMOTE_ADDR='10.0.0.1', HTTP_X_FORWARDED_FOR=forwarded)
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    @override_settings(LOCATE_RATE_LIMIT=0.01, LOCATE_RATE_LIMIT_BURST=2, REST_FRAMEWORK={'NUM_PROXIES': 1})
+    def test_rate_limit_behind_proxy(self):
+        """
+        Ensure behind a proxy clients are told apart by the address it appended, under a fixed-length key.
+        """
+        for forwarded in ('1.1.1.1, 10.0.0.5', '2.2.2.2, 10.0.0.5', '3' * 1000 + ', 10.0.0.5'):
+            response = self.client.get(self.url, self.params, format='json', HTTP_X_FORWARDED_FOR=forwarded)
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+        response = self.client.get(self.url, self.params, format='json', HTTP_X_FORWARDED_FOR='3' * 1000)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_rate_from_scope_settings(self):
+        """
+        Ensure throttles read their rate from the settings of their scope and are disabled without them.
+        """
+        throttle = TokenBucketThrottle()
+        throttle.scope = 'search'
+        self.assertEqual(throttle.get_rate(), (0, 1))
+
+        with override_settings(SEARCH_RATE_LIMIT=5, SEARCH_RATE_LIMIT_BURST=10):
+            self.assertEqual(throttle.get_rate(), (5, 10))
+
+    def test_local_bucket_refills(self):
+        """
+        Ensure the in-process bucket refills at the configured rate.
+        """
+        backend = LocalAdmissionBackend()
+        with mock.patch('coreapp.admission.time.monotonic', return_value=100.0) as monotonic:
+            self.assertIsNone(backend.consume('client', 2, 1))
+            self.assertAlmostEqual(backend.consume('client', 2, 1), 0.5)
+
+            monotonic.return_value = 100.5
+            self.assertIsNone(backend.consume('client', 2, 1))
+
+    @override_settings(LOCATE_MAX_CONCURRENCY=1)
+    def test_concurrency_cap_sheds_load(self):
+        """
+        Ensure requests beyond the concurrency cap of all workers are shed with a 503.
+        """
+        other_worker = connection.Database.connect(**connection.get_connection_params())
+        self.addCleanup(other_worker.close)
+        other_worker.autocommit = True
+        with other_worker.cursor() as cursor:
+            cursor.execute('SELECT pg_try_advisory_lock(%s, 0)', [zlib.crc32(b'locate') & 0x7fffffff])
+
+        response = self.locate()
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response.headers['Retry-After'], '1')
+
+        other_worker.close()
+        self.assertEqual(self.locate().status_code, status.HTTP_200_OK)
+        # The slot was released when the request finished
+        self.assertEqual(self.locate().status_code, status.HTTP_200_OK)
+
+    @override_settings(LOCATE_MAX_CONCURRENCY=1)
+    def test_bad_requests_release_their_slot(self):
+        """
+        Ensure invalid coordinates are a 400 and requests that fail release their concurrency slot.
+        """
+        for params in [{'lat': 'abc', 'lng': '1'}, {'lng': '1'}]:
+            with self.subTest(params=params):
+                response = self.client.get(self.url, params, format='json')
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+                self.assertIn('error', response.data)
+
+        with mock.patch.object(ServiceAreaQuerySet, 'containing', side_effect=RuntimeError('boom')):
+            with self.assertRaises(RuntimeError):
+                self.locate()
+        self.assertEqual(self.locate().status_code, status.HTTP_200_OK)
+
+    def test_statement_timeout(self):
+        """
+        Ensure queries running past the statement timeout are cancelled.
+        """
+        with self.assertRaises(OperationalError) as raised:
+            with statement_timeout('default', 50):
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT pg_sleep(1)')
+        self.assertTrue(is_query_canceled(raised.exception))
+
+        # The timeout does not outlive the block
+        with connection.cursor() as cursor:
+            cursor.execute('SHOW statement_timeout')
+            self.assertEqual(cursor.fetchone()[0], '0')
+
+    @override_settings(LOCATE_STATEMENT_TIMEOUT=50)
+    def test_locate_timeout_returns_503(self):
+        """
+        Ensure a runaway locate query is answered with a 503 instead of holding the worker.
+        """
+        def slow_containing(queryset, lng, lat):
+            return queryset.extra(where=['(SELECT true FROM pg_sleep(1))'])
+
+        with mock.patch.object(ServiceAreaQuerySet, 'containing', slow_containing):
+            response = self.locate()
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertIn('error', response.data)
+
+
+class JobQueueTests(APITransactionTestCase):
+
+    def setUp(self):
+        self.calls = []
+
+        def record(job, value=None):
+            job.report_progress(0.5, 'Halfway')
+            self.calls.append(value)
+            return {'value': value}
+
+        def flaky(job):
+            raise RuntimeError('Geometry service unavailable')
+
+        patcher = mock.patch.dict(jobs._registry, {
+            'record': jobs.JobKind('record', record, None, None),
+            'flaky': jobs.JobKind('flaky', flaky, None, 2),
+            'limited': jobs.JobKind('limited', record, 1, None),
+        })
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def other_worker_connection(self):
+        conn = connection.Database.connect(**connection.get_connection_params())
+        self.addCleanup(conn.close)
+        return conn
+
+    def test_worker_runs_job(self):
+        """
+        Ensure a worker claims a due job, runs it and records its result.
+        """
+        job = jobs.enqueue('record', {'value': 42})
+
+        self.assertEqual(jobs.Worker(['record']).run_once().pk, job.pk)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.SUCCEEDED)
+        self.assertEqual(job.result, {'value': 42})
+        self.assertEqual(job.attempts, 1)
+        self.assertEqual(job.progress, 1.0)
+        self.assertIsNotNone(job.finished_at)
+        self.assertEqual(self.calls, [42])
+        self.assertIsNone(jobs.Worker(['record']).run_once())
+
+    def test_invalid_payload_is_rejected(self):
+        """
+        Ensure jobs are only enqueued for registered kinds with arguments their handler accepts.
+        """
+        with self.assertRaises(ValueError):
+            jobs.enqueue('unknown')
+        with self.assertRaises(ValueError):
+            jobs.enqueue('record', {'other': 1})
+
+    def test_failed_job_is_retried_with_backoff(self):
+        """
+        Ensure a failing job is retried later and marked failed once it runs out of attempts.
+        """
+        job = jobs.enqueue('flaky')
+        worker = jobs.Worker(['flaky'])
+
+        worker.run_once()
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.QUEUED)
+        self.assertEqual(job.max_attempts, 2)
+        self.assertGreater(job.run_at, timezone.now())
+        self.assertIn('Geometry service unavailable', job.error)
+
+        # Not due yet
+        self.assertIsNone(worker.run_once())
+
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        worker.run_once()
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(job.attempts, 2)
+
+    def test_locked_jobs_are_skipped(self):
+        """
+        Ensure a job claimed by another worker is skipped instead of waited for.
+        """
+        first = jobs.enqueue('record', {'value': 1}, priority=1)
+        second = jobs.enqueue('record', {'value': 2})
+
+        other_worker = self.other_worker_connection()
+        with other_worker.cursor() as cursor:
+            cursor.execute('SELECT id FROM jobs WHERE id = %s FOR UPDATE', [first.pk])
+
+        self.assertEqual(jobs.Worker(['record']).run_once().pk, second.pk)
+        other_worker.rollback()
+        self.assertEqual(jobs.Worker(['record']).run_once().pk, first.pk)
+
+    def test_concurrency_limit(self):
+        """
+        Ensure no more jobs of a kind run at once than its concurrency limit, across workers.
+        """
+        jobs.enqueue('limited', {'value': 1})
+
+        other_worker = self.other_worker_connection()
+        other_worker.autocommit = True
+        with other_worker.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_lock(%s, 0)', [zlib.crc32(b'job:limited') & 0x7fffffff])
+
+        self.assertIsNone(jobs.Worker(['limited']).run_once())
+
+        other_worker.close()
+        self.assertIsNotNone(jobs.Worker(['limited']).run_once())
+
+    def test_abandoned_jobs_are_recovered(self):
+        """
+        Ensure jobs whose worker stopped heartbeating are queued again, or failed without attempts left.
+        """
+        stale = timezone.now() - timedelta(hours=1)
+        retried = Job.objects.create(kind='record', status=Job.RUNNING, attempts=1, worker='gone:1', heartbeat_at=stale)
+        exhausted = Job.objects.create(kind='record', status=Job.RUNNING, attempts=3, worker='gone:2', heartbeat_at=stale)
+        alive = Job.objects.create(kind='record', status=Job.RUNNING, attempts=1, worker='alive:1', heartbeat_at=timezone.now())
+
+        self.assertCountEqual(jobs.Worker(['record']).recover_stale(), [retried.pk, exhausted.pk])
+
+        statuses = dict(Job.objects.values_list('id', 'status'))
+        self.assertEqual(statuses[retried.pk], Job.QUEUED)
+        self.assertEqual(statuses[exhausted.pk], Job.FAILED)
+        self.assertEqual(statuses[alive.pk], Job.RUNNING)
+
+    def test_status_api(self):
+        """
+        Ensure jobs can be enqueued and followed through the API.
+        """
+        url = reverse('job-list')
+        self.client.force_authenticate(User.objects.create_user('staff', is_staff=True))
+        response = self.client.post(url, {'kind': 'unknown'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('kind', response.data)
+
+        response = self.client.post(url, {'kind': 'record', 'payload': {'value': 7}}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['status'], Job.QUEUED)
+
+        jobs.Worker(['record']).run_once()
+
+        response = self.client.get(reverse('job-detail', args=[response.data['id']]), format='json')
+        self.assertEqual(response.data['status'], Job.SUCCEEDED)
+        self.assertEqual(response.data['result'], {'value': 7})
+
+        response = self.client.get(url, {'status': Job.QUEUED}, format='json')
+        self.assertEqual(response.data['count'], 0)
+
+    def test_api_requires_staff(self):
+        """
+        Ensure anonymous and non-staff clients can neither enqueue nor list jobs.
+        """
+        url = reverse('job-list')
+        payload = {'kind': 'record', 'payload': {'value': 7}}
+        self.assertEqual(self.client.post(url, payload, format='json').status_code, status.HTTP_403_FORBIDDEN)
+
+        self.client.force_authenticate(User.objects.create_user('client'))
+        self.assertEqual(self.client.post(url, payload, format='json').status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(self.client.get(url, format='json').status_code, status.HTTP_403_FORBIDDEN)
+        self.assertFalse(Job.objects.exists())
+
+    def test_job_files_stay_in_their_directory(self):
+        """
+        Ensure jobs cannot read or write files outside of JOB_FILES_DIR.
+        """
+        with tempfile.TemporaryDirectory() as directory, self.settings(JOB_FILES_DIR=directory):
+            for payload in [
+                {'input': '/etc/passwd', 'output': 'assignments.csv'},
+                {'input': 'points.csv', 'output': '../assignments.csv'},
+                {'input': 'points.csv', 'output': 7},
+            ]:
+                with self.subTest(payload=payload), self.assertRaises(ValueError):
+                    jobs.enqueue('assign_service_areas', payload)
+
+            job = jobs.enqueue('assign_service_areas', {'input': 'points.csv', 'output': 'out/assignments.csv'})
+            self.assertEqual(job.payload['input'], 'points.csv')
+
+        with self.assertRaises(ValueError):
+            jobs.enqueue('build_service_area_snapshot', {'path': '/etc/cron.d/snapshot'})
+
+
+class ProviderSearchTests(APITestCase):
+
+    def setUp(self):
+        for name, currency, language in [
+            ('Curitiba', 'BRL', 'pt'),
+            ('TransRio', 'BRL', 'pt'),
+            ('Translink', 'USD', 'en'),
+            ('Berlin Cabs', 'EUR', 'de'),
+            ('Airport Express', 'USD', 'en'),
+        ]:
+            Provider.objects.create(name=name, email='provider@example.com', phone_number='999834410', language=language, currency=currency)
+        self.url = reverse('provider-list')
+
+    def names(self, params):
+        response = self.client.get(self.url, params, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [provider['name'] for provider in response.data['results']]
+
+    def test_search_by_name(self):
+        """
+        Ensure providers are found by a substring of their name, or a misspelling of it.
+        """
+        self.assertCountEqual(self.names({'search': 'trans'}), ['TransRio', 'Translink'])
+        self.assertEqual(self.names({'search': 'Curitba'}), ['Curitiba'])
+
+    def test_filters_and_ordering(self):
+        """
+        Ensure the currency and language filters and the ordering options apply to the paginated list.
+        """
+        self.assertEqual(self.names({'currency': 'USD', 'language': 'en'}), ['Airport Express', 'Translink'])
+        self.assertEqual(self.names({'language': 'pt', 'ordering': '-name'}), ['TransRio', 'Curitiba'])
+        self.assertEqual(self.names({'ordering': 'currency'})[:2], ['Curitiba', 'TransRio'])
+
+        response = self.client.get(self.url, {'currency': 'BRL', 'page_size': 1}, format='json')
+        self.assertEqual(response.data['count'], 2)
+
+        response = self.client.get(self.url, {'ordering': 'email'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('ordering', response.data)
+
+    def test_search_and_filters_use_indexes(self):
+        """
+        Ensure the search and filters are planned on their indexes rather than a scan of the table.
+        """
+        with connection.cursor() as cursor:
+            # The test table is tiny, make the planner show which index it would use on a large one
+            cursor.execute('SET LOCAL enable_seqscan = off')
+
+        self.assertIn('providers_name_upper_trgm_idx', Provider.objects.search('trans').explain())
+        self.assertIn('providers_name_upper_trgm_idx', Provider.objects.search('Curitba').explain())
+        self.assertIn('providers_currenc_94b521_idx', Provider.objects.filter(currency='USD', language='en').order_by('name').explain())
+        self.assertIn('providers_languag_9433ee_idx', Provider.objects.filter(language='en').order_by('name').explain())
+
+
+class ProviderBulkUpsertTests(APITestCase):
+
+    def setUp(self):
+        self.url = reverse('provider-bulk')
+        self.existing = Provider.objects.create(name='Existing', email='old@example.com', phone_number='999834410', language='en', currency='USD')
+        self.untouched = Provider.objects.create(name='Untouched', email='same@example.com', phone_number='999834411', language='en', currency='EUR')
+
+    def row(self, name, **fields):
+        return {'name': name, 'email': f'{name.lower()}@example.com', 'phone_number': '999834412', 'language': 'en', 'currency': 'USD', **fields}
+
+    def test_bulk_upsert(self):
+        """
+        Ensure a batch creates new providers, updates existing ones by name and reports each row.
+        """
+        rows = [
+            self.row('New'),
+            self.row('Existing', email='new@example.com'),
+            {'name': 'Untouched', 'email': 'same@example.com', 'phone_number': '999834411', 'language': 'en', 'currency': 'EUR'},
+            self.row('Bad currency', currency='BRL'),
+            self.row('Bad phone', phone_number='99-98'),
+            'not an object',
+        ]
+        response = self.client.post(self.url, rows, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        results = response.data['results']
+        self.assertEqual([result['status'] for result in results], ['created', 'updated', 'unchanged', 'failed', 'failed', 'failed'])
+        self.assertEqual([result['index'] for result in results], list(range(6)))
+        self.assertIn('currency', results[3]['errors'])
+        self.assertIn('phone_number', results[4]['errors'])
+        self.assertEqual(
+            {key: response.data[key] for key in ('created', 'updated', 'unchanged', 'failed')},
+            {'created': 1, 'updated': 1, 'unchanged': 1, 'failed': 3},
+        )
+
+        self.assertEqual(str(Provider.objects.get(name='New').id), results[0]['id'])
+        self.existing.refresh_from_db()
+        self.assertEqual(self.existing.email, 'new@example.com')
+        self.assertEqual(self.existing.version, 2)
+        self.untouched.refresh_from_db()
+        self.assertEqual(self.untouched.version, 1)
+        self.assertEqual(results[2]['id'], str(self.untouched.id))
+
+    def test_duplicate_names_in_batch(self):
+        """
+        Ensure the last row of a name repeated within the batch wins.
+        """
+        response = self.client.post(self.url, [self.row('Twice', language='pt'), self.row('Twice', language='es')], format='json')
+        self.assertEqual([result['status'] for result in response.data['results']], ['failed', 'created'])
+        self.assertEqual(Provider.objects.get(name='Twice').language, 'es')
+
+    def test_rows_written_in_name_order(self):
+        """
+        Ensure the rows are upserted in name order, whatever the order of the batch, with results in batch order.
+        """
+        names = ['Zeta', 'Existing', 'Alpha', 'Mu']
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, [self.row(name) for name in names], format='json')
+        self.assertEqual([result['name'] for result in response.data['results']], names)
+
+        upsert = next(query['sql'] for query in queries if 'INSERT INTO providers' in query['sql'])
+        self.assertEqual(sorted(names, key=upsert.index), sorted(names))
+
+    def test_large_batch_single_request(self):
+        """
+        Ensure a large sync is written in a single statement.
+        """
+        rows = [self.row(f'Provider {i}') for i in range(5000)]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, rows, format='json')
+        self.assertEqual(response.data['created'], 5000)
+        self.assertEqual(len([query for query in queries if 'INSERT INTO providers' in query['sql']]), 1)
+        self.assertEqual(Provider.objects.count(), 5002)
+
+    def test_rejects_non_list(self):
+        """
+        Ensure a body other than a list of providers is rejected.
+        """
+        response = self.client.post(self.url, self.row('Single'), format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('error', response.data)
+
+
+@override_settings(PROVIDER_PURGE_BATCH_SIZE=2, PROVIDER_PURGE_BATCH_DELAY=0)
+class ProviderBackgroundDeletionTests(APITestCase):
+
+    def setUp(self):
+        self.provider = Provider.objects.create(name='Large', email='large@example.com', phone_number='999834410', language='en', currency='USD')
+        self.other = Provider.objects.create(name='Other', email='other@example.com', phone_number='999834411', language='en', currency='USD')
+        area = Polygon(service_area_create_payload_example.get('area'))
+        for i in range(5):
+            ServiceArea.objects.create(provider=self.provider, name=f'Area {i}', price=100, area=area)
+        ServiceArea.objects.create(provider=self.other, name='Other area', price=200, area=area)
+        self.locate_params = {'lat': '-25.439479625088097', 'lng': '-49.258157079808775'}
+
+    def delete(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.delete(reverse('provider-detail', args=[self.provider.id]), format='json')
+
+    def test_provider_hidden_immediately(self):
+        """
+        Ensure a provider with many service areas and its areas disappear as soon as the delete is accepted.
+        """
+        heatmap_params = {'bbox': '-49.4,-25.6,-49.1,-25.3', 'cell_size': 0.5}
+        response = self.client.get(reverse('service_area_heatmap'), heatmap_params, format='json')
+        self.assertEqual(response.data['cells'][0]['provider_count'], 2)
+
+        response = self.delete()
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertTrue(Job.objects.filter(pk=response.data['job'], kind='purge_provider').exists())
+
+        # Nothing was deleted yet
+        self.assertEqual(ServiceArea.all_objects.count(), 6)
+
+        response = self.client.get(reverse('provider-detail', args=[self.provider.id]), format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.get(reverse('provider-list'), format='json').data['count'], 1)
+        self.assertEqual(self.client.get(reverse('service_area-list'), format='json').data['count'], 1)
+
+        response = self.client.get(reverse('locate_service_areas'), self.locate_params, format='json')
+        self.assertEqual([area['provider_name'] for area in response.data], ['Other'])
+
+        response = self.client.get(reverse('service_area_heatmap'), heatmap_params, format='json')
+        self.assertEqual(response.data['cells'][0]['provider_count'], 1)
+
+    def test_service_areas_purged_in_batches(self):
+        """
+        Ensure the background job deletes the service areas in batches, then the provider.
+        """
+        job_id = self.delete().data['job']
+
+        jobs.Worker(['purge_provider']).run_once()
+
+        job = Job.objects.get(pk=job_id)
+        self.assertEqual(job.status, Job.SUCCEEDED)
+        self.assertEqual(job.result, {'deleted': 5})
+        self.assertFalse(Provider.all_objects.filter(pk=self.provider.pk).exists())
+        self.assertEqual(list(ServiceArea.all_objects.values_list('name', flat=True)), ['Other area'])
+
+    def test_name_reserved_until_purged(self):
+        """
+        Ensure the name of a provider being deleted cannot be reused before it is purged.
+        """
+        self.delete()
+        payload = {**provider_create_payload_example, 'name': 'Large'}
+
+        response = self.client.post(reverse('provider-list'), payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('name', response.data)
+
+        response = self.client.post(reverse('provider-bulk'), [payload], format='json')
+        self.assertEqual(response.data['results'][0]['status'], 'failed')
+
+
+class ApiDocsTests(APITestCase):
+
+    def test_live_schema(self):
+        """
+        Ensure the live schema carries the documentation of the views.
+        """
+        response = self.client.get(reverse('schema-json', kwargs={'format': '.json'}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        schema = json.loads(response.content)
+        self.assertEqual(schema['paths']['/providers/']['get']['summary'], 'List all providers')
+
+    def test_generate_static_docs(self):
+        """
+        Ensure generate_api_docs writes the documented schema and the pages loading it.
+        """
+        with tempfile.TemporaryDirectory() as output:
+            call_command('generate_api_docs', output=output, stdout=io.StringIO())
+
+            with open(os.path.join(output, 'swagger.json')) as f:
+                schema = json.load(f)
+            self.assertEqual(schema['paths']['/providers/bulk/']['post']['summary'], 'Create or update providers in bulk')
+            self.assertEqual(schema['basePath'], '/api/v1')
+            self.assertIn('/service-areas/polygons', schema['paths'])
+            self.assertTrue(os.path.exists(os.path.join(output, 'swagger.yaml')))
+            for page in ('swagger.html', 'redoc.html'):
+                with open(os.path.join(output, page)) as f:
+                    self.assertIn(reverse('schema-json', kwargs={'format': '.json'}), f.read())
+
+    def test_serve_static_docs(self):
+        """
+        Ensure the static mode serves the built documentation, and a 404 until it is built.
+        """
+        with tempfile.TemporaryDirectory() as output, override_settings(API_DOCS_DIR=output):
+            request = RequestFactory().get('/swagger.json/')
+            with self.assertRaises(Http404):
+                docs.static_schema(request, format='.json')
+
+            with open(os.path.join(output, 'swagger.json'), 'w') as f:
+                f.write('{"swagger": "2.0"}')
+            response = docs.static_schema(request, format='.json')
+            self.assertEqual(response['Content-Type'], 'application/json')
+            self.assertEqual(b''.join(response.streaming_content), b'{"swagger": "2.0"}')
+            response.close()
+
+            with self.assertRaises(Http404):
+                docs.static_schema(request, format='.xml')
+
+    def test_static_mode_skips_drf_yasg(self):
+        """
+        Ensure workers in static mode load the URLconf and views without importing drf_yasg.
+        """
+        self.assertFalse(measure_startup('static')['drf_yasg'])
+        self.assertFalse(measure_startup('off')['drf_yasg'])
+        self.assertTrue(measure_startup('live')['drf_yasg'])
+
+
+class GeometryNormalizationTests(APITestCase):
+
+    def setUp(self):
+        self.provider = Provider.objects.create(**provider_create_payload_example)
+
+    def test_ring_closed_and_deduplicated(self):
+        """
+        Ensure open rings are closed, repeated points dropped and the exterior ring made counterclockwise.
+        """
+        area = normalize_area([[0, 0], [0, 1], [0, 1], [1, 1], [1, 0]])
+        self.assertEqual(area.coords, (((0, 0), (1, 0), (1, 1), (0, 1), (0, 0)),))
+        self.assertEqual(area.srid, 4326)
+
+    def test_invalid_area_repaired(self):
+        """
+        Ensure a ring with a spike is repaired into the valid polygon it outlines.
+        """
+        area = normalize_area([[0, 0], [2, 0], [2, 2], [1, 2], [1, 3], [1, 2], [0, 2]])
+        self.assertTrue(area.valid)
+        self.assertEqual(area.area, 4)
+
+    def test_self_crossing_area_rejected(self):
+        """
+        Ensure an area crossing itself into two polygons is rejected, on the API too.
+        """
+        bowtie = [[0, 0], [1, 1], [1, 0], [0, 1]]
+        with self.assertRaises(ValueError):
+            normalize_area(bowtie)
+        with self.assertRaises(ValueError):
+            normalize_area([[0, 0], [1, 1], [0, 0]])
+
+        payload = {**service_area_create_payload_example, 'provider': str(self.provider.id), 'area': bowtie}
+        response = self.client.post(reverse('service_area-list'), payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_simplify_within_tolerance(self):
+        """
+        Ensure vertices within the tolerance are removed, only when simplification is enabled.
+        """
+        ring = [[0, 0], [1, 0.00001], [2, 0], [2, 2], [0, 2]]
+        self.assertEqual(normalize_area(ring, tolerance=0).num_coords, 6)
+        self.assertEqual(normalize_area(ring, tolerance=0.001).num_coords, 5)
+
+    def test_create_stores_geometry_columns(self):
+        """
+        Ensure created service areas store the normalized area, its bounding box, vertex count and area.
+        """
+        open_ring = service_area_create_payload_example['area'][:-1]
+        payload = {**service_area_create_payload_example, 'provider': str(self.provider.id), 'area': open_ring}
+        response = self.client.post(reverse('service_area-list'), payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertNotIn('vertex_count', response.data)
+
+        service_area = ServiceArea.objects.get(pk=response.data['id'])
+        self.assertEqual(service_area.vertex_count, 6)
+        self.assertTrue(service_area.area.exterior_ring.is_counterclockwise)
+        self.assertEqual(
+            (service_area.min_lng, service_area.min_lat, service_area.max_lng, service_area.max_lat),
+            Polygon(open_ring + open_ring[:1]).extent,
+        )
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT ST_Area(area, false) FROM service_areas WHERE id = %s', [service_area.pk])
+            self.assertAlmostEqual(service_area.area_m2 / cursor.fetchone()[0], 1, places=6)
+
+    def test_backfill(self):
+        """
+        Ensure the backfill fills the geometry columns of existing rows and normalizes their geometry.
+        """
+        service_area = ServiceArea.objects.create(
+            provider=self.provider,
+            name='Unnormalized',
+            price=100,
+            area=Polygon(((0, 0), (0, 1), (0, 1), (1, 1), (1, 0), (0, 0))),
+        )
+        expected = ServiceArea.objects.values_list('min_lng', 'max_lat', 'area_m2').get(pk=service_area.pk)
+
+        for i in range(2):
+            ServiceArea.objects.create(provider=self.provider, name=f'Square {i}', price=100, area=Polygon.from_bbox((i, 0, i + 1, 1)))
+        ServiceArea.all_objects.update(min_lng=None, min_lat=None, max_lng=None, max_lat=None, vertex_count=None, area_m2=None)
+
+        out = io.StringIO()
+        call_command('backfill_service_area_geometry', batch_size=2, stdout=out)
+        self.assertIn(f'Filled the geometry columns of {ServiceArea.all_objects.count()} service areas', out.getvalue())
+        self.assertFalse(ServiceArea.all_objects.filter(vertex_count__isnull=True).exists())
+        service_area.refresh_from_db()
+        self.assertEqual(service_area.vertex_count, 6)
+        self.assertEqual((service_area.min_lng, service_area.max_lat), expected[:2])
+        self.assertAlmostEqual(service_area.area_m2 / expected[2], 1, places=6)
+
+        call_command('backfill_service_area_geometry', normalize=True, stdout=io.StringIO())
+        service_area.refresh_from_db()
+        self.assertEqual(service_area.vertex_count, 5)
+        self.assertTrue(service_area.area.exterior_ring.is_counterclockwise)
+
+
+# Latency baselines of PerformanceRegressionTests, recorded with `make perf-baseline`
+PERF_BASELINE_PATH = os.getenv('PERF_BASELINE_PATH', os.path.join(os.path.dirname(__file__), 'perf_baseline.json'))
+PERF_RECORD_BASELINE = bool(os.getenv('PERF_RECORD_BASELINE'))
+# Fraction of the baseline a median may exceed it by, CI machines are noisy
+PERF_LATENCY_TOLERANCE = float(os.getenv('PERF_LATENCY_TOLERANCE', 1.0))
+# A missing baseline skips the latency checks locally and fails them on CI
+PERF_REQUIRE_BASELINE = bool(os.getenv('CI'))
+
+
+def format_queries(queries):
+    return '\n'.join(f"{i}. ({query['time']}s) {query['sql']}" for i, query in enumerate(queries, start=1))
+
+
+@tag('perf')
+class PerformanceRegressionTests(APITestCase):
+    """
+    Query counts, index usage and latency of the API endpoints over realistic table sizes. Tagged
+    ``perf`` and left out of ``make test``, run them with ``make test-perf``.
+    """
+    providers = 5000
+    service_areas = 20000
+    # Queries per request. Locate also counts its rate limit bucket, concurrency slot and statement
+    # timeout, and the test transaction adds a savepoint around it.
+    query_budgets = {
+        'provider-list': 3,
+        'provider-retrieve': 2,
+        'provider-create': 4,
+        'provider-update': 5,
+        'service_area-list': 3,
+        'service_area-list-bbox': 3,
+        'service_area-retrieve': 2,
+        'service_area-create': 3,
+        'service_area-update': 4,
+        'locate': 7,
+    }
+    latency_runs = 15
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(42)
+        providers = Provider.objects.bulk_create([
+            Provider(
+                name=f'Provider {i:05}',
+                email=f'provider{i}@example.com',
+                phone_number=f'{999000000 + i}',
+                language=rng.choice(['en', 'es', 'pt']),
+                currency=rng.choice(['USD', 'EUR']),
+            )
+            for i in range(cls.providers)
+        ])
+        cls.provider = providers[0]
+
+        areas = []
+        for i in range(cls.service_areas):
+            lng, lat, half = rng.uniform(-170, 170), rng.uniform(-55, 65), rng.uniform(0.01, 0.25)
+            areas.append(ServiceArea(
+                provider=providers[i % len(providers)],
+                name=f'Area {i}',
+                price=rng.randint(1000, 100000),
+                area=Polygon.from_bbox((lng - half, lat - half, lng + half, lat + half)),
+            ))
+        ServiceArea.objects.bulk_create(areas, batch_size=2000)
+        cls.service_area = ServiceArea.objects.create(
+            provider=cls.provider,
+            name='Curitiba',
+            price=10000,
+            area=Polygon(service_area_create_payload_example.get('area')),
+        )
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE providers')
+            cursor.execute('ANALYZE service_areas')
+
+    def setUp(self):
+        provider_url = reverse('provider-detail', args=[self.provider.id])
+        service_area_url = reverse('service_area-detail', args=[self.service_area.id])
+        service_area_payload = {**service_area_update_payload_example, 'provider': str(self.provider.id)}
+        locate_params = {'lat': '-25.439479625088097', 'lng': '-49.258157079808775'}
+
+        self.endpoints = {
+            'provider-list': lambda i: self.client.get(reverse('provider-list'), {'page_size': 20}),
+            'provider-retrieve': lambda i: self.client.get(provider_url),
+            'provider-create': lambda i: self.client.post(reverse('provider-list'), {**provider_create_payload_example, 'name': f'Budget {i}'}, format='json'),
+            'provider-update': lambda i: self.client.put(provider_url, {**provider_create_payload_example, 'name': self.provider.name}, format='json'),
+            'service_area-list': lambda i: self.client.get(reverse('service_area-list'), {'page_size': 20}),
+            'service_area-list-bbox': lambda i: self.client.get(reverse('service_area-list'), {'page_size': 20, 'bbox': '-50,-26,-49,-25'}),
+            'service_area-retrieve': lambda i: self.client.get(service_area_url),
+            'service_area-create': lambda i: self.client.post(reverse('service_area-list'), service_area_payload, format='json'),
+            'service_area-update': lambda i: self.client.put(service_area_url, service_area_payload, format='json'),
+            'locate': lambda i: self.client.get(reverse('locate_service_areas'), locate_params),
+        }
+
+    @contextmanager
+    def assertMaxQueries(self, budget, endpoint):
+        with CaptureQueriesContext(connection) as context:
+            yield context
+        if len(context) > budget:
+            self.fail(f'{endpoint} ran {len(context)} queries, over its budget of {budget}:\n{format_queries(context.captured_queries)}')
+
+    def test_query_budgets(self):
+        """
+        Ensure no endpoint runs more queries than its budget, whatever the page size.
+        """
+        for endpoint, request in self.endpoints.items():
+            with self.subTest(endpoint=endpoint):
+                with self.assertMaxQueries(self.query_budgets[endpoint], endpoint):
+                    response = request(0)
+                self.assertLess(response.status_code, 300, response.data)
+
+    def plan(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            nodes = [cursor.fetchone()[0][0]['Plan']]
+
+        indexes = set()
+        while nodes:
+            node = nodes.pop()
+            if 'Index Name' in node:
+                indexes.add(node['Index Name'])
+            nodes.extend(node.get('Plans', []))
+        return indexes
+
+    def test_key_queries_use_indexes(self):
+        """
+        Ensure the locate, bbox, list and detail queries are planned on their GiST and btree indexes.
+        """
+        gist_index = 'service_areas_area_geom_idx'
+        # The btree indexes on fields, not the trigram one on an expression of the name
+        provider_indexes = {tuple(index.fields): index.name for index in Provider._meta.indexes if index.fields}
+        queries = [
+            ('locate', ServiceArea.objects.containing(-49.258157079808775, -25.439479625088097), gist_index),
+            ('service area bbox', ServiceArea.objects.intersecting_bbox(-50, -26, -49, -25), gist_index),
+            ('service area detail', ServiceArea.objects.filter(pk=self.service_area.pk), 'service_areas_pkey'),
+            ('provider list', Provider.objects.order_by('name')[:20], provider_indexes[('name',)]),
+            (
+                'provider list by currency',
+                Provider.objects.filter(currency='EUR', language='pt').order_by('currency', 'language', 'name')[:20],
+                provider_indexes[('currency', 'language', 'name')],
+            ),
+        ]
+        for name, queryset, index in queries:
+            with self.subTest(query=name):
+                self.assertIn(index, self.plan(queryset), f'{name} does not use {index}:\n{queryset.query}\n{queryset.explain()}')
+
+    def test_latency_within_baseline(self):
+        """
+        Ensure the median latency of each endpoint stays within the tolerance of its recorded baseline.
+        """
+        baseline = {}
+        if os.path.exists(PERF_BASELINE_PATH):
+            with open(PERF_BASELINE_PATH) as f:
+                baseline = json.load(f)
+
+        measured = {}
+        for endpoint, request in self.endpoints.items():
+            with self.subTest(endpoint=endpoint):
+                for i in range(3):
+                    request(-i - 1)
+
+                latencies = []
+                slowest = None
+                for i in range(self.latency_runs):
+                    with CaptureQueriesContext(connection) as context:
+                        start = time.perf_counter()
+                        request(i + 1)
+                        latency = (time.perf_counter() - start) * 1000
+                    if slowest is None or latency > slowest[0]:
+                        slowest = (latency, context.captured_queries)
+                    latencies.append(latency)
+                measured[endpoint] = round(sorted(latencies)[len(latencies) // 2], 2)
+
+                if PERF_RECORD_BASELINE:
+                    continue
+                if endpoint not in baseline:
+                    message = f'No latency baseline for {endpoint} in {PERF_BASELINE_PATH}, record one with `make perf-baseline`'
+                    if PERF_REQUIRE_BASELINE:
+                        self.fail(message)
+                    self.skipTest(message)
+
+                allowed = baseline[endpoint] * (1 + PERF_LATENCY_TOLERANCE)
+                if measured[endpoint] > allowed:
+                    self.fail(
+                        f'{endpoint} median latency {measured[endpoint]:.2f}ms is over {allowed:.2f}ms '
+                        f'(baseline {baseline[endpoint]:.2f}ms), queries of the slowest request ({slowest[0]:.2f}ms):\n'
+                        f'{format_queries(slowest[1])}'
+                    )
+
+        if PERF_RECORD_BASELINE:
+            with open(PERF_BASELINE_PATH, 'w') as f:
+                json.dump({**baseline, **measured}, f, indent=4, sort_keys=True)
+                f.write('\n')
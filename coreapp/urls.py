@@ -1,12 +1,14 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import ProviderViewSet, ServiceAreaViewSet, LocateAreaViewSet
+from .views import ProviderViewSet, ServiceAreaViewSet, LocateAreaViewSet, CoverageHeatmapViewSet, JobViewSet
 
 router = DefaultRouter()
 router.register(r'providers', ProviderViewSet, basename='provider')
 router.register(r'service-areas', ServiceAreaViewSet, basename='service_area')
+router.register(r'jobs', JobViewSet, basename='job')
 
 urlpatterns = [
     path('', include(router.urls)),
     path('service-areas/polygons', LocateAreaViewSet.as_view(), name='locate_service_areas'),
+    path('service-areas/heatmap', CoverageHeatmapViewSet.as_view(), name='service_area_heatmap'),
 ]
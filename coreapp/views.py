@@ -1,13 +1,23 @@
-from rest_framework import viewsets, status
+from rest_framework import mixins, viewsets, status
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from django.contrib.gis.geos import Point, Polygon
-from .models import Provider, ServiceArea
-from .serializers import ProviderSerializer, ServiceAreaSerializer
-from drf_yasg.utils import swagger_auto_schema
-from drf_yasg import openapi
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import IsAdminUser
+from django.conf import settings
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db import OperationalError, router
+from .models import Job, Provider, ServiceArea
+from .serializers import JobSerializer, ProviderSerializer, ServiceAreaSerializer
 from rest_framework.pagination import PageNumberPagination
-from .doc_payloads import service_area_create_payload_example, service_area_update_payload_example, provider_create_payload_example
+from .heatmap import build_heatmap, HeatmapError
+from .geometry import normalize_area
+from .snapshot import get_snapshot
+from .db_routing import replica_reads, SAFE_METHODS
+from .conditional import ConditionalGetMixin
+from .tasks import delete_provider
+from .bulk import upsert_providers, CREATED, UPDATED, UNCHANGED, FAILED
+from .admission import LOCAL_BACKEND, ConcurrencyLimitMixin, LocateRateThrottle, get_backend, is_query_canceled, statement_timeout
 
 class StandardResultsSetPagination(PageNumberPagination):
     page_size = 10
@@ -15,119 +25,125 @@ class StandardResultsSetPagination(PageNumberPagination):
     max_page_size = 20
 
 
-class ProviderViewSet(viewsets.ModelViewSet):
+class ReplicaReadMixin:
+    """
+    Lets the read-only requests of a view be served by a read replica.
+
+    ``replica_actions`` lists the eligible viewset actions, None makes every safe request eligible.
+    """
+    replica_actions = None
+
+    def allows_replica_reads(self, request):
+        if request.method not in SAFE_METHODS:
+            return False
+        if self.replica_actions is None:
+            return True
+        # The viewset sets self.action inside dispatch(), from the same map
+        method = 'get' if request.method == 'HEAD' else request.method.lower()
+        return (getattr(self, 'action_map', None) or {}).get(method) in self.replica_actions
+
+    def dispatch(self, request, *args, **kwargs):
+        # Left on exit even when the handler raises, or the next requests of the thread would use the replica
+        if self.allows_replica_reads(request):
+            with replica_reads():
+                return super().dispatch(request, *args, **kwargs)
+        return super().dispatch(request, *args, **kwargs)
+
+
+class ProviderViewSet(ReplicaReadMixin, ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Provider.objects.all()
     serializer_class = ProviderSerializer
     pagination_class = StandardResultsSetPagination
+    replica_actions = ('list', 'retrieve')
+    collection_models = ('provider',)
+    # Each ordering is served by an index, also after the currency and language filters
+    orderings = {
+        'name': ('name',),
+        '-name': ('-name',),
+        'currency': ('currency', 'language', 'name'),
+        'language': ('language', 'name'),
+    }
 
-    @swagger_auto_schema(
-        operation_summary="List all providers",
-        operation_description="Endpoint to list all providers.",
-        manual_parameters=[
-            openapi.Parameter(
-                'page', openapi.IN_QUERY, description="Page number", type=openapi.TYPE_INTEGER, required=False, default=1
-            ),
-            openapi.Parameter(
-                'page_size', openapi.IN_QUERY, description="Number of items per page", type=openapi.TYPE_INTEGER, required=False, default=10
-            ),
-        ],
-        responses={
-            200: ProviderSerializer,
-            400: 'Bad Request',
-        },
-    )
+    # Overrides like this one give coreapp.api_docs a method of the viewset itself to document
     def list(self, request, *args, **kwargs):
         return super().list(request, *args, **kwargs)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action != 'list':
+            return queryset
+
+        params = self.request.query_params
+        for field in ('currency', 'language'):
+            if params.get(field):
+                queryset = queryset.filter(**{field: params[field]})
+
+        ordering = params.get('ordering')
+        if ordering and ordering not in self.orderings:
+            raise ValidationError({'ordering': f'ordering must be one of {list(self.orderings)}'})
+
+        search = params.get('search', '').strip()
+        if search:
+            queryset = queryset.search(search)
+            if not ordering:
+                return queryset.annotate(similarity=TrigramSimilarity('name', search)).order_by('-similarity', 'name')
+
+        return queryset.order_by(*self.orderings[ordering or 'name'])
     
-    @swagger_auto_schema(
-        operation_summary="Create a new provider",
-        operation_description="Endpoint to create a new provider. The input should include the provider's name, email, phone number, language, and currency.",
-        request_body=openapi.Schema(
-            type=openapi.TYPE_OBJECT,
-            properties={
-                'currency': openapi.Schema(
-                    type=openapi.TYPE_STRING,
-                    description='The currency used by the provider, e.g., USD, EUR.',
-                ),
-                'name': openapi.Schema(
-                    type=openapi.TYPE_STRING,
-                    description='The full name of the provider.',
-                ),
-                'email': openapi.Schema(
-                    type=openapi.TYPE_STRING,
-                    format=openapi.FORMAT_EMAIL,
-                    description='The email address of the provider.',
-                ),
-                'phone_number': openapi.Schema(
-                    type=openapi.TYPE_STRING,
-                    description='The provider\'s phone number.',
-                ),
-                'language': openapi.Schema(
-                    type=openapi.TYPE_STRING,
-                    description='The provider\'s preferred language, e.g., en for English.',
-                ),
-            },
-            required=['currency', 'name', 'email', 'phone_number', 'language'],
-            example=provider_create_payload_example
-        ),
-        responses={
-            201: ProviderSerializer,
-            400: 'Bad Request',
-        },
-    )
     def create(self, request, *args, **kwargs):
         return super().create(request, *args, **kwargs)
 
+    def destroy(self, request, *args, **kwargs):
+        purge = delete_provider(self.get_object())
+        if purge is None:
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        return Response({'job': str(purge.pk)}, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk(self, request, *args, **kwargs):
+        rows = request.data
+        if not isinstance(rows, list):
+            return Response({'error': 'Expected a list of providers'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(rows) > settings.PROVIDER_BULK_MAX_ROWS:
+            return Response({'error': f'At most {settings.PROVIDER_BULK_MAX_ROWS} providers per request'}, status=status.HTTP_400_BAD_REQUEST)
+
+        results = upsert_providers(rows)
+        response_data = {result_status: 0 for result_status in (CREATED, UPDATED, UNCHANGED, FAILED)}
+        for result in results:
+            response_data[result['status']] += 1
+        response_data['results'] = results
 
-class ServiceAreaViewSet(viewsets.ModelViewSet):
+        return Response(response_data)
+
+
+class ServiceAreaViewSet(ReplicaReadMixin, ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = ServiceArea.objects.all()
     serializer_class = ServiceAreaSerializer
     pagination_class = StandardResultsSetPagination
+    replica_actions = ('list', 'retrieve')
+    # Deleting a provider cascades to its service areas without a service area event
+    collection_models = ('servicearea', 'provider')
 
-    @swagger_auto_schema(
-        operation_summary="List all service areas",
-        operation_description="Endpoint to list all service areas.",
-        manual_parameters=[
-            openapi.Parameter(
-                'page', openapi.IN_QUERY, description="Page number", type=openapi.TYPE_INTEGER, required=False, default=1
-            ),
-            openapi.Parameter(
-                'page_size', openapi.IN_QUERY, description="Number of items per page", type=openapi.TYPE_INTEGER, required=False, default=10
-            ),
-        ],
-        responses={
-            200: ProviderSerializer,
-            400: 'Bad Request',
-        },
-    )
     def list(self, request, *args, **kwargs):
         return super().list(request, *args, **kwargs)
 
-    @swagger_auto_schema(
-        request_body=openapi.Schema(
-            type=openapi.TYPE_OBJECT,
-            properties={
-                'provider': openapi.Schema(type=openapi.TYPE_STRING, description='UUID of the provider'),
-                'name': openapi.Schema(type=openapi.TYPE_STRING, description='Name of the service area'),
-                'price': openapi.Schema(type=openapi.TYPE_INTEGER, description='Price in integer (divide by 10 to show to client)'),
-                'area': openapi.Schema(
-                    type=openapi.TYPE_ARRAY,
-                    items=openapi.Items(
-                        type=openapi.TYPE_ARRAY,
-                        items=openapi.Items(type=openapi.TYPE_NUMBER)
-                    ),
-                    description='Coordinates of the polygon defining the service area, the longitude and latitude of each point respectively'
-                ),
-            },
-            example=service_area_create_payload_example
-        )
-    )
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        bbox = self.request.query_params.get('bbox')
+        if self.action == 'list' and bbox:
+            try:
+                min_lng, min_lat, max_lng, max_lat = [float(value) for value in bbox.split(',')]
+            except ValueError:
+                raise ValidationError({'bbox': 'bbox must be four comma separated numbers'})
+            queryset = queryset.intersecting_bbox(min_lng, min_lat, max_lng, max_lat)
+        return queryset
+
     def create(self, request, *args, **kwargs):
         data = request.data
         
         try:
-            # Convert area coordinates to a MultiPolygon
-            poligon = Polygon(data['area'])
+            # Close, repair and clean the area coordinates into a valid polygon
+            poligon = normalize_area(data['area'])
             
             # Get the provider
             provider = Provider.objects.get(id=data['provider'])
@@ -151,32 +167,13 @@ class ServiceAreaViewSet(viewsets.ModelViewSet):
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-    @swagger_auto_schema(
-        request_body=openapi.Schema(
-            type=openapi.TYPE_OBJECT,
-            properties={
-                'provider': openapi.Schema(type=openapi.TYPE_STRING, description='UUID of the provider'),
-                'name': openapi.Schema(type=openapi.TYPE_STRING, description='Name of the service area'),
-                'price': openapi.Schema(type=openapi.TYPE_INTEGER, description='Price in integer (divide by 10 to show to client)'),
-                'area': openapi.Schema(
-                    type=openapi.TYPE_ARRAY,
-                    items=openapi.Items(
-                        type=openapi.TYPE_ARRAY,
-                        items=openapi.Items(type=openapi.TYPE_NUMBER)
-                    ),
-                    description='Coordinates of the polygon defining the service area, the longitude and latitude of each point respectively'
-                ),
-            },
-            example=service_area_update_payload_example
-        )
-    )
     def update(self, request, *args, **kwargs):
         data = request.data
         instance = self.get_object()
         
         try:
-            # Convert area coordinates to a MultiPolygon
-            poligon = Polygon(data['area'])
+            # Close, repair and clean the area coordinates into a valid polygon
+            poligon = normalize_area(data['area'])
             
             # Get the provider
             provider = Provider.objects.get(id=data['provider'])
@@ -200,41 +197,51 @@ class ServiceAreaViewSet(viewsets.ModelViewSet):
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-class LocateAreaViewSet(APIView):
-    
-    @swagger_auto_schema(
-        manual_parameters=[
-            openapi.Parameter(
-                'lat', openapi.IN_QUERY, description="Latitude of the point", type=openapi.TYPE_NUMBER, required=True, default="-25.439479625088097"
-            ),
-            openapi.Parameter(
-                'lng', openapi.IN_QUERY, description="Longitude of the point", type=openapi.TYPE_NUMBER, required=True, default="-49.258157079808775"
-            ),
-        ],
-        responses={
-            200: openapi.Schema(
-                type=openapi.TYPE_ARRAY,
-                items=openapi.Schema(
-                    type=openapi.TYPE_OBJECT,
-                    properties={
-                        'name': openapi.Schema(type=openapi.TYPE_STRING, description='Name of the service area'),
-                        'provider_name': openapi.Schema(type=openapi.TYPE_STRING, description='Name of the provider'),
-                        'price': openapi.Schema(type=openapi.TYPE_INTEGER, description='Price of the service area')
-                    }
-                ),
-                description='List of service areas that contain the given point'
-            ),
-            400: 'Bad Request: Invalid lat/lng format or missing parameters'
-        },
-        operation_summary="List Service Areas by Lat/Lng",
-        operation_description="Returns a list of service areas that contain the provided latitude and longitude point. The response includes the name of the service area, the provider name, and the price."
-    )
+class LocateAreaViewSet(ConcurrencyLimitMixin, ReplicaReadMixin, APIView):
+    throttle_classes = [LocateRateThrottle]
+    concurrency_scope = 'locate'
+
+    def initial(self, request, *args, **kwargs):
+        # Looked up before the admission checks, which it decides where to keep
+        self.snapshot = get_snapshot()
+        super().initial(request, *args, **kwargs)
+
+    def get_admission_backend(self):
+        # Snapshot hits never query the database, neither does their rate limiting
+        if self.snapshot is not None:
+            return get_backend(LOCAL_BACKEND)
+        return super().get_admission_backend()
+
+    def get_concurrency_limit(self):
+        # The slots guard the database, which snapshot hits do not touch
+        if self.snapshot is not None:
+            return 0
+        return settings.LOCATE_MAX_CONCURRENCY
+
     def get(self, request, *args, **kwargs):
-        lat = float(request.query_params.get('lat'))
-        lng = float(request.query_params.get('lng'))
-        point = Point(lng, lat)
-        
-        service_areas = ServiceArea.objects.filter(area__contains=point)
+        try:
+            lat = float(request.query_params['lat'])
+            lng = float(request.query_params['lng'])
+        except KeyError as e:
+            return Response({'error': f'Missing required parameter: {str(e)}'}, status=status.HTTP_400_BAD_REQUEST)
+        except ValueError:
+            return Response({'error': 'lat and lng must be numbers'}, status=status.HTTP_400_BAD_REQUEST)
+
+        if self.snapshot is not None:
+            return Response(self.snapshot.locate(lng, lat))
+
+        alias = router.db_for_read(ServiceArea)
+        try:
+            with statement_timeout(alias, settings.LOCATE_STATEMENT_TIMEOUT):
+                service_areas = list(ServiceArea.objects.using(alias).containing(lng, lat).select_related('provider'))
+        except OperationalError as exc:
+            if not is_query_canceled(exc):
+                raise
+            return Response(
+                {'error': 'Locating the point took too long, try again later.'},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={'Retry-After': '1'},
+            )
 
         response_data = [{
             'name': area.name,
@@ -242,4 +249,46 @@ class LocateAreaViewSet(APIView):
             'price': area.price
         } for area in service_areas]
 
-        return Response(response_data)    
\ No newline at end of file
+        return Response(response_data)
+
+
+class CoverageHeatmapViewSet(ReplicaReadMixin, APIView):
+
+    def get(self, request, *args, **kwargs):
+        try:
+            min_lng, min_lat, max_lng, max_lat = [float(value) for value in request.query_params['bbox'].split(',')]
+            cell_size = float(request.query_params['cell_size'])
+            shape = request.query_params.get('shape', 'square')
+
+            return Response(build_heatmap(min_lng, min_lat, max_lng, max_lat, cell_size, shape))
+        except KeyError as e:
+            return Response({'error': f'Missing required parameter: {str(e)}'}, status=status.HTTP_400_BAD_REQUEST)
+        except HeatmapError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except ValueError:
+            return Response({'error': 'bbox must be four comma separated numbers and cell_size a number'}, status=status.HTTP_400_BAD_REQUEST)
+
+
+class JobViewSet(mixins.CreateModelMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = Job.objects.order_by('-created_at')
+    serializer_class = JobSerializer
+    pagination_class = StandardResultsSetPagination
+    # Jobs run heavy geometry work and touch files on the worker hosts, staff only
+    permission_classes = [IsAdminUser]
+
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        for field in ('status', 'kind'):
+            value = self.request.query_params.get(field)
+            if value:
+                queryset = queryset.filter(**{field: value})
+        return queryset
@@ -34,6 +34,21 @@ resource "aws_lightsail_container_service_deployment_version" "django_deployment
   container {
     image          = var.repository_url
     container_name = "django-app"
+    environment    = {
+      DB_NAME     = "mozio_db"
+      DB_USER     =  "postgres"
+      DB_PASSWORD =  "postgres"
+      DB_HOST     =  aws_db_instance.postgres.endpoint
+      DB_PORT     = "5432"
+      NUM_PROXIES = "1"
+    }
+  }
+
+  # Background jobs, in their own container so they are restarted and stopped on their own
+  container {
+    image          = var.repository_url
+    container_name = "job-worker"
+    command        = ["python", "manage.py", "run_job_worker"]
     environment    = {
       DB_NAME     = "mozio_db"
       DB_USER     =  "postgres"
@@ -0,0 +1,16 @@
+#!/bin/bash
+# Clones the primary with pg_basebackup on first boot, then runs as a hot standby
+set -e
+
+if [ ! -s "$PGDATA/PG_VERSION" ]; then
+    until pg_isready -h "$PRIMARY_HOST" -U "$POSTGRES_USER"; do
+        sleep 1
+    done
+
+    mkdir -p "$PGDATA"
+    PGPASSWORD="$REPLICATION_PASSWORD" pg_basebackup -h "$PRIMARY_HOST" -U "$REPLICATION_USER" -D "$PGDATA" -R -X stream
+    chown -R postgres:postgres "$PGDATA"
+    chmod 700 "$PGDATA"
+fi
+
+exec docker-entrypoint.sh postgres -c hot_standby=on
@@ -0,0 +1,68 @@
+"""
+Routes of the API documentation, by ``API_DOCS`` mode.
+
+live
+    drf_yasg generates the schema from the views on each request. drf_yasg and the view schemas
+    are imported on the first documentation request, not when a worker boots.
+static
+    The schema and the Swagger UI and ReDoc pages built by ``manage.py generate_api_docs`` at
+    image build time are served from ``API_DOCS_DIR``, without importing drf_yasg at all.
+off
+    No documentation routes.
+"""
+import os
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.http import FileResponse, Http404
+from django.urls import path
+
+SCHEMA_FORMATS = {
+    '.json': 'application/json',
+    '.yaml': 'application/yaml',
+}
+
+
+def live_view(name):
+    def view(request, *args, **kwargs):
+        from .schema import views
+
+        return views[name](request, *args, **kwargs)
+    return view
+
+
+def serve_document(filename, content_type):
+    try:
+        document = open(os.path.join(settings.API_DOCS_DIR, filename), 'rb')
+    except FileNotFoundError:
+        raise Http404('The API documentation was not built, run `manage.py generate_api_docs`.')
+    return FileResponse(document, content_type=content_type)
+
+
+def static_schema(request, format):
+    if format not in SCHEMA_FORMATS:
+        raise Http404(f'Unknown schema format {format!r}')
+    return serve_document(f'swagger{format}', SCHEMA_FORMATS[format])
+
+
+def static_page(filename):
+    def view(request):
+        return serve_document(filename, 'text/html; charset=utf-8')
+    return view
+
+
+def docs_urlpatterns(mode):
+    if mode == 'off':
+        return []
+    if mode == 'live':
+        schema, swagger_ui, redoc = live_view('schema-json'), live_view('schema-swagger-ui'), live_view('schema-redoc')
+    elif mode == 'static':
+        schema, swagger_ui, redoc = static_schema, static_page('swagger.html'), static_page('redoc.html')
+    else:
+        raise ImproperlyConfigured(f"API_DOCS must be live, static or off, not {mode!r}")
+
+    return [
+        path('swagger<format>/', schema, name='schema-json'),
+        path('swagger/', swagger_ui, name='schema-swagger-ui'),
+        path('redoc/', redoc, name='schema-redoc'),
+    ]
@@ -0,0 +1,34 @@
+"""
+Live API documentation, generated from the views by drf_yasg on each request.
+
+Only imported by the documentation routes in live mode and by ``manage.py generate_api_docs``,
+see ``mozio_project_django.docs``.
+"""
+from drf_yasg import openapi
+from drf_yasg.views import get_schema_view
+from rest_framework import permissions
+
+from coreapp.api_docs import document_views
+
+api_info = openapi.Info(
+   title="Mozio API",
+   default_version='v1',
+   description="API for managing Providers and Service Areas",
+   terms_of_service="https://www.google.com/policies/terms/",
+   contact=openapi.Contact(email="email@email.com"),
+   license=openapi.License(name="BSD License"),
+)
+
+document_views()
+
+schema_view = get_schema_view(
+   api_info,
+   public=True,
+   permission_classes=(permissions.AllowAny,),
+)
+
+views = {
+    'schema-json': schema_view.without_ui(cache_timeout=0),
+    'schema-swagger-ui': schema_view.with_ui('swagger', cache_timeout=0),
+    'schema-redoc': schema_view.with_ui('redoc', cache_timeout=0),
+}
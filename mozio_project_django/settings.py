@@ -43,8 +43,8 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'rest_framework',
     'django.contrib.gis',
+    'django.contrib.postgres',
     'coreapp',
-    'drf_yasg'
 ]
 
 MIDDLEWARE = [
@@ -56,6 +56,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'coreapp.db_routing.ReadYourWritesMiddleware',
 ]
 
 ROOT_URLCONF = 'mozio_project_django.urls'
@@ -99,6 +100,27 @@ if 'DATABASE_URL' in os.environ:
         conn_health_checks=True,
     )
 
+# Read replicas, as a comma separated list of host:port sharing the primary's credentials.
+# Only the read-only API actions use them, see coreapp.db_routing.
+
+DATABASE_REPLICAS = []
+for index, replica in enumerate(filter(None, os.getenv('DB_REPLICA_HOSTS', '').split(',')), start=1):
+    host, _, port = replica.strip().partition(':')
+    alias = f'replica_{index}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'PORT': port or DATABASES['default']['PORT'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['coreapp.db_routing.PrimaryReplicaRouter']
+
+REPLICA_MAX_LAG = float(os.getenv('REPLICA_MAX_LAG', 2))
+REPLICA_LAG_CHECK_INTERVAL = float(os.getenv('REPLICA_LAG_CHECK_INTERVAL', 1))
+READ_YOUR_WRITES_WINDOW = float(os.getenv('READ_YOUR_WRITES_WINDOW', 5))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -144,16 +166,99 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Swagger UI
 
 SWAGGER_SETTINGS = {
-   'DEFAULT_INFO': 'mozio_project_django.urls',
+   'DEFAULT_INFO': 'mozio_project_django.schema.api_info',
 }
 
+# API documentation, see mozio_project_django.docs: live generates it with drf_yasg, static serves
+# the files built into API_DOCS_DIR by `manage.py generate_api_docs`, off disables it. drf_yasg is
+# only installed in live mode, so workers in the other modes never import it.
+
+API_DOCS = os.getenv('API_DOCS', 'live' if DEBUG else 'static')
+API_DOCS_DIR = os.getenv('API_DOCS_DIR', os.path.join(BASE_DIR, 'apidocs'))
+
+if API_DOCS == 'live':
+    INSTALLED_APPS.append('drf_yasg')
+
 # REST Framework
 
 REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.LimitOffsetPagination',
-    'PAGE_SIZE': 100
+    'PAGE_SIZE': 100,
+    # Proxies in front of the app, the throttles take the client address they appended to
+    # X-Forwarded-For. With 0 the header is ignored and REMOTE_ADDR is used.
+    'NUM_PROXIES': int(os.getenv('NUM_PROXIES', 0))
 }
 
+# Cache-Control max-age of the provider and service area GET responses. Caches always revalidate
+# once it expires, which the API answers with a cheap 304 while nothing changed.
+API_CACHE_MAX_AGE = int(os.getenv('API_CACHE_MAX_AGE', 0))
+
+# Rows accepted by the provider bulk upsert in one request
+PROVIDER_BULK_MAX_ROWS = int(os.getenv('PROVIDER_BULK_MAX_ROWS', 100000))
+
+# Gunicorn workers per host, read by gunicorn itself as well
+WEB_CONCURRENCY = int(os.getenv('WEB_CONCURRENCY', 4))
+
+# Admission control of the locate endpoint, see coreapp.admission. A rate of 0 and a
+# concurrency of 0 disable the limits, a statement timeout of 0 lets queries run unbounded.
+# The concurrency defaults below the worker count, so locate cannot take every worker.
+
+ADMISSION_BACKEND = os.getenv('ADMISSION_BACKEND', 'coreapp.admission.DatabaseAdmissionBackend')
+LOCATE_RATE_LIMIT = float(os.getenv('LOCATE_RATE_LIMIT', 50))
+LOCATE_RATE_LIMIT_BURST = int(os.getenv('LOCATE_RATE_LIMIT_BURST', 100))
+LOCATE_MAX_CONCURRENCY = int(os.getenv('LOCATE_MAX_CONCURRENCY', max(WEB_CONCURRENCY - 1, 1)))
+LOCATE_STATEMENT_TIMEOUT = int(os.getenv('LOCATE_STATEMENT_TIMEOUT', 2000))
+
+# Background jobs, run by `manage.py run_job_worker`, see coreapp.jobs
+
+JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', 1))
+JOB_HEARTBEAT_INTERVAL = float(os.getenv('JOB_HEARTBEAT_INTERVAL', 10))
+JOB_STALE_TIMEOUT = float(os.getenv('JOB_STALE_TIMEOUT', 60))
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', 3))
+JOB_RETRY_BACKOFF = float(os.getenv('JOB_RETRY_BACKOFF', 10))
+JOB_RETRY_BACKOFF_MAX = float(os.getenv('JOB_RETRY_BACKOFF_MAX', 600))
+# Directory of the files jobs read and write, jobs on files are refused when unset
+JOB_FILES_DIR = os.getenv('JOB_FILES_DIR')
+
+# Providers with more service areas than a batch are hidden on delete and purged in batches by a job,
+# sleeping PROVIDER_PURGE_BATCH_DELAY seconds between batches
+
+PROVIDER_PURGE_BATCH_SIZE = int(os.getenv('PROVIDER_PURGE_BATCH_SIZE', 500))
+PROVIDER_PURGE_BATCH_DELAY = float(os.getenv('PROVIDER_PURGE_BATCH_DELAY', 0.2))
+
+# Coverage heatmap
+
+HEATMAP_CACHE_TIMEOUT = int(os.getenv('HEATMAP_CACHE_TIMEOUT', 300))
+HEATMAP_MAX_CELLS = int(os.getenv('HEATMAP_MAX_CELLS', 10000))
+
+# Service area partitioning, see coreapp.regions and `manage.py partition_service_areas`
+
+SERVICE_AREA_REGION_SIZE = 10
+SERVICE_AREA_MAX_CANDIDATE_REGIONS = 64
+SERVICE_AREA_PARTITIONS = int(os.getenv('SERVICE_AREA_PARTITIONS', 16))
+
+# Service area geometry normalization, see coreapp.geometry. Areas are simplified within this
+# tolerance in degrees on create and update, 0 keeps every vertex
+
+SERVICE_AREA_SIMPLIFY_TOLERANCE = float(os.getenv('SERVICE_AREA_SIMPLIFY_TOLERANCE', 0))
+
+# Service area snapshot, the locate endpoint reads from the database when unset
+
+SERVICE_AREA_SNAPSHOT_PATH = os.getenv('SERVICE_AREA_SNAPSHOT_PATH')
+SERVICE_AREA_SNAPSHOT_CHECK_INTERVAL = float(os.getenv('SERVICE_AREA_SNAPSHOT_CHECK_INTERVAL', 5))
+# Seconds a rebuild waits after a change, so a burst of writes is compiled once
+SERVICE_AREA_SNAPSHOT_REBUILD_DELAY = float(os.getenv('SERVICE_AREA_SNAPSHOT_REBUILD_DELAY', 30))
+
+# Cross-worker cache invalidation: notify (LISTEN/NOTIFY), poll (change_events table) or off
+
+CACHE_INVALIDATION_MODE = os.getenv('CACHE_INVALIDATION_MODE', 'notify')
+CACHE_INVALIDATION_CHANNEL = 'coreapp_changes'
+CACHE_INVALIDATION_POLL_INTERVAL = float(os.getenv('CACHE_INVALIDATION_POLL_INTERVAL', 2))
+CACHE_INVALIDATION_LAG_WARNING = float(os.getenv('CACHE_INVALIDATION_LAG_WARNING', 5))
+CACHE_INVALIDATION_OVERLAP = 100
+CACHE_INVALIDATION_BATCH_SIZE = 1000
+CHANGE_EVENTS_RETENTION = int(os.getenv('CHANGE_EVENTS_RETENTION', 24 * 60 * 60))
+
 # Static Config
 
 STATIC_URL = '/static/'
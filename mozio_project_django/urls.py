@@ -14,29 +14,13 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
-from drf_yasg.views import get_schema_view
-from drf_yasg import openapi
-from rest_framework import permissions
 
-schema_view = get_schema_view(
-   openapi.Info(
-      title="Mozio API",
-      default_version='v1',
-      description="API for managing Providers and Service Areas",
-      terms_of_service="https://www.google.com/policies/terms/",
-      contact=openapi.Contact(email="email@email.com"),
-      license=openapi.License(name="BSD License"),
-   ),
-   public=True,
-   permission_classes=(permissions.AllowAny,),
-)
+from .docs import docs_urlpatterns
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/v1/', include('coreapp.urls')),
-    path('swagger<format>/', schema_view.without_ui(cache_timeout=0), name='schema-json'),
-    path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
-    path('redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
-]
+] + docs_urlpatterns(settings.API_DOCS)
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mozio_project_django.settings')
 
 application = get_wsgi_application()
+
+# Each gunicorn worker imports this module, so each one gets its own listener
+from coreapp.invalidation import start_listener
+
+start_listener()